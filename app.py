@@ -1,13 +1,10 @@
+import json
 import traceback
 import logging.config
 
 import pandas as pd
-import pickle
 from flask import Flask
-from flask import render_template, request, redirect, url_for
-
-from src.ncaa_db import query_to_dict
-from src.model import make_predict
+from flask import render_template, request, redirect, url_for, jsonify, Response
 
 # Initialize the Flask application
 app = Flask(__name__, template_folder="app/templates", static_folder="app/static")
@@ -21,10 +18,54 @@ logging.config.fileConfig(app.config["LOGGING_CONFIG"])
 logger = logging.getLogger(app.config["APP_NAME"])
 logger.debug('Web app log')
 
-# Initialize the database session
-from src.ncaa_db import Regular, Tourney, Teams, NCAAManager
+# Initialize the database engine, each request gets its own session, removed at the end of the request
+from src.ncaa_db import NCAAManager
 ncaa_manager = NCAAManager(app)
 
+# Time every request and the phases of the predictions, exposed at /metrics
+from src.metrics import RequestMetrics, phase
+request_metrics = RequestMetrics(app)
+request_metrics.add_gauges(lambda: {'db_pool_' + name: value for name, value in ncaa_manager.pool_metrics().items()})
+
+# Load the model and the team features once, so that a prediction needs no file or database access. The model is
+# the active version of the registry, swapped when its pointer changes, and a shadow version can score the same traffic
+from src.predict_engine import PredictionEngine, to_season
+from src.bracket import season_bracket, BracketSimulator
+from src.registry import ModelRegistry
+from src.shadow import ShadowScorer
+prediction_engine = PredictionEngine(app.config["MODEL_PATH"], ncaa_manager.session, app.config["TEAM_SPELLINGS_PATH"],
+                                     ModelRegistry(app.config["MODEL_REGISTRY_PATH"]), ShadowScorer())
+try:
+    prediction_engine.reload()
+except Exception:
+    logger.warning("Prediction engine not loaded at startup, will retry on the first prediction")
+finally:
+    # the startup session is outside any request, return its connection to the pool
+    ncaa_manager.remove_session()
+# load time of the model and resident memory of the worker, with preload_app the workers share the model's pages
+from src.profiling import rss_mb
+request_metrics.add_gauges(lambda: {'model_load_seconds': prediction_engine.load_seconds or 0.0,
+                                    'process_rss_mb': round(rss_mb() or 0.0, 1)})
+# agreement of the shadow model with the served one, and the batches it could not keep up with
+request_metrics.add_gauges(lambda: {'shadow_' + name: value for name, value in prediction_engine.shadow.summary().items()
+                                    if name in ('rows', 'agreement', 'dropped', 'errors') and value is not None})
+
+
+# Tourney slots and seeds of every season, read once for the bracket endpoint
+try:
+    bracket_slots = pd.read_csv(app.config["BRACKET_SLOTS_PATH"])
+    bracket_seeds = pd.read_csv(app.config["BRACKET_SEEDS_PATH"])
+except FileNotFoundError:
+    logger.warning("Tourney bracket files not found, the bracket endpoint is not available")
+    bracket_slots = bracket_seeds = None
+
+
+def render_page(template, **context):
+    # render an outcome page of the form, counted by outcome (the template name) and timed as the render phase
+    request_metrics.count(template[:-len('.html')])
+    with phase('render'):
+        return render_template(template, **context)
+
 
 @app.route('/')
 def home():
@@ -41,67 +82,109 @@ def index():
         try:
             # both teams' name are given
             if team1 != '' and team2 != '':
-                id1_result = ncaa_manager.session.query(Teams.TeamID).filter(Teams.TeamName == team1).all()
-                id2_result = ncaa_manager.session.query(Teams.TeamID).filter(Teams.TeamName == team2).all()
-                # both team name are valid
-                if len(id1_result) != 0 and len(id2_result) != 0:
-                    id1 = id1_result[0][0]
-                    id2 = id2_result[0][0]
-                    regular1_result = ncaa_manager.session.query(Regular).filter(Regular.Team == id1, Regular.Season == season).all()
-                    regular2_result = ncaa_manager.session.query(Regular).filter(Regular.Team == id2, Regular.Season == season).all()
-                    # both teams played in a given season
-                    if len(regular1_result) != 0 and len(regular2_result) != 0:
-                        regular1_df = pd.DataFrame(query_to_dict(regular1_result))
-                        regular2_df = pd.DataFrame(query_to_dict(regular2_result))
-                        seed1_result = ncaa_manager.session.query(Tourney.Seed).filter(Tourney.TeamID == id1, Tourney.Season == season).all()
-                        seed2_result = ncaa_manager.session.query(Tourney.Seed).filter(Tourney.TeamID == id2, Tourney.Season == season).all()
-                        # both teams played in the tourney
-                        if len(seed1_result) != 0 and len(seed2_result) != 0:
-                            seed1 = seed1_result[0][0]
-                            seed2 = seed2_result[0][0]
-                            delta = pd.concat([regular1_df, regular2_df])
-                            delta['Seed'] = [seed1, seed2]
-                            delta = delta.drop(['index', 'Season', 'Team', 'GP'], axis=1)
-                            delta = delta.diff(periods=-1, axis=0).head(1)
-                            with open('data/clf.sav', 'rb') as f:
-                                clf = pickle.load(f)
-                            predicted = make_predict(clf, delta)[0]
-                            if predicted == 0:
-                                winner = team2
-                            else:
-                                winner = team1
-                            return render_template('prediction.html', predicted_winner=winner)
-                        # have team not entered the tourney
-                        else:
-                            no_tourney = []
-                            if len(seed1_result) == 0:
-                                no_tourney.append(team1)
-                            if len(seed2_result) == 0:
-                                no_tourney.append(team2)
-                            return render_template('no_tourney.html', no_tourney=no_tourney)
-                    # have team not played during a given season
-                    else:
-                        no_season = []
-                        if len(regular1_result) == 0:
-                            no_season.append(team1)
-                        if len(regular2_result) == 0:
-                            no_season.append(team2)
-                        return render_template('no_season.html', no_season=no_season)
+                outcome, result = prediction_engine.predict_matchup(team1, team2, season)
+                if outcome == 'prediction':
+                    return render_page('prediction.html', predicted_winner=result)
+                # have team not entered the tourney
+                elif outcome == 'no_tourney':
+                    return render_page('no_tourney.html', no_tourney=result)
+                # have team not played during a given season
+                elif outcome == 'no_season':
+                    return render_page('no_season.html', no_season=result)
                 # have invalid team names
                 else:
-                    no_team = []
-                    if len(id1_result) == 0:
-                        no_team.append(team1)
-                    if len(id2_result) == 0:
-                        no_team.append(team2)
-                    return render_template('no_team.html', no_team=no_team)
+                    return render_page('no_team.html', no_team=result, suggestions=prediction_engine.suggest(result))
             # missing team name inputs
             else:
-                return render_template('no_input.html')
+                return render_page('no_input.html')
         except:
             traceback.print_exc()
             logger.warning("Not able to show webpage, error page returned")
-            return render_template('error.html')
+            return render_page('error.html')
+
+
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    # predict a batch of matchups, e.g. {"matchups": [{"team1": "Duke", "team2": "Purdue", "season": 2019}]}
+    payload = request.get_json(silent=True)
+    matchups = payload.get('matchups') if isinstance(payload, dict) else None
+    if not isinstance(matchups, list):
+        return jsonify(error='Expected a JSON object with a list of matchups'), 400
+    if len(matchups) > app.config["API_MAX_MATCHUPS"]:
+        return jsonify(error='At most %d matchups per request' % app.config["API_MAX_MATCHUPS"]), 413
+    items = [(m.get('team1'), m.get('team2'), m.get('season')) if isinstance(m, dict) else (None, None, None)
+             for m in matchups]
+    # matchups without two non-empty team names are the form's no_input case, the others are predicted in one batch
+    complete = [i for i, (team1, team2, _) in enumerate(items)
+                if isinstance(team1, str) and isinstance(team2, str) and team1 and team2]
+    try:
+        predictions = prediction_engine.predict_matchups([items[i] for i in complete])
+    except Exception:
+        logger.exception("Not able to predict the matchups, error returned")
+        request_metrics.count('error')
+        return jsonify(error='Predictions are not available'), 503
+    results = [{'team1': team1, 'team2': team2, 'season': season, 'error': 'no_input'}
+               for team1, team2, season in items]
+    for i, (outcome, result, probability) in zip(complete, predictions):
+        if outcome == 'prediction':
+            results[i].update(error=None, winner=result, probability=probability)
+        elif outcome == 'no_team':
+            results[i].update(error=outcome, teams=result, suggestions=prediction_engine.suggest(result))
+        else:
+            results[i].update(error=outcome, teams=result)
+    for result in results:
+        request_metrics.count(result['error'] or 'prediction')
+    return jsonify(predictions=results)
+
+
+@app.route('/api/teams')
+def api_teams():
+    # autocomplete of the team names of the form, e.g. /api/teams?q=nort
+    limit = max(1, min(request.args.get('limit', app.config["AUTOCOMPLETE_LIMIT"], type=int),
+                       app.config["AUTOCOMPLETE_LIMIT"]))
+    return jsonify(teams=prediction_engine.complete(request.args.get('q', ''), limit))
+
+
+@app.route('/bracket')
+def bracket():
+    # simulate a season's whole tourney, e.g. /bracket?season=2019&simulations=10000
+    season = to_season(request.args.get('season'))
+    simulations = request.args.get('simulations', app.config["BRACKET_SIMULATIONS"], type=int)
+    if not 1 <= simulations <= app.config["BRACKET_MAX_SIMULATIONS"]:
+        return jsonify(error='simulations must be between 1 and %d' % app.config["BRACKET_MAX_SIMULATIONS"]), 400
+    if bracket_slots is None:
+        return jsonify(error='The tourney bracket files are not available'), 503
+    try:
+        slots, seeds = season_bracket(bracket_slots, bracket_seeds, season)
+    except ValueError:
+        return jsonify(error='There is no tourney bracket for season %s' % request.args.get('season')), 404
+    features = prediction_engine.season_features(season, list(seeds['TeamID']))
+    if features is None:
+        return jsonify(error='Some seeded teams have no regular season stats in %s' % season), 404
+    state = prediction_engine.reload_if_changed()
+    advancement = BracketSimulator(state.clf, slots, seeds, features).simulate(simulations)
+    advancement.insert(2, 'TeamName', advancement['TeamID'].map(state.names.name))
+    return jsonify(season=season, simulations=simulations, teams=json.loads(advancement.to_json(orient='records')))
+
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape of the request latencies, phase times, outcomes and connection pool of this process
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics/pool')
+def pool_metrics():
+    # connection pool state and checkout counters of this process
+    return jsonify(ncaa_manager.pool_metrics())
+
+
+@app.route('/metrics/model')
+def model_metrics():
+    # model served by this process, and how the shadow model compares with it on the same traffic
+    state = prediction_engine.reload_if_changed()
+    return jsonify(version=state.model_version, model_hash=state.model_hash, precomputed=state.precomputed,
+                   load_seconds=prediction_engine.load_seconds, shadow=prediction_engine.shadow.summary())
 
 
 if __name__ == '__main__':
@@ -1,3 +1,8 @@
 #!/usr/bin/env bash
 
-python3 app.py
\ No newline at end of file
+# ./app/boot.sh dev runs the Flask development server, otherwise the app is served by gunicorn
+if [ "$1" == "dev" ]; then
+    python3 app.py
+else
+    gunicorn -c config/gunicorn.conf.py app:app
+fi
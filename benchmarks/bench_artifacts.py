@@ -0,0 +1,66 @@
+"""Compare the end-to-end run time and disk footprint of the model steps with CSV and with columnar artifacts
+
+Runs `python3 run.py model <step>` from featurize to evaluate, as run-model.sh does, once with the previous
+csv/pkl/npy artifacts and once with Feather artifacts.
+Usage: python -m benchmarks.bench_artifacts [--model_data data/model_data.feather]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+
+from src.artifacts import load_artifact, save_artifact
+
+# (step, inputs, outputs) with the artifact names of run-model.sh, without extensions
+STEPS = [('featurize', ['model_data'], ['features']),
+         ('target', ['model_data'], ['target']),
+         ('split', ['features', 'target'], ['X_train', 'X_test', 'y_train', 'y_test']),
+         ('train', ['X_train', 'y_train'], ['clf']),
+         ('predict', ['clf', 'X_test'], ['y_pred']),
+         ('evaluate', ['y_test', 'y_pred'], ['model_result'])]
+
+# Extension of each artifact in both formats, the model and the final result keep their formats
+FORMATS = {
+    'csv': {'target': '.pkl', 'y_train': '.pkl', 'y_test': '.pkl', 'y_pred': '.npy', 'clf': '.sav',
+            'model_result': '.csv', None: '.csv'},
+    'feather': {'clf': '.sav', 'model_result': '.csv', None: '.feather'},
+}
+
+
+def run_pipeline(model_data, directory, extensions):
+    """Run the model steps with one artifact format
+        Args:
+            model_data(pd.Dataframe): output of the load step
+            directory(str): directory for the artifacts
+            extensions(dict): artifact name to extension, None for the default extension
+        Returns:
+            seconds(float): wall time of all steps
+            size(int): total size of the artifacts in bytes
+    """
+    def path(name):
+        return os.path.join(directory, name + extensions.get(name, extensions[None]))
+
+    save_artifact(model_data, path('model_data'))
+    start = time.time()
+    for step, inputs, outputs in STEPS:
+        subprocess.run([sys.executable, 'run.py', 'model', step, '--input'] + [path(i) for i in inputs] +
+                       ['--output'] + [path(o) for o in outputs], check=True, stderr=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL)
+    seconds = time.time() - start
+    size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+    return seconds, size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the artifact formats of the model pipeline")
+    parser.add_argument('--model_data', default='data/model_data.feather', help="Output of the load step")
+    args = parser.parse_args()
+
+    model_data = load_artifact(args.model_data)
+    print('%-8s %10s %12s' % ('format', 'seconds', 'disk KB'))
+    for name, extensions in FORMATS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            seconds, size = run_pipeline(model_data, tmp, extensions)
+        print('%-8s %10.2f %12.1f' % (name, seconds, size / 1024))
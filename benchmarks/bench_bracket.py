@@ -0,0 +1,36 @@
+"""Measure the simulations per second of the tourney bracket simulator
+
+Usage: python -m benchmarks.bench_bracket [--season 2019] [--simulations 10000 100000 1000000]
+"""
+import time
+import argparse
+
+import yaml
+import pandas as pd
+
+import src.artifacts as artifacts
+import src.bracket as bracket
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the tourney bracket simulator")
+    parser.add_argument('--season', default=2019, type=int, help="Season of the tourney")
+    parser.add_argument('--simulations', default=[10000, 100000, 1000000], nargs='+', type=int,
+                        help="Numbers of simulated tourneys to time")
+    parser.add_argument('--batch_size', default=bracket.BATCH_SIZE, type=int, help="Tourneys simulated at once")
+    args = parser.parse_args()
+
+    with open('config/config.yaml', 'r') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)['bracket']
+    slots, seeds = bracket.read_bracket(config['slots_path'], config['seeds_path'], args.season)
+    features = bracket.season_features(pd.read_csv(config['regular_avg_path'], index_col=0), seeds, args.season)
+    clf = artifacts.load_artifact(config['model_path'])
+
+    start = time.time()
+    simulator = bracket.BracketSimulator(clf, slots, seeds, features)
+    print('win probability matrix of %d teams: %.3fs' % (len(seeds), time.time() - start))
+    print('%12s %10s %16s' % ('simulations', 'seconds', 'simulations/sec'))
+    for simulations in args.simulations:
+        start = time.time()
+        simulator.simulate(simulations, random_state=0, batch_size=args.batch_size)
+        seconds = time.time() - start
+        print('%12d %10.2f %16.0f' % (simulations, seconds, simulations / seconds))
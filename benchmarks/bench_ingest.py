@@ -0,0 +1,69 @@
+"""Compare the ingestion methods of src.ncaa_db on a synthetic regular season average table
+
+Usage: python -m benchmarks.bench_ingest --rows 100000 [--engine_string sqlite:///data/bench.db]
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import src.ncaa_db as db
+
+logger = logging.getLogger('bench-ingest')
+
+
+def synthetic_regular_avg(rows, random_state=0):
+    """Generate a regular season average dataframe with the schema of the regular_season table
+        Args:
+            rows(int): number of (Season, Team) rows
+            random_state(int): random seed
+        Returns:
+            regular_avg(pd.Dataframe): synthetic regular season average dataframe
+    """
+    rng = np.random.RandomState(random_state)
+    stats = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF',
+             'FGP', 'FG3P', 'FTP']
+    regular_avg = pd.DataFrame(rng.uniform(0, 80, size=(rows, len(stats))), columns=stats)
+    regular_avg.insert(0, 'Team', 1101 + np.arange(rows) % 400)
+    regular_avg.insert(0, 'Season', 1985 + np.arange(rows) // 400)
+    regular_avg['GP'] = rng.randint(20, 35, size=rows)
+    return regular_avg
+
+
+def run(engine_string, rows, chunksize):
+    """Time every ingestion method on the same data
+        Args:
+            engine_string(str): SQLAlchemy connection URI of the benchmark database
+            rows(int): number of rows to ingest
+            chunksize(int): number of rows sent per statement
+        Returns:
+            results(pd.Dataframe): seconds and rows/sec per method
+    """
+    regular_avg = synthetic_regular_avg(rows)
+    engine = db.create_db(engine_string, local_infile=True)
+    results = []
+    for method in db.INGEST_METHODS:
+        session = db.create_session(engine)
+        start = time.time()
+        db.ingest_regular_avg(session, regular_avg, method, chunksize)
+        elapsed = time.time() - start
+        session.close()
+        results.append([method, rows, elapsed, rows / elapsed])
+    return pd.DataFrame(results, columns=['method', 'rows', 'seconds', 'rows_per_sec'])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion methods of src.ncaa_db")
+    parser.add_argument('--rows', default=100000, type=int, help="Number of synthetic rows to ingest")
+    parser.add_argument('--chunksize', default=10000, type=int, help="Number of rows sent per statement")
+    parser.add_argument('--engine_string', default=None, help="Database to benchmark against, temporary SQLite by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine_string = args.engine_string or 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        print(run(engine_string, args.rows, args.chunksize).to_string(index=False))
@@ -0,0 +1,95 @@
+"""Compare the load time and resident memory of the trained model saved with pickle and as a .model artifact
+
+Each load runs in a fresh interpreter, as in a new app worker, and reports the load seconds and the resident memory
+added by the load and by a first prediction. The .model artifact memory-maps the estimator's arrays, so its pages are
+read from the page cache on use and shared by the workers instead of copied into each of them.
+Usage: python -m benchmarks.bench_model_load [--model_path data/clf.sav] [--rows 20000] [--repeat 5]
+"""
+import os
+import sys
+import pickle
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+import numpy as np
+from sklearn import svm
+
+from src.artifacts import save_model
+
+# Run in the fresh interpreter: load the model, then predict once, and print the seconds and memory of both
+LOAD = '''
+import sys, time, pickle
+import numpy as np
+from src.artifacts import load_model
+from src.profiling import rss_mb
+path, mmap_mode = sys.argv[1], sys.argv[2]
+before = rss_mb()
+start = time.perf_counter()
+if path.endswith('.model'):
+    clf = load_model(path, None if mmap_mode == 'None' else mmap_mode)[0]
+else:
+    with open(path, 'rb') as f:
+        clf = pickle.load(f)
+seconds = time.perf_counter() - start
+loaded = rss_mb()
+clf.decision_function(np.zeros((1, 18)))  # the 17 regular season averages and the seed
+print(seconds, loaded - before, rss_mb() - before)
+'''
+
+# Formats compared: name, file name and memory-map mode of the .model artifact
+FORMATS = [('pickle', 'clf.sav', None), ('model', 'clf.model', None), ('model mmap', 'clf.model', 'c')]
+
+
+def synthetic_model(rows, seed=0):
+    """Train an SVC whose support vectors are about the size of a model trained on all seasons' games
+        Args:
+            rows(int): number of training rows
+            seed(int): seed of the random numbers
+        Returns:
+            clf(sklearn estimator): trained model
+    """
+    random = np.random.RandomState(seed)
+    X = random.normal(size=(rows, 18))
+    y = (X[:, 0] + random.normal(scale=2.0, size=rows) > 0).astype(int)
+    return svm.SVC(kernel='rbf').fit(X, y)
+
+
+def measure(path, mmap_mode, repeat):
+    """Load a model in fresh interpreters
+        Args:
+            path(str): file path of the model
+            mmap_mode(str): memory-map mode of a .model artifact
+            repeat(int): number of interpreters
+        Returns:
+            seconds(float): median load seconds
+            load_mb(float): median resident memory added by the load in MB
+            predict_mb(float): median resident memory added by the load and a first prediction in MB
+    """
+    runs = [subprocess.run([sys.executable, '-c', LOAD, path, str(mmap_mode)], check=True, stdout=subprocess.PIPE,
+                           stderr=subprocess.DEVNULL, cwd=os.getcwd()).stdout.split()
+            for _ in range(repeat)]
+    return tuple(statistics.median(float(run[i]) for run in runs) for i in range(3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the load of the trained model")
+    parser.add_argument('--model_path', default=None, help="Pickled model, default a synthetic SVC")
+    parser.add_argument('--rows', type=int, default=20000, help="Training rows of the synthetic SVC")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per format")
+    args = parser.parse_args()
+
+    if args.model_path is None:
+        clf = synthetic_model(args.rows)
+    else:
+        with open(args.model_path, 'rb') as f:
+            clf = pickle.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'clf.sav'), 'wb') as f:
+            pickle.dump(clf, f)
+        save_model(clf, os.path.join(tmp, 'clf.model'))
+        print('%-12s %10s %10s %12s' % ('format', 'load ms', 'load MB', 'predict MB'))
+        for name, file_name, mmap_mode in FORMATS:
+            seconds, load_mb, predict_mb = measure(os.path.join(tmp, file_name), mmap_mode, args.repeat)
+            print('%-12s %10.1f %10.1f %12.1f' % (name, 1000 * seconds, load_mb, predict_mb))
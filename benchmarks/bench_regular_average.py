@@ -0,0 +1,49 @@
+"""Compare the peak memory and run time of get_regular_season_average with and without chunked reading
+
+Every measurement runs in a fresh interpreter, so each peak RSS only covers one mode.
+Usage: python -m benchmarks.bench_regular_average [--file data/MRegularSeasonDetailedResults.csv] [--chunksize 100000]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+CHILD = '''
+import json, resource, sys, tempfile, time, os
+import src.data_cleaning as cleaning
+file_path, chunksize = sys.argv[1], json.loads(sys.argv[2])
+with tempfile.TemporaryDirectory() as tmp:
+    start = time.time()
+    if chunksize != 0:
+        cleaning.get_regular_season_average(file_path, os.path.join(tmp, 'out.csv'), chunksize)
+    elapsed = time.time() - start
+print(json.dumps({'seconds': elapsed, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+'''
+
+
+def measure(file_path, chunksize):
+    """Run get_regular_season_average in a fresh interpreter
+        Args:
+            file_path(str): regular season detailed results csv
+            chunksize(int): chunk size, None to read the whole file, 0 to only import the modules
+        Returns:
+            result(dict): seconds and peak RSS in MB
+    """
+    output = subprocess.run([sys.executable, '-c', CHILD, file_path, json.dumps(chunksize)], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the peak RSS of get_regular_season_average")
+    parser.add_argument('--file', default='data/MRegularSeasonDetailedResults.csv', help="Detailed results csv")
+    parser.add_argument('--chunksize', default=[100000, 10000], nargs='+', type=int, help="Chunk sizes to compare")
+    args = parser.parse_args()
+
+    print('%-14s %10s %12s' % ('mode', 'seconds', 'peak RSS MB'))
+    imports = measure(args.file, 0)
+    print('%-14s %10s %12.1f' % ('imports only', '-', imports['peak_rss_mb']))
+    for chunksize in [None] + args.chunksize:
+        result = measure(args.file, chunksize)
+        mode = 'whole file' if chunksize is None else 'chunks of %d' % chunksize
+        print('%-14s %10.2f %12.1f' % (mode, result['seconds'], result['peak_rss_mb']))
@@ -0,0 +1,78 @@
+"""Compare get_tourney_delta with the merge-based implementation it replaced, on the full detailed results history
+
+Usage: python -m benchmarks.bench_tourney_delta [--repeat 10]
+Requires the raw data of the model pipeline (python3 run.py model acquire).
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import yaml
+import pandas as pd
+
+import src.data_cleaning as cleaning
+
+logger = logging.getLogger('bench-tourney-delta')
+
+
+def legacy_tourney_delta(regular_avg, tourney_result, seeds, output_path):
+    """The previous get_tourney_delta: four merges, then one delta column at a time and a copy for the losses"""
+    join = pd.merge(left=tourney_result, right=regular_avg, left_on=['Season', 'WTeamID'], right_on=['Season', 'Team'])
+    join = pd.merge(left=join, right=seeds, left_on=['Season', 'WTeamID'], right_on=['Season', 'TeamID'])
+    join = join.rename(columns={'Seed': 'WSeed'}).drop(['Team', 'GP', 'TeamID'], axis=1)
+    join = pd.merge(left=join, right=seeds, left_on=['Season', 'LTeamID'], right_on=['Season', 'TeamID'])
+    join = join.drop(['TeamID'], axis=1).rename(columns={'Seed': 'LSeed'})
+    join.columns = ['Season', 'WTeamID', 'LTeamID'] + ['W' + c for c in cleaning.STAT_COLUMNS] + ['WSeed', 'LSeed']
+    join = pd.merge(left=join, right=regular_avg, left_on=['Season', 'LTeamID'], right_on=['Season', 'Team'])
+    join = join.drop(['Team', 'GP'], axis=1)
+    join.columns = ['Season', 'WTeamID', 'LTeamID'] + ['W' + c for c in cleaning.STAT_COLUMNS] + ['WSeed', 'LSeed'] + \
+                   ['L' + c for c in cleaning.STAT_COLUMNS]
+    wins = join[['Season']].copy()
+    for column in cleaning.STAT_COLUMNS + ['Seed']:
+        wins[column] = join['W' + column] - join['L' + column]
+    wins['Win'] = 1
+    losses = wins.copy()
+    losses.iloc[:, 1:-1] = losses.iloc[:, 1:-1] * -1
+    losses['Win'] = 0
+    tourney_delta = pd.concat([wins, losses]).drop('Season', axis=1)
+    tourney_delta.to_csv(output_path)
+    return tourney_delta
+
+
+def best_of(repeat, function, *args):
+    """Run a function several times and return its result and its fastest wall time"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Benchmark get_tourney_delta on the full detailed results history")
+    parser.add_argument('--repeat', default=10, type=int, help="Number of runs, the fastest one is reported")
+    parser.add_argument('--config', default='config/config.yaml', help="Configuration file with the input paths")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        input_paths = yaml.load(f, Loader=yaml.FullLoader)['model']['load_data']['input_paths']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, 'out.csv')
+        regular_avg = cleaning.get_regular_season_average(input_paths[0], output_path)
+        tourney_result = cleaning.get_tourney_result(input_paths[1], output_path)
+        seeds = cleaning.get_tourney_seeds(input_paths[2], output_path)
+
+        legacy, legacy_time = best_of(args.repeat, legacy_tourney_delta, regular_avg, tourney_result, seeds,
+                                      output_path)
+        current, current_time = best_of(args.repeat, cleaning.get_tourney_delta, regular_avg, tourney_result, seeds,
+                                        output_path)
+
+    pd.testing.assert_frame_equal(legacy, current, check_index_type=False)
+    print('rows: %d' % len(current))
+    print('legacy get_tourney_delta:  %.2f ms' % (legacy_time * 1000))
+    print('current get_tourney_delta: %.2f ms' % (current_time * 1000))
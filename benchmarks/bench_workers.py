@@ -0,0 +1,58 @@
+"""Measure the throughput of the JSON prediction API served by gunicorn as the number of workers goes up
+
+Starts `gunicorn -c config/gunicorn.conf.py app:app` with each worker count, runs the load test of load_api against
+it and stops it. The database is the one of the app config (SQLALCHEMY_DATABASE_URI).
+Usage: python -m benchmarks.bench_workers [--workers 1 2 4 8] [--concurrency 16] [--requests 500] [--batch 100]
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import urllib.request
+
+import numpy as np
+
+from benchmarks.load_api import season_teams, make_bodies, run_load
+
+
+def wait_ready(url, timeout=60):
+    """Wait until the app answers on its home page"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('The app did not start in %ds' % timeout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the API throughput by number of gunicorn workers")
+    parser.add_argument('--workers', default=[1, 2, 4, 8], nargs='+', type=int, help="Worker counts to compare")
+    parser.add_argument('--port', default=5055, type=int, help="Port the app is served on")
+    parser.add_argument('--season', default=2019, type=int, help="Season of the matchups")
+    parser.add_argument('--batch', default=100, type=int, help="Matchups per request")
+    parser.add_argument('--concurrency', default=16, type=int, help="Number of concurrent clients")
+    parser.add_argument('--requests', default=500, type=int, help="Total number of requests per worker count")
+    args = parser.parse_args()
+
+    url = 'http://127.0.0.1:%d' % args.port
+    bodies = make_bodies(season_teams('data/NCAA/MNCAATourneySeeds.csv', 'data/NCAA/MTeams.csv', args.season),
+                         args.season, args.requests, args.batch)
+    print('%8s %14s %14s %10s %10s' % ('workers', 'requests/sec', 'matchups/sec', 'p50 ms', 'p99 ms'))
+    for workers in args.workers:
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'config/gunicorn.conf.py', '--workers',
+                                   str(workers), '--bind', '127.0.0.1:%d' % args.port, 'app:app'],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=dict(os.environ))
+        try:
+            wait_ready(url + '/')
+            seconds, latency = run_load(url + '/api/predict', bodies, args.concurrency)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        print('%8d %14.1f %14.1f %10.1f %10.1f' % (workers, args.requests / seconds,
+                                                   args.requests * args.batch / seconds,
+                                                   np.percentile(latency, 50), np.percentile(latency, 99)))
@@ -0,0 +1,77 @@
+"""Load test the JSON prediction API of a running app
+
+Sends batches of random matchups of a season's seeded teams from concurrent threads, and prints the requests and
+matchups per second and the latency percentiles.
+Usage: python -m benchmarks.load_api [--url http://localhost:5000/api/predict] [--season 2019] [--batch 100]
+       [--concurrency 8] [--requests 500]
+"""
+import json
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def season_teams(seeds_path, teams_path, season):
+    """Get the names of a season's seeded teams"""
+    seeds = pd.read_csv(seeds_path)
+    teams = pd.read_csv(teams_path).set_index('TeamID')['TeamName']
+    return list(teams.loc[seeds.loc[seeds['Season'] == season, 'TeamID']])
+
+
+def post(url, body):
+    """Post a JSON body and return the latency in seconds"""
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def make_bodies(teams, season, n_requests, batch):
+    """Build the JSON bodies of the requests, each with a batch of random matchups"""
+    rng = np.random.RandomState(0)
+    bodies = []
+    for _ in range(n_requests):
+        pairs = [rng.choice(len(teams), 2, replace=False) for _ in range(batch)]
+        bodies.append(json.dumps({'matchups': [{'team1': teams[a], 'team2': teams[b], 'season': season}
+                                               for a, b in pairs]}).encode())
+    return bodies
+
+
+def run_load(url, bodies, concurrency):
+    """Post the bodies from concurrent clients
+        Returns:
+            seconds(float): wall time of all requests
+            latency(np.ndarray): latency of each request in ms
+    """
+    post(url, bodies[0])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latency = np.array(list(pool.map(lambda body: post(url, body), bodies))) * 1000
+    return time.perf_counter() - start, latency
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the JSON prediction API")
+    parser.add_argument('--url', default='http://localhost:5000/api/predict', help="URL of the API")
+    parser.add_argument('--season', default=2019, type=int, help="Season of the matchups")
+    parser.add_argument('--batch', default=100, type=int, help="Matchups per request")
+    parser.add_argument('--concurrency', default=8, type=int, help="Number of concurrent clients")
+    parser.add_argument('--requests', default=500, type=int, help="Total number of requests")
+    parser.add_argument('--seeds_path', default='data/NCAA/MNCAATourneySeeds.csv', help="Tourney seeds csv")
+    parser.add_argument('--teams_path', default='data/NCAA/MTeams.csv', help="Teams csv")
+    args = parser.parse_args()
+
+    teams = season_teams(args.seeds_path, args.teams_path, args.season)
+    bodies = make_bodies(teams, args.season, args.requests, args.batch)
+    seconds, latency = run_load(args.url, bodies, args.concurrency)
+    print('%d requests of %d matchups with %d clients in %.2fs' % (args.requests, args.batch, args.concurrency,
+                                                                   seconds))
+    print('requests/sec %10.1f' % (args.requests / seconds))
+    print('matchups/sec %10.1f' % (args.requests * args.batch / seconds))
+    print('p50 latency  %10.1f ms' % np.percentile(latency, 50))
+    print('p99 latency  %10.1f ms' % np.percentile(latency, 99))
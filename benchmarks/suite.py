@@ -0,0 +1,251 @@
+"""Time the cleaning, training, inference and serving code on synthetic game logs, and compare with a saved baseline
+
+The regular season logs are generated with the schema of MRegularSeasonDetailedResults.csv at multiples of its size
+(more seasons of the same number of teams and games), with a seeded tourney per season, so every run of a scale
+times the same data. Each benchmark is the best of --repeat runs. The results are saved as JSON in the format of the
+run reports, and a regression is a benchmark more than --threshold slower than in the baseline.
+Usage: python -m benchmarks.suite [--scales 1 10 100] [--repeat 3] [--output data/benchmarks/results.json]
+       [--baseline benchmarks/baseline.json] [--threshold 0.2] [--save_baseline]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import platform
+import warnings
+import tempfile
+from collections import OrderedDict
+
+import yaml
+import numpy as np
+import pandas as pd
+import sklearn
+
+import src.ncaa_db as db
+import src.model as model
+import src.artifacts as artifacts
+import src.profiling as profiling
+import src.data_cleaning as cleaning
+from benchmarks.bench_tourney_delta import best_of
+
+logger = logging.getLogger('bench-suite')
+
+# Seasons, teams per season and games per season of 1x, about the size of MRegularSeasonDetailedResults.csv
+SEASONS = 17
+TEAMS = 350
+GAMES = 5300
+
+# (low, high) of each box score stat of a team in a game
+STAT_RANGES = {'Score': (45, 110), 'FGM': (15, 42), 'FGA': (40, 80), 'FGM3': (0, 15), 'FGA3': (5, 35),
+               'FTM': (2, 30), 'FTA': (5, 40), 'OR': (2, 22), 'DR': (12, 40), 'Ast': (4, 25), 'TO': (4, 24),
+               'Stl': (1, 15), 'Blk': (0, 10), 'PF': (8, 28)}
+
+# Model features, the columns of the tourney delta
+FEATURES = cleaning.STAT_COLUMNS + ['Seed']
+
+
+def synthetic_games(output_path, scale, random_state=0):
+    """Write synthetic regular season game logs with the columns of MRegularSeasonDetailedResults.csv
+        Args:
+            output_path(str): file path of the csv
+            scale(int): multiple of the 1x size, in seasons
+            random_state(int): random seed
+        Returns:
+            rows(int): number of games written
+    """
+    rng = np.random.RandomState(random_state)
+    with open(output_path, 'w') as f:
+        # one season at a time, so 100x never holds more than a season in memory
+        for i in range(SEASONS * scale):
+            games = pd.DataFrame({'Season': 2003 + i, 'DayNum': rng.randint(0, 133, GAMES)})
+            winner = rng.randint(0, TEAMS, GAMES)
+            loser = (winner + rng.randint(1, TEAMS, GAMES)) % TEAMS
+            games['WTeamID'] = 1101 + winner
+            games['WScore'] = rng.randint(*STAT_RANGES['Score'], GAMES)
+            games['LTeamID'] = 1101 + loser
+            games['LScore'] = games['WScore'] - rng.randint(1, 25, GAMES)
+            games['WLoc'] = rng.choice(['H', 'A', 'N'], GAMES)
+            games['NumOT'] = rng.randint(0, 2, GAMES)
+            for side in 'WL':
+                for column in cleaning.BOX_SCORE_COLUMNS[1:]:
+                    games[side + column] = rng.randint(*STAT_RANGES[column], GAMES)
+            games.to_csv(f, header=i == 0, index=False)
+    return SEASONS * scale * GAMES
+
+
+def synthetic_tourney(scale, random_state=0):
+    """Seed 64 teams and play a 63 game tourney in each synthetic season
+        Returns:
+            tourney_result(pd.Dataframe): Season, WTeamID and LTeamID of each tourney game
+            seeds(pd.Dataframe): Season, integer Seed and TeamID of each seeded team
+    """
+    rng = np.random.RandomState(random_state)
+    results, seeds = [], []
+    for i in range(SEASONS * scale):
+        teams = 1101 + rng.choice(TEAMS, 64, replace=False)
+        seeds.append(pd.DataFrame({'Season': 2003 + i, 'Seed': np.tile(np.arange(1, 17), 4), 'TeamID': teams}))
+        alive = list(teams)
+        while len(alive) > 1:
+            winners = []
+            for a, b in zip(alive[::2], alive[1::2]):
+                winner, loser = (a, b) if rng.random_sample() < 0.5 else (b, a)
+                results.append((2003 + i, winner, loser))
+                winners.append(winner)
+            alive = winners
+    return pd.DataFrame(results, columns=['Season', 'WTeamID', 'LTeamID']), pd.concat(seeds, ignore_index=True)
+
+
+def serving_app(tmp, regular_avg, seeds, clf):
+    """Import the Flask app on a SQLite database of the synthetic data and the benchmarked model
+        Returns:
+            client(flask.testing.FlaskClient): test client of the app
+            teams(list): names of the seeded teams of the first season
+    """
+    engine_string = 'sqlite:///%s' % os.path.join(tmp, 'bench.db')
+    session = db.create_session(db.create_db(engine_string))
+    db.ingest_regular_avg(session, regular_avg)
+    db.ingest_tourney_seeds(session, seeds)
+    team_ids = sorted(regular_avg['Team'].unique())
+    db.ingest_teams(session, pd.DataFrame({'TeamID': team_ids, 'TeamName': ['Team %d' % t for t in team_ids]}))
+    session.close()
+    model_path = os.path.join(tmp, 'clf.model')
+    artifacts.save_model(clf, model_path)
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = engine_string
+    import app
+    app.prediction_engine.model_path = model_path
+    app.prediction_engine.spellings_path = None
+    app.prediction_engine.reload()
+    first = seeds[seeds['Season'] == seeds['Season'].min()]
+    return app.app.test_client(), ['Team %d' % t for t in first['TeamID']]
+
+
+def per_call(calls, function, *args):
+    """Run a function several times and return its mean wall time per call"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        function(*args)
+    return (time.perf_counter() - start) / calls
+
+
+def run_suite(scales, repeat, train_params, max_train_rows=5000, calls=200, chunksize=None, random_state=0):
+    """Run every benchmark at every scale
+        Args:
+            scales(list): multiples of the 1x data size
+            repeat(int): number of runs of each benchmark, the fastest one is kept
+            train_params(dict): keyword arguments of train_model, e.g. the train_model section of config.yaml
+            max_train_rows(int): number of tourney delta rows train_model is timed on, the SVM does not scale to 100x
+            calls(int): number of calls of the single-row prediction and of the POST route per run
+            chunksize(int): chunksize of get_regular_season_average, None to read the whole file
+            random_state(int): random seed of the synthetic data
+        Returns:
+            results(dict): meta data of the run and, under stages, the wall seconds and rows of each benchmark
+    """
+    stages = OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, 'out.csv')
+        client = None
+        for scale in sorted(scales):
+            games_path = os.path.join(tmp, 'games_%dx.csv' % scale)
+            start = time.perf_counter()
+            games = synthetic_games(games_path, scale, random_state)
+            logger.info('%dx: %d games generated in %.1fs', scale, games, time.perf_counter() - start)
+            tourney_result, seeds = synthetic_tourney(scale, random_state)
+
+            regular_avg, seconds = best_of(repeat, cleaning.get_regular_season_average, games_path, output_path,
+                                           chunksize)
+            stages['get_regular_season_average@%dx' % scale] = {'wall_seconds': seconds, 'rows': games}
+            delta, seconds = best_of(repeat, cleaning.get_tourney_delta, regular_avg, tourney_result, seeds,
+                                     output_path)
+            stages['get_tourney_delta@%dx' % scale] = {'wall_seconds': seconds, 'rows': len(delta)}
+
+            train = delta.sample(min(max_train_rows, len(delta)), random_state=random_state)
+            clf, seconds = best_of(repeat, lambda X, y: model.train_model(X, y, **train_params), train[FEATURES],
+                                   train['Win'])
+            stages['train_model@%dx' % scale] = {'wall_seconds': seconds, 'rows': len(train)}
+            X = delta[FEATURES]
+            _, seconds = best_of(repeat, model.make_predict, clf, X)
+            stages['make_predict_batch@%dx' % scale] = {'wall_seconds': seconds, 'rows': len(X)}
+            row = X.iloc[:1]
+            seconds = min(per_call(calls, model.make_predict, clf, row) for _ in range(repeat))
+            stages['make_predict_row@%dx' % scale] = {'wall_seconds': seconds, 'rows': 1}
+
+            # the route's latency does not depend on the data size, it is timed once on the smallest scale
+            if client is None:
+                client, teams = serving_app(tmp, regular_avg, seeds, clf)
+                rng = np.random.RandomState(random_state)
+                forms = [{'TeamA': teams[a], 'TeamB': teams[b], 'Season': str(seeds['Season'].min())}
+                         for a, b in (rng.choice(len(teams), 2, replace=False) for _ in range(calls))]
+
+                def post_forms():
+                    for form in forms:
+                        assert client.post('/', data=form).status_code == 200
+
+                post_forms()
+                seconds = min(per_call(1, post_forms) for _ in range(repeat)) / calls
+                stages['post_index'] = {'wall_seconds': seconds, 'rows': 1}
+
+    meta = OrderedDict([('created', time.strftime('%Y-%m-%dT%H:%M:%S')), ('python', platform.python_version()),
+                        ('platform', platform.platform()), ('cpus', os.cpu_count()), ('numpy', np.__version__),
+                        ('pandas', pd.__version__), ('sklearn', sklearn.__version__), ('scales', sorted(scales)),
+                        ('repeat', repeat), ('max_train_rows', max_train_rows), ('calls', calls),
+                        ('chunksize', chunksize), ('train_params', train_params)])
+    return OrderedDict([('meta', meta), ('stages', stages)])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    logger.setLevel(logging.INFO)
+    # feature name warnings of newer scikit-learn when the app predicts arrays with a model fitted on a dataframe
+    warnings.filterwarnings('ignore', category=UserWarning)
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare it with a baseline")
+    parser.add_argument('--scales', default=[1, 10, 100], nargs='+', type=int, help="Multiples of the 1x data size")
+    parser.add_argument('--repeat', default=3, type=int, help="Number of runs of each benchmark, the fastest is kept")
+    parser.add_argument('--max_train_rows', default=5000, type=int, help="Rows train_model is timed on")
+    parser.add_argument('--calls', default=200, type=int, help="Calls per run of the single-row and POST benchmarks")
+    parser.add_argument('--chunksize', default=None, type=int, help="chunksize of get_regular_season_average")
+    parser.add_argument('--config', default='config/config.yaml', help="Configuration file with the train_model settings")
+    parser.add_argument('--output', default='data/benchmarks/results.json', help="Where to save the results")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help="Results to compare with")
+    parser.add_argument('--threshold', default=0.2, type=float, help="Relative slowdown counted as a regression")
+    parser.add_argument('--save_baseline', action='store_true', help="If used, will save the results as the baseline")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        train_params = yaml.load(f, Loader=yaml.FullLoader)['model']['train_model']
+    results = run_suite(args.scales, args.repeat, train_params, args.max_train_rows, args.calls, args.chunksize)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results saved to %s' % args.output)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Baseline saved to %s' % args.baseline)
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        for name, stage in results['stages'].items():
+            print('%-40s %12.3f ms %10d rows' % (name, 1000 * stage['wall_seconds'], stage['rows']))
+        print('No baseline at %s, save one with --save_baseline' % args.baseline)
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    changed = [key for key in ['python', 'platform', 'cpus', 'numpy', 'pandas', 'sklearn', 'train_params']
+               if baseline['meta'].get(key) != results['meta'][key]]
+    if changed:
+        logger.warning('The baseline was run with a different %s, the comparison may not be meaningful', changed)
+    comparison = profiling.compare_reports(baseline, results, args.threshold, min_seconds=0)
+    print('%-40s %12s %12s %8s' % ('benchmark', 'baseline ms', 'current ms', 'change'))
+    for row in comparison:
+        print('%-40s %12s %12s %8s %s' % (row['stage'],
+                                          '-' if row['baseline_seconds'] is None else '%.3f' % (1000 * row['baseline_seconds']),
+                                          '-' if row['current_seconds'] is None else '%.3f' % (1000 * row['current_seconds']),
+                                          '-' if row['change'] is None else '%+.0f%%' % (100 * row['change']),
+                                          'REGRESSION' if row['regression'] else ''))
+    regressions = [row['stage'] for row in comparison if row['regression']]
+    if regressions:
+        print('%d benchmarks are more than %.0f%% slower than the baseline' % (len(regressions), 100 * args.threshold))
+        sys.exit(1)
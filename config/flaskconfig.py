@@ -1,9 +1,8 @@
 import os
-DEBUG = True
+DEBUG = os.environ.get('APP_DEBUG', 'True') == 'True'
 LOGGING_CONFIG = "config/logging/local.conf"
 PORT = 5000
 APP_NAME = "ncaa"
-SQLALCHEMY_TRACK_MODIFICATIONS = True
 HOST = "0.0.0.0"
 SQLALCHEMY_ECHO = False  # If true, SQL for queries made will be printed
 MAX_ROWS_SHOW = 100
@@ -23,4 +22,23 @@ elif DB_HOST is None:
 else:
     SQLALCHEMY_DATABASE_URI = '{dialect}://{user}:{pw}@{host}:{port}/{db}'.format(dialect=DB_DIALECT, user=DB_USER,
                                                                                   pw=DB_PW, host=DB_HOST, port=DB_PORT,
-                                                                                  db=DATABASE)
\ No newline at end of file
+                                                                                  db=DATABASE)
+# The connection pool of each process (each gunicorn worker) for MySQL is set by POOL_OPTIONS in src/ncaa_db.py, sized
+# with the DB_POOL_SIZE and DB_MAX_OVERFLOW env variables, SQLALCHEMY_ENGINE_OPTIONS replaces it if set
+
+# Trained model served by the app, the active version of the model registry if one is active
+MODEL_PATH = 'data/clf.model'
+MODEL_REGISTRY_PATH = os.environ.get('MODEL_REGISTRY_PATH', 'data/models')
+
+# Alternate spellings of the team names accepted by the form and the API, and number of autocomplete results
+TEAM_SPELLINGS_PATH = 'data/NCAA/MTeamSpellings.csv'
+AUTOCOMPLETE_LIMIT = 10
+
+# Tourney bracket files and number of simulations of the bracket endpoint
+BRACKET_SLOTS_PATH = 'data/NCAA/MNCAATourneySlots.csv'
+BRACKET_SEEDS_PATH = 'data/NCAA/MNCAATourneySeeds.csv'
+BRACKET_SIMULATIONS = 10000
+BRACKET_MAX_SIMULATIONS = 100000
+
+# Maximum number of matchups in one request of the JSON prediction API
+API_MAX_MATCHUPS = 1000
@@ -0,0 +1,41 @@
+# Production serving of app.py, run with: gunicorn -c config/gunicorn.conf.py app:app
+import gc
+import os
+import multiprocessing
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', 5000)
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = 60
+
+# Import the app, and so load the model and the feature arrays, once in the master before forking the workers, which
+# then share those pages copy-on-write instead of each loading its own copy
+preload_app = True
+
+# Recycle each worker after a number of requests, with some jitter so they do not all restart at once, and give the
+# requests in flight time to finish on a restart or shutdown
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+graceful_timeout = 30
+
+# No debug mode in production
+raw_env = ['APP_DEBUG=False']
+
+
+def pre_fork(server, worker):
+    # keep the objects loaded by the master out of the garbage collector, whose bookkeeping writes would otherwise
+    # copy their pages into every worker (Python 3.7+)
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # connections opened by the master while preloading must not be shared between processes, each worker opens
+    # its own from its pool
+    from app import ncaa_manager
+    ncaa_manager.engine.dispose()
+
+
+def worker_exit(server, worker):
+    # log the pool counters of the worker, e.g. the checkout waits that tell whether its pool is too small
+    from app import ncaa_manager
+    ncaa_manager.log_pool_metrics()
@@ -1,16 +1,26 @@
 import os
+import sys
+import time
+import json
+import atexit
 import argparse
 import logging.config
 
 import yaml
-import pickle
-import pandas as pd
-import numpy as np
 
+import src.artifacts as artifacts
 import src.data_s3 as ds3
 import src.ncaa_db as db
 import src.data_cleaning as cleaning
 import src.model as model
+import src.pipeline as pipeline
+import src.bracket as bracket
+import src.scoring as scoring
+import src.tuning as tuning
+import src.backtest as backtest
+import src.profiling as profiling
+from src.registry import ModelRegistry
+from src.predict_engine import PredictionEngine
 
 logging.config.fileConfig('config/logging/local.conf')
 logger = logging.getLogger('ncaa-pipeline')
@@ -19,6 +29,9 @@ if __name__ == '__main__':
 
     # Add parsers for both uploading data to S3 bucket and creating table in database
     parser = argparse.ArgumentParser(description="Upload data to S3 bucket/Create table in dataBase")
+    parser.add_argument('--report', default=None, help="Where to save the JSON run report (default in report_dir of config.yaml)")
+    parser.add_argument('--cprofile', action='store_true', help="If used, will add the top functions of each stage to the run report")
+    parser.add_argument('--tracemalloc', action='store_true', help="If used, will add the peak memory of each stage to the run report")
     subparsers = parser.add_subparsers(dest='subparser_name')
 
     # Sub-parser for uploading data to S3 bucket
@@ -26,6 +39,9 @@ if __name__ == '__main__':
     sb_s3_upload.add_argument('--multiple', action='store_true', help="If used, will load multiple data files in a directory")
     sb_s3_upload.add_argument('s3path', default='s3://2021-msia423-xu-congda/data/', action='store', help="Where to load data in S3")
     sb_s3_upload.add_argument('local_path', default='data/NCAA/', action='store', help="Where to upload data locally")
+    sb_s3_upload.add_argument('--max_workers', default=4, type=int, help="Number of files uploaded concurrently")
+    sb_s3_upload.add_argument('--multipart_chunksize_mb', default=8, type=int, help="Part size of multipart uploads in MB")
+    sb_s3_upload.add_argument('--max_concurrency', default=4, type=int, help="Number of threads uploading the parts of one file")
 
     # Sub-parser for downloading data from S3 bucket
     sb_s3_download = subparsers.add_parser("download", description="Download data from s3 bucket")
@@ -35,12 +51,50 @@ if __name__ == '__main__':
     # Sub-parser for creating table in database
     sb_create = subparsers.add_parser("create_db", description="Create table in database")
     sb_create.add_argument("--engine_string", default=None, help="SQLAlchemy connection URI for database")
+    sb_create.add_argument("--ingest_method", default='core', choices=db.INGEST_METHODS,
+                           help="How rows are inserted: ORM objects, Core executemany or the dialect's native bulk path")
+    sb_create.add_argument("--chunksize", default=10000, type=int, help="Number of rows sent per insert statement")
+    sb_create.add_argument("--incremental", action='store_true',
+                           help="If used, will only update the seasons that changed since the last ingestion")
+
+    # Sub-parser for checking the query plans of the app's lookups
+    sb_check = subparsers.add_parser("check_db", description="Create missing indexes and check the app's query plans")
+    sb_check.add_argument("--engine_string", default=None, help="SQLAlchemy connection URI for database")
+
+    # Sub-parser for precomputing the app's matchup predictions
+    sb_precompute = subparsers.add_parser("precompute", description="Predict every pair of seeded teams into the database")
+    sb_precompute.add_argument("--engine_string", default=None, help="SQLAlchemy connection URI for database")
+    sb_precompute.add_argument("--model_path", default='data/clf.model',
+                               help="Trained model served by the app while no version of the registry is active")
+    sb_precompute.add_argument("--ingest_method", default='core', choices=db.INGEST_METHODS,
+                               help="How rows are inserted: ORM objects, Core executemany or the dialect's native bulk path")
 
     # Sub-parser for running model pipeline
     sb_model = subparsers.add_parser("model", description="Run the model pipeline")
-    sb_model.add_argument('step', help='Which step to run', choices=['acquire', 'load', 'featurize', 'target', 'split', 'train', 'predict', 'evaluate'])
+    sb_model.add_argument('step', help='Which step to run', choices=['acquire', 'load', 'featurize', 'target', 'split', 'train', 'predict', 'evaluate', 'select', 'tune', 'backtest', 'score', 'all'])
     sb_model.add_argument('--input', '-i', nargs='+', default=None, help='Path to input data')
-    sb_model.add_argument('--output', '-o', nargs='+', default=None, help='Path to save output CSV (optional, default = None)')
+    sb_model.add_argument('--output', '-o', nargs='+', default=None, help='Path to save output artifacts, .feather for columnar files (optional, default = None)')
+    sb_model.add_argument('--force', action='store_true', help="If used with step all, will rerun the steps whose outputs are cached")
+    sb_model.add_argument('--no_publish', action='store_true', help="If used with step train or all, will not publish the trained model to the registry")
+    sb_model.add_argument('--activate', action='store_true', help="If used with step train, will also make the published version the one the app serves")
+
+    # Sub-parser for managing the versions of the model registry
+    sb_registry = subparsers.add_parser("registry", description="List the model versions or move the pointers of the registry")
+    sb_registry.add_argument('action', choices=['list', 'activate', 'shadow'], help="Which action to run")
+    sb_registry.add_argument('version', nargs='?', default=None, help="Version to activate or to score in the shadow, none to stop the shadow")
+
+    # Sub-parser for simulating a season's tourney
+    sb_bracket = subparsers.add_parser("bracket", description="Simulate a season's tourney with the trained model")
+    sb_bracket.add_argument('season', type=int, help="Season of the tourney")
+    sb_bracket.add_argument('--simulations', default=None, type=int, help="Number of simulated tourneys (default in config.yaml)")
+    sb_bracket.add_argument('--random_state', default=None, type=int, help="Random seed")
+    sb_bracket.add_argument('--output', '-o', default=None, help="Where to save the advancement probabilities as csv")
+
+    # Sub-parser for comparing the stage times of two run reports
+    sb_compare = subparsers.add_parser("compare_runs", description="Compare the stage times of two run reports")
+    sb_compare.add_argument('baseline', help="Run report of the reference run")
+    sb_compare.add_argument('current', help="Run report of the run to check")
+    sb_compare.add_argument('--threshold', default=0.2, type=float, help="Relative slowdown of a stage counted as a regression")
 
     args = parser.parse_args()
     sp_used = args.subparser_name
@@ -51,16 +105,25 @@ if __name__ == '__main__':
 
     logger.info("Configuration file loaded")
 
+    # Record the wall time, CPU time, memory and rows of each stage of the run, and save them when the run exits
+    if sp_used is not None and sp_used != 'compare_runs':
+        profiler = profiling.enable(args.cprofile, args.tracemalloc, config['profiling']['top'])
+        report_path = args.report
+        if report_path is None:
+            os.makedirs(config['profiling']['report_dir'], exist_ok=True)
+            report_path = os.path.join(config['profiling']['report_dir'],
+                                       '%s_%s.json' % (time.strftime('%Y%m%d-%H%M%S'), sp_used))
+        atexit.register(profiler.write_report, report_path, sys.argv[1:])
+
     # The option of uploading raw data to S3
     if sp_used == 'upload':
         # User chooses to upload multiple files in a directory
         if args.multiple:
             local_folder = args.local_path
             s3_folder = args.s3path
-            for file in os.listdir(local_folder):
-                local = local_folder + file
-                s3 = s3_folder + file
-                ds3.upload_file_to_s3(local, s3)
+            files = os.listdir(local_folder)
+            manager = ds3.S3TransferManager(args.max_workers, args.multipart_chunksize_mb * ds3.MB, args.max_concurrency)
+            manager.upload_files([local_folder + file for file in files], [s3_folder + file for file in files])
         # User chooses to upload a single file
         else:
             ds3.upload_file_to_s3(args.local_path, args.s3path)
@@ -68,50 +131,55 @@ if __name__ == '__main__':
         ds3.download_file_from_s3(args.local_path, args.s3path)
     # The option of creating database
     elif sp_used == 'create_db':
-        engine = db.create_db(args.engine_string)
+        engine = db.create_db(args.engine_string, local_infile=args.ingest_method == 'native')
         session = db.create_session(engine)
         logger.debug('Database created')
         regular_avg = cleaning.get_regular_season_average('data/MRegularSeasonDetailedResults.csv',
                                                           'data/regular_avg.csv')
-        db.ingest_regular_avg(session, regular_avg)
-        logger.debug('Table regular_season ingested with data')
         seeds = cleaning.get_tourney_seeds('data/MNCAATourneySeeds.csv',
                                            'data/tourney_seeds.csv')
-        db.ingest_tourney_seeds(session, seeds)
-        logger.debug('Table tourney_seeds ingested with data')
         teams = cleaning.get_teams('data/MTeams.csv', 'data/teams.csv')
-        db.ingest_teams(session, teams)
-        logger.debug('Table teams ingested with data')
+        # the three tables are committed together, so a reader never sees a new season with old seeds or teams
+        try:
+            db.ingest_regular_avg(session, regular_avg, args.ingest_method, args.chunksize, args.incremental, False)
+            logger.debug('Table regular_season ingested with data')
+            db.ingest_tourney_seeds(session, seeds, args.ingest_method, args.chunksize, args.incremental, False)
+            logger.debug('Table tourney_seeds ingested with data')
+            db.ingest_teams(session, teams, args.ingest_method, args.chunksize, args.incremental, False)
+            logger.debug('Table teams ingested with data')
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    # The option of checking that the app's lookups use indexes
+    elif sp_used == 'check_db':
+        engine = db.create_db(args.engine_string)
+        scanning = db.check_query_plans(engine)
+        if scanning:
+            logger.error('%d of the app queries scan the whole table', len(scanning))
+            sys.exit(1)
+        logger.info('All app queries use an index')
+    # The option of precomputing the app's predictions, to rerun whenever the served model changes
+    elif sp_used == 'precompute':
+        engine = db.create_db(args.engine_string, local_infile=args.ingest_method == 'native')
+        session = db.create_session(engine)
+        # the same model as the app: the registry's active version, or the model file while none is active
+        matchups, model_hash = PredictionEngine(args.model_path, session,
+                                                registry=ModelRegistry(config['registry']['root'])).precompute_matchups()
+        db.ingest_matchups(session, matchups, model_hash, args.ingest_method)
         session.close()
     # The option of running model pipeline
     elif sp_used == 'model':
-        # Deal with input
-        if args.input is not None:
+        # Deal with input, the score step streams its input file itself
+        if args.input is not None and args.step != 'score':
             # case when there is only one input path
             if len(args.input) == 1:
-                # load a csv file into a pandas dataframe
-                input = pd.read_csv(args.input[0])
-                logger.info('Input data loaded from %s', args.input)
+                input = artifacts.load_artifact(args.input[0])
             # case when there are multiple input paths
             else:
-                inputs = []
-                for i in args.input:
-                    # load a csv file into a pandas dataframe
-                    if i.endswith('.csv'):
-                        input = pd.read_csv(i)
-                    # load a sav file into a ML model
-                    elif i.endswith('.sav'):
-                        with open(i, 'rb') as f:
-                            input = pickle.load(f)
-                    # load a pkl file into a pandas series
-                    elif i.endswith('.pkl'):
-                        input = pd.read_pickle(i)
-                    # load a npy file into a numpy ndarray
-                    elif i.endswith('.npy'):
-                        with open(i, 'rb') as f:
-                            input = np.load(f)
-                    logger.info('Input data loaded from %s', i)
-                    inputs.append(input)
+                inputs = [artifacts.load_artifact(i) for i in args.input]
         if args.step == 'acquire':
             model.acquire_data(**config['model']['acquire_data'])
         elif args.step == 'load':
@@ -125,39 +193,102 @@ if __name__ == '__main__':
             output = [output1, output2, output3, output4]
         elif args.step == 'train':
             output = model.train_model(inputs[0], inputs[1], **config['model']['train_model'])
+            # publish the model as an immutable version by default, the app swaps to it once it is activated
+            if (config['registry']['publish'] and not args.no_publish) or args.activate:
+                registry = ModelRegistry(config['registry']['root'])
+                version = registry.publish(output)
+                if args.activate:
+                    registry.activate(version)
         elif args.step == 'predict':
             output = model.make_predict(inputs[0], inputs[1])
         elif args.step == 'evaluate':
             output = model.evaluation(inputs[0], inputs[1])
+        # compare the candidate models, output the report and optionally the selected model
+        elif args.step == 'select':
+            output = list(model.select_model(inputs[0], inputs[1], inputs[2], inputs[3], **config['model']['select_model']))
+            print(output[0].to_string(index=False, float_format='%.4f'))
+            # no candidate fits the latency budget: save the report only, never a missing model over the served one
+            if output[1] is None and args.output is not None and len(args.output) > 1:
+                artifacts.save_artifact(output[0], args.output[0])
+                logger.error('No model fits the latency budget, %s not written', args.output[1])
+                sys.exit(1)
+            if args.output is not None and len(args.output) == 1:
+                output = output[0]
+        # rank train_model settings by season-grouped cross-validation on the model data
+        elif args.step == 'tune':
+            output = tuning.tune_model(input, config['model']['featurize']['columns'],
+                                       config['model']['get_target']['column'], **config['model']['tune_model'])
+            print(output.head(10).to_string(index=False))
+        # train on the seasons before each season and score its tourney, with the train_model settings
+        elif args.step == 'backtest':
+            output = backtest.backtest(input, config['model']['featurize']['columns'],
+                                       config['model']['get_target']['column'], config['model']['train_model'],
+                                       **config['model']['backtest'])
+            print(output.to_string(index=False, float_format='%.4f'))
+        # score every matchup of a MSampleSubmissionStage2.csv-style file, --input/--output replace the config paths
+        elif args.step == 'score':
+            params = dict(config['model']['score'])
+            if args.input is not None:
+                params['input_path'] = args.input[0]
+            if args.output is not None:
+                params['output_path'] = args.output[0]
+            scoring.score_matchups(**params)
+        # run every step in this process, skipping those whose inputs and config did not change
+        elif args.step == 'all':
+            pipeline.Pipeline(pipeline.build_steps(config, not args.no_publish), config['pipeline']['cache_path'],
+                              config['pipeline']['max_workers'], args.force).run()
         # save artifacts to specified output path
-        if args.output is not None:
+        if args.output is not None and args.step != 'score':
             # case when there is only one output path
             if len(args.output) == 1:
-                # save a pandas dataframe to a csv file
-                if type(output) == pd.core.frame.DataFrame:
-                    output.to_csv(args.output[0], index=False)
-                # save a pandas series to a pkl file
-                elif type(output) == pd.core.series.Series:
-                    output.to_pickle(args.output[0])
-                # save a ML model to a sav file
-                else:
-                    with open(args.output[0], 'wb') as f:
-                        pickle.dump(output, f)
-                logger.info("Output saved to %s" % args.output[0])
+                artifacts.save_artifact(output, args.output[0])
             # case where there are multiple output paths
             else:
                 for i in range(len(output)):
-                    # save a pandas dataframe to a csv file
-                    if type(output[i]) == pd.core.frame.DataFrame:
-                        output[i].to_csv(args.output[i], index=False)
-                    # save a pandas series to a pkl file
-                    elif type(output[i]) == pd.core.series.Series:
-                        output[i].to_pickle(args.output[i])
-                    # save a numpy ndarray to a npy file
-                    else:
-                        with open(args.output[i], 'wb') as f:
-                            np.save(f, output[i])
-                    logger.info("Output saved to %s" % args.output[i])
+                    artifacts.save_artifact(output[i], args.output[i])
+    # The option of simulating a tourney
+    elif sp_used == 'bracket':
+        params = dict(config['bracket'])
+        if args.simulations is not None:
+            params['simulations'] = args.simulations
+        advancement = bracket.simulate_bracket(args.season, random_state=args.random_state, **params)
+        print(advancement.to_string(index=False))
+        if args.output is not None:
+            advancement.to_csv(args.output, index=False)
+            logger.info("Output saved to %s", args.output)
+    # The option of listing the model versions and moving the ACTIVE and SHADOW pointers
+    elif sp_used == 'registry':
+        registry = ModelRegistry(config['registry']['root'])
+        if args.action == 'list':
+            active, shadow = registry.active(), registry.shadow()
+            for version in registry.versions():
+                manifest = artifacts.read_manifest(registry.path(version))
+                print('%-30s %-45s %-8s %s' % (version, manifest['estimator'], manifest['sklearn'],
+                                               'ACTIVE' if version == active else 'SHADOW' if version == shadow else ''))
+        elif args.version is None:
+            logger.error('No version given to %s', args.action)
+            sys.exit(1)
+        elif args.action == 'activate':
+            registry.activate(args.version)
+        else:
+            registry.set_shadow(None if args.version == 'none' else args.version)
+    # The option of comparing two runs, exits with an error if a stage got slower than the threshold
+    elif sp_used == 'compare_runs':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        comparison = profiling.compare_reports(baseline, current, args.threshold)
+        for row in comparison:
+            print('%-45s %10s %10s %8s %s' % (row['stage'],
+                                              '-' if row['baseline_seconds'] is None else '%.3fs' % row['baseline_seconds'],
+                                              '-' if row['current_seconds'] is None else '%.3fs' % row['current_seconds'],
+                                              '-' if row['change'] is None else '%+.0f%%' % (100 * row['change']),
+                                              'REGRESSION' if row['regression'] else ''))
+        regressions = [row['stage'] for row in comparison if row['regression']]
+        if regressions:
+            logger.error('%d stages are more than %.0f%% slower: %s', len(regressions), 100 * args.threshold, regressions)
+            sys.exit(1)
     # The situation where user typed incorrect option
     else:
         parser.print_help()
\ No newline at end of file
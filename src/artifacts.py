@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import sklearn
+
+logger = logging.getLogger(__name__)
+
+# Schema metadata key recording which python type a columnar artifact holds
+KIND_KEY = b'ncaa_artifact_kind'
+
+# Extensions of the columnar artifacts, written as uncompressed Arrow IPC (Feather v2) files so they can be
+# memory-mapped on read
+COLUMNAR_EXTENSIONS = ['.feather', '.arrow']
+
+# Extension of the model artifacts: a directory with the estimator, whose arrays joblib can memory-map, and a manifest
+MODEL_EXTENSION = '.model'
+MODEL_FORMAT = 1
+MANIFEST = 'manifest.json'
+ESTIMATOR = 'estimator.joblib'
+
+
+def to_table(data):
+    """Transform a dataframe, series or 1-d array into an Arrow table that remembers its type
+        Args:
+            data(pd.Dataframe/pd.Series/np.ndarray): model pipeline artifact
+        Returns:
+            table(pyarrow.Table): table with the kind of artifact in its schema metadata
+    """
+    if isinstance(data, pd.DataFrame):
+        kind, frame = b'dataframe', data
+    elif isinstance(data, pd.Series):
+        kind, frame = b'series', data.to_frame(name=data.name if data.name is not None else 'values')
+    elif isinstance(data, np.ndarray) and data.ndim == 1:
+        kind, frame = b'ndarray', pd.DataFrame({'values': data})
+    else:
+        logger.error('Invalid artifact type')
+        raise TypeError('Only dataframes, series and 1-d arrays can be saved as columnar artifacts')
+    # keep a meaningful index (e.g. the evaluation result), drop the default range index
+    table = pa.Table.from_pandas(frame, preserve_index=None)
+    metadata = dict(table.schema.metadata or {})
+    metadata[KIND_KEY] = kind
+    return table.replace_schema_metadata(metadata)
+
+
+def from_table(table):
+    """Transform an Arrow table written by to_table back into its python type
+        Args:
+            table(pyarrow.Table): table read from a columnar artifact
+        Returns:
+            data(pd.Dataframe/pd.Series/np.ndarray): model pipeline artifact
+    """
+    kind = (table.schema.metadata or {}).get(KIND_KEY, b'dataframe')
+    frame = table.to_pandas()
+    if kind == b'series':
+        return frame.iloc[:, 0]
+    if kind == b'ndarray':
+        return frame['values'].values
+    return frame
+
+
+def write_atomic(path, write):
+    """Write a file through a temporary file in its directory and a rename, so a process that has the previous
+    version open or memory-mapped keeps reading it intact
+        Args:
+            path(str): file path
+            write(function): function writing the content to the path it is given
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def save_model(clf, path, features=None):
+    """Save a trained model as a model artifact: the estimator in an uncompressed joblib file, whose NumPy arrays
+    (support vectors, coefficients, scaler statistics...) are stored as raw blobs that can be memory-mapped, and a
+    manifest with the feature order and the hash of the estimator file as its version
+        Args:
+            clf(sklearn estimator): trained model
+            path(str): directory of the artifact, e.g. data/clf.model
+            features(list): feature column names in the order of the model, default its feature_names_in_
+        Returns:
+            manifest(dict): content of the manifest
+    """
+    os.makedirs(path, exist_ok=True)
+    estimator_path = os.path.join(path, ESTIMATOR)
+    write_atomic(estimator_path, lambda tmp_path: joblib.dump(clf, tmp_path))
+    digest = hashlib.sha256()
+    with open(estimator_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    if features is None:
+        features = getattr(clf, 'feature_names_in_', None)
+    manifest = {'format': MODEL_FORMAT, 'estimator': '%s.%s' % (type(clf).__module__, type(clf).__name__),
+                'sklearn': sklearn.__version__, 'features': None if features is None else [str(f) for f in features],
+                'sha256': digest.hexdigest(), 'size_bytes': os.path.getsize(estimator_path),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    def write_manifest(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    # the manifest is written last, a reader never sees a manifest whose estimator is not complete
+    write_atomic(os.path.join(path, MANIFEST), write_manifest)
+    return manifest
+
+
+def read_manifest(path):
+    """Read the manifest of a model artifact
+        Args:
+            path(str): directory of the artifact
+        Returns:
+            manifest(dict): format, estimator class, scikit-learn version, feature order, sha256 and size of the
+                            estimator file, creation time
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MODEL_FORMAT:
+        logger.error('Model artifact %s has format %s', path, manifest.get('format'))
+        raise ValueError('Unsupported model artifact format')
+    return manifest
+
+
+def load_model(path, mmap_mode='c'):
+    """Load a model artifact saved by save_model
+        Args:
+            path(str): directory of the artifact
+            mmap_mode(str): memory-map mode of the estimator's arrays, the default copy-on-write maps share their
+                            pages between the processes and read them from disk only when they are used, None to read
+                            them into memory
+        Returns:
+            clf(sklearn estimator): trained model
+            manifest(dict): content of the manifest
+    """
+    manifest = read_manifest(path)
+    if manifest['sklearn'] != sklearn.__version__:
+        logger.warning('Model %s was saved with scikit-learn %s, loaded with %s', path, manifest['sklearn'],
+                       sklearn.__version__)
+    clf = joblib.load(os.path.join(path, ESTIMATOR), mmap_mode=mmap_mode)
+    return clf, manifest
+
+
+def save_artifact(data, path):
+    """Save a model pipeline artifact, in the format given by the file extension
+        Args:
+            data(object): dataframe, series, array or trained model
+            path(str): .feather/.arrow for columnar artifacts, .model for trained models, .csv, .pkl, .npy or .sav
+                       for the previous formats
+        Returns:
+            None
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == MODEL_EXTENSION:
+        save_model(data, path)
+    elif extension in COLUMNAR_EXTENSIONS:
+        feather.write_feather(to_table(data), path, compression='uncompressed')
+    elif extension == '.csv':
+        data.to_csv(path, index=False)
+    elif extension == '.pkl':
+        data.to_pickle(path)
+    elif extension == '.npy':
+        with open(path, 'wb') as f:
+            np.save(f, data)
+    else:
+        with open(path, 'wb') as f:
+            pickle.dump(data, f)
+    logger.info("Output saved to %s", path)
+
+
+def load_artifact(path):
+    """Load a model pipeline artifact saved by save_artifact, columnar artifacts and model arrays are memory-mapped
+        Args:
+            path(str): file path of the artifact
+        Returns:
+            data(object): dataframe, series, array or trained model
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == MODEL_EXTENSION:
+        data = load_model(path)[0]
+    elif extension in COLUMNAR_EXTENSIONS:
+        data = from_table(feather.read_table(path, memory_map=True))
+    elif extension == '.csv':
+        data = pd.read_csv(path)
+    elif extension == '.pkl':
+        data = pd.read_pickle(path)
+    elif extension == '.npy':
+        data = np.load(path, allow_pickle=True)
+    else:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    logger.info('Input data loaded from %s', path)
+    return data
@@ -0,0 +1,66 @@
+import time
+import logging
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+
+import src.model as model
+import src.profiling as profiling
+
+logger = logging.getLogger(__name__)
+
+
+def run_fold(X, y, seasons, season, train_params):
+    """Train on the seasons before a season and score its tourney games
+        Args:
+            X(pd.Dataframe): features of all games
+            y(pd.Series): target of all games
+            seasons(np.ndarray): season of each game
+            season(int): season scored by the fold
+            train_params(dict): keyword arguments of train_model, e.g. estimator and kernel
+        Returns:
+            result(dict): season, number of train and test rows, accuracy, log loss, fit and wall seconds
+    """
+    start = time.perf_counter()
+    train, test = seasons < season, seasons == season
+    clf = model.train_model(X[train], y[train], **train_params)
+    fit_seconds = time.perf_counter() - start
+    proba = model.predict_win_proba(clf, X[test])
+    return {'Season': season, 'n_train': int(train.sum()), 'n_test': int(test.sum()),
+            'accuracy': metrics.accuracy_score(y[test], clf.predict(X[test])),
+            'log_loss': metrics.log_loss(y[test], np.clip(proba, 1e-15, 1 - 1e-15), labels=[0, 1]),
+            'fit_seconds': fit_seconds, 'wall_seconds': time.perf_counter() - start}
+
+
+@profiling.timed(rows='data')
+def backtest(data, columns, column, train_params, min_train_seasons=3, n_jobs=-1):
+    """Walk forward through the seasons: for each season, train on the earlier seasons and score its tourney
+        Args:
+            data(pd.Dataframe): model data with a Season column, see load_data keep_season. The features are computed
+                                once for all seasons, a season's features only use its own regular season
+            columns(list): list of feature column names
+            column(str): target column name
+            train_params(dict): keyword arguments of train_model, e.g. the train_model section of config.yaml
+            min_train_seasons(int): number of seasons trained on by the first fold
+            n_jobs(int): number of folds run in parallel worker processes, -1 for all cores
+        Returns:
+            result(pd.Dataframe): one row per scored season, with its accuracy, log loss, fit and wall seconds
+    """
+    if 'Season' not in data:
+        logger.error('Model data without a Season column')
+        raise KeyError('The backtest needs the Season column, set keep_season under load_data')
+    seasons = np.sort(data['Season'].unique())
+    if len(seasons) <= min_train_seasons:
+        logger.error('Only %d seasons in the model data', len(seasons))
+        raise ValueError('The backtest needs more than min_train_seasons seasons')
+    start = time.time()
+    X, y = data[columns], data[column]
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(run_fold)(X, y, data['Season'].values, season, train_params)
+        for season in seasons[min_train_seasons:])
+    result = pd.DataFrame(results)
+    logger.info('%d seasons backtested in %.2fs, mean accuracy %.3f, mean log loss %.3f', len(result),
+                time.time() - start, result['accuracy'].mean(), result['log_loss'].mean())
+    return result
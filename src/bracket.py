@@ -0,0 +1,212 @@
+import re
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+import src.artifacts as artifacts
+import src.model as model
+import src.profiling as profiling
+from src.data_cleaning import STAT_COLUMNS, get_seed
+
+logger = logging.getLogger(__name__)
+
+# Number of simulations run at once, the bracket of a batch takes (teams + slots) * batch int16 values
+BATCH_SIZE = 20000
+
+
+def read_bracket(slots_path, seeds_path, season):
+    """Read the slots and the seeded teams of a season's tourney
+        Args:
+            slots_path(str): file path of MNCAATourneySlots.csv
+            seeds_path(str): file path of MNCAATourneySeeds.csv, with the seed labels (e.g. W16a)
+            season(int): season of the tourney
+        Returns:
+            slots(pd.Dataframe): Slot, StrongSeed and WeakSeed of each game, a seed is a seed label or another slot
+            seeds(pd.Dataframe): Seed label, TeamID and integer SeedNumber of each team
+    """
+    return season_bracket(pd.read_csv(slots_path), pd.read_csv(seeds_path), season)
+
+
+def season_bracket(all_slots, all_seeds, season):
+    """Get the slots and the seeded teams of a season's tourney from the slots and seeds of every season, e.g. read
+    once by the app
+        Args:
+            all_slots(pd.Dataframe): content of MNCAATourneySlots.csv
+            all_seeds(pd.Dataframe): content of MNCAATourneySeeds.csv
+            season(int): season of the tourney
+        Returns:
+            slots(pd.Dataframe): Slot, StrongSeed and WeakSeed of each game, see read_bracket
+            seeds(pd.Dataframe): Seed label, TeamID and integer SeedNumber of each team
+    """
+    slots = all_slots[all_slots['Season'] == season][['Slot', 'StrongSeed', 'WeakSeed']].reset_index(drop=True)
+    seeds = all_seeds[all_seeds['Season'] == season][['Seed', 'TeamID']].reset_index(drop=True)
+    if slots.empty or seeds.empty:
+        logger.error('No tourney bracket for season %s', season)
+        raise ValueError('There is no tourney bracket for season %s' % season)
+    seeds['SeedNumber'] = seeds['Seed'].apply(get_seed)
+    return slots, seeds
+
+
+def slot_round(slot):
+    """Get the round of a slot, 0 for the play-in games (e.g. W16) and 1 to 6 for R1W1 to R6CH"""
+    m = re.match(r'R(\d)', slot)
+    return int(m.group(1)) if m else 0
+
+
+def order_slots(slots, seed_labels):
+    """Order the slots so that every game comes after the games its teams come from
+        Args:
+            slots(pd.Dataframe): Slot, StrongSeed and WeakSeed of each game
+            seed_labels(list): seed labels of the teams
+        Returns:
+            ordered(list): (slot, strong seed, weak seed) tuples
+    """
+    known = set(seed_labels)
+    pending = list(slots[['Slot', 'StrongSeed', 'WeakSeed']].itertuples(index=False, name=None))
+    ordered = []
+    while pending:
+        ready = [game for game in pending if game[1] in known and game[2] in known]
+        if not ready:
+            logger.error('Slots %s can not be played', [game[0] for game in pending])
+            raise ValueError('The tourney slots do not form a bracket')
+        for game in ready:
+            pending.remove(game)
+            ordered.append(game)
+            known.add(game[0])
+    return ordered
+
+
+def win_probability_matrix(clf, features):
+    """Predict the probability of every team beating every other team with one model call
+        Args:
+            clf(sklearn estimator): trained model
+            features(np.ndarray): feature row of each team, STAT_COLUMNS followed by the seed
+        Returns:
+            proba(np.ndarray): proba[i, j] is the probability that team i beats team j
+    """
+    n = len(features)
+    delta = (features[:, None, :] - features[None, :, :]).reshape(n * n, -1)
+    if hasattr(clf, 'feature_names_in_'):
+        delta = pd.DataFrame(delta, columns=clf.feature_names_in_)
+    proba = model.predict_win_proba(clf, delta).reshape(n, n)
+    # the model sees each pair in both orders, average them so that proba[i, j] + proba[j, i] == 1
+    return (proba + 1 - proba.T) / 2
+
+
+class BracketSimulator:
+    """Simulate a season's tourney from the model's pairwise win probabilities
+
+    Each batch of simulations is one int16 array with a row per team (the team itself) and a row per slot (its
+    winner in each simulation), filled slot by slot in bracket order, so a game is a lookup in the probability
+    matrix and one comparison with uniform draws for all the simulations of the batch at once.
+    """
+
+    def __init__(self, clf, slots, seeds, features):
+        """
+            Args:
+                clf(sklearn estimator): trained model
+                slots(pd.Dataframe): Slot, StrongSeed and WeakSeed of each game, see read_bracket
+                seeds(pd.Dataframe): Seed label and TeamID of each team, see read_bracket
+                features(np.ndarray): feature row of each team of seeds, STAT_COLUMNS followed by the seed
+        """
+        self.seeds = seeds
+        self.proba = win_probability_matrix(clf, features)
+        labels = list(seeds['Seed'])
+        rows = {label: i for i, label in enumerate(labels)}
+        games = order_slots(slots, labels)
+        for i, (slot, _, _) in enumerate(games):
+            rows[slot] = len(labels) + i
+        self.slots = [game[0] for game in games]
+        self.rounds = np.array([slot_round(slot) for slot in self.slots])
+        self.strong = np.array([rows[game[1]] for game in games])
+        self.weak = np.array([rows[game[2]] for game in games])
+
+    def simulate(self, simulations=100000, random_state=None, batch_size=BATCH_SIZE):
+        """Simulate the tourney
+            Args:
+                simulations(int): number of simulated tourneys
+                random_state(int): random seed
+                batch_size(int): number of tourneys simulated at once
+            Returns:
+                advancement(pd.Dataframe): Seed, TeamID and, for each round R0 (play-in) to R6 (title game), the
+                                           probability that the team wins its game of the round, 1 for the R0 of a
+                                           team without a play-in game
+        """
+        if simulations < 1:
+            logger.error('%s simulations requested', simulations)
+            raise ValueError('The number of simulations must be at least 1')
+        start = time.time()
+        rng = np.random.RandomState(random_state)
+        n_teams = len(self.seeds)
+        n_rounds = self.rounds.max() + 1
+        wins = np.zeros((n_rounds, n_teams))
+        for done in range(0, simulations, batch_size):
+            size = min(batch_size, simulations - done)
+            bracket = np.empty((n_teams + len(self.slots), size), dtype=np.int16)
+            bracket[:n_teams] = np.arange(n_teams)[:, None]
+            draws = rng.random_sample((len(self.slots), size))
+            for i in range(len(self.slots)):
+                strong, weak = bracket[self.strong[i]], bracket[self.weak[i]]
+                winner = bracket[n_teams + i]
+                np.copyto(winner, np.where(draws[i] < self.proba[strong, weak], strong, weak))
+                wins[self.rounds[i]] += np.bincount(winner, minlength=n_teams)
+        advancement = wins / simulations
+        play_in = self.rounds == 0
+        byes = np.ones(n_teams, dtype=bool)
+        byes[self.strong[play_in]] = False
+        byes[self.weak[play_in]] = False
+        advancement[0, byes] = 1
+        elapsed = time.time() - start
+        logger.info('%d tourneys simulated in %.2fs (%.0f simulations/sec)', simulations, elapsed,
+                    simulations / elapsed if elapsed > 0 else float('inf'))
+        result = self.seeds[['Seed', 'TeamID']].copy()
+        for r in range(n_rounds):
+            result['R%d' % r] = advancement[r]
+        return result.sort_values('R%d' % (n_rounds - 1), ascending=False).reset_index(drop=True)
+
+
+def season_features(regular_avg, seeds, season):
+    """Get the feature rows of a season's seeded teams from the regular season averages
+        Args:
+            regular_avg(pd.Dataframe): regular season average dataframe
+            seeds(pd.Dataframe): Seed label, TeamID and SeedNumber of the teams, see read_bracket
+            season(int): season of the tourney
+        Returns:
+            features(np.ndarray): feature row of each team of seeds, STAT_COLUMNS followed by the seed
+    """
+    stats = regular_avg[regular_avg['Season'] == season].set_index('Team')[STAT_COLUMNS]
+    missing = set(seeds['TeamID']) - set(stats.index)
+    if missing:
+        logger.error('Teams %s have no regular season stats in %s', sorted(missing), season)
+        raise ValueError('Some seeded teams have no regular season stats')
+    return np.column_stack([stats.loc[seeds['TeamID']].values, seeds['SeedNumber'].values])
+
+
+@profiling.timed()
+def simulate_bracket(season, slots_path, seeds_path, regular_avg_path, model_path, teams_path=None, simulations=100000,
+                     random_state=None, batch_size=BATCH_SIZE):
+    """Simulate a season's tourney with the trained model
+        Args:
+            season(int): season of the tourney
+            slots_path(str): file path of MNCAATourneySlots.csv
+            seeds_path(str): file path of MNCAATourneySeeds.csv
+            regular_avg_path(str): file path of the regular season average csv written by the load step
+            model_path(str): file path of the trained model
+            teams_path(str): file path of MTeams.csv, to add the team names to the output
+            simulations(int): number of simulated tourneys
+            random_state(int): random seed
+            batch_size(int): number of tourneys simulated at once
+        Returns:
+            advancement(pd.Dataframe): round advancement probabilities of each team, see BracketSimulator.simulate
+    """
+    slots, seeds = read_bracket(slots_path, seeds_path, season)
+    regular_avg = pd.read_csv(regular_avg_path, index_col=0)
+    clf = artifacts.load_artifact(model_path)
+    simulator = BracketSimulator(clf, slots, seeds, season_features(regular_avg, seeds, season))
+    advancement = simulator.simulate(simulations, random_state, batch_size)
+    if teams_path is not None:
+        names = pd.read_csv(teams_path).set_index('TeamID')['TeamName']
+        advancement.insert(2, 'TeamName', advancement['TeamID'].map(names))
+    return advancement
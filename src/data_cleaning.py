@@ -1,11 +1,23 @@
 import logging
-import warnings
 
+import numpy as np
 import pandas as pd
 
+import src.profiling as profiling
+
 logger = logging.getLogger(__name__)
 
+# Box score stats of a team in a game, and their columns for the winning and losing team in the detailed results
+BOX_SCORE_COLUMNS = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']
+WIN_COLUMNS = ['W' + column for column in BOX_SCORE_COLUMNS]
+LOSS_COLUMNS = ['L' + column for column in BOX_SCORE_COLUMNS]
+
+# Regular season average stats used as model features, in the order of the feature columns
+STAT_COLUMNS = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF', 'FGP',
+                'FG3P', 'FTP']
+
 
+@profiling.timed()
 def get_teams(file_path, output_path):
     """Get the teams dataframe
         Args:
@@ -27,11 +39,31 @@ def get_teams(file_path, output_path):
     return teams
 
 
-def get_regular_season_average(file_path, output_path):
+def get_regular_season_sums(regular_games):
+    """Sum the box score stats and count the games played by each team in each season
+        Args:
+            regular_games(pd.Dataframe): regular season detailed results, one row per game
+        Returns:
+            regular_agg(pd.Dataframe): stats summed by (Season, Team), with the number of games played in GP
+    """
+    regular_wins = regular_games[['Season', 'WTeamID'] + WIN_COLUMNS]
+    regular_wins.columns = ['Season', 'Team'] + BOX_SCORE_COLUMNS
+    regular_losses = regular_games[['Season', 'LTeamID'] + LOSS_COLUMNS]
+    regular_losses.columns = ['Season', 'Team'] + BOX_SCORE_COLUMNS
+    regular = pd.concat([regular_wins, regular_losses])
+    regular['GP'] = 1
+    regular_agg = regular.groupby(['Season', 'Team']).sum()
+    return regular_agg
+
+
+@profiling.timed()
+def get_regular_season_average(file_path, output_path, chunksize=None):
     """Get the regular season average dataframe
         Args:
             file_path(str): file path of input csv
             output_path(str): file path for the output csv
+            chunksize(int): if given, read the csv this many games at a time, with only the needed columns and compact
+                            dtypes, and keep running sums by (Season, Team), so memory does not grow with the file
         Returns:
             regular_avg(pd.Dataframe): regular season average dataframe
     """
@@ -41,19 +73,24 @@ def get_regular_season_average(file_path, output_path):
     if type(output_path) != str:
         logger.error('Invalid input value')
         raise TypeError('The file path you entered is invalid')
-    regular_games = pd.read_csv(file_path)
-    regular_wins = regular_games[['Season', 'WTeamID','WScore', 'WFGM', 'WFGA', 'WFGM3', 'WFGA3', 'WFTM', 'WFTA', 'WOR', 'WDR', 'WAst', 'WTO', 'WStl', 'WBlk', 'WPF']]
-    regular_wins.columns = ['Season', 'Team', 'Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']
-    regular_losses = regular_games[['Season', 'LTeamID', 'LScore', 'LFGM', 'LFGA', 'LFGM3', 'LFGA3', 'LFTM', 'LFTA', 'LOR', 'LDR', 'LAst', 'LTO', 'LStl', 'LBlk', 'LPF']]
-    regular_losses.columns = ['Season', 'Team', 'Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']
-    regular = pd.concat([regular_wins, regular_losses])
-    regular['GP'] = 1
-    regular_agg = regular.groupby(['Season', 'Team']).sum()
+    if chunksize is None:
+        regular_games = pd.read_csv(file_path)
+        regular_agg = get_regular_season_sums(regular_games)
+    else:
+        dtype = {column: 'int16' for column in ['Season'] + WIN_COLUMNS + LOSS_COLUMNS}
+        dtype.update({'WTeamID': 'int32', 'LTeamID': 'int32'})
+        regular_agg = None
+        for regular_games in pd.read_csv(file_path, usecols=list(dtype), dtype=dtype, chunksize=chunksize):
+            # sum in 64 bits, a season's total can overflow the 16 bits of a single game's stat
+            sums = get_regular_season_sums(regular_games.astype('int64'))
+            regular_agg = sums if regular_agg is None else regular_agg.add(sums, fill_value=0)
+        # adding partial sums with fill_value turns the columns into floats
+        regular_agg = regular_agg.sort_index().astype('int64')
     regular_agg['FGP'] = regular_agg['FGM'] / regular_agg['FGA']
     regular_agg['FG3P'] = regular_agg['FGM3'] / regular_agg['FGA3']
     regular_agg['FTP'] = regular_agg['FTM'] / regular_agg['FTA']
     regular_avg = regular_agg
-    regular_avg[['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']] = regular_avg[['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']].div(regular_avg['GP'].values,axis=0)
+    regular_avg[BOX_SCORE_COLUMNS] = regular_avg[BOX_SCORE_COLUMNS].div(regular_avg['GP'].values, axis=0)
     regular_avg = regular_avg.reset_index()
     regular_avg.to_csv(output_path)
     logger.info('Got regular season average dataframe')
@@ -73,6 +110,7 @@ def get_seed(seed):
     return int(result)
 
 
+@profiling.timed()
 def get_tourney_seeds(file_path, output_path):
     """Get the tourney seeds dataframe
         Args:
@@ -94,6 +132,7 @@ def get_tourney_seeds(file_path, output_path):
     return seeds
 
 
+@profiling.timed()
 def get_tourney_result(file_path, output_path):
     """Get the tourney result dataframe
         Args:
@@ -115,63 +154,55 @@ def get_tourney_result(file_path, output_path):
     return tourney_result
 
 
-def get_tourney_delta(regular_avg, tourney_result, seeds, output_path):
+@profiling.timed()
+def get_team_features(regular_avg, seeds):
+    """Get the model features of every team that played in the regular season and was seeded in the tourney
+        Args:
+            regular_avg(pd.Dataframe): regular season average dataframe
+            seeds(pd.Dataframe): tourney seeds dataframe
+        Returns:
+            stats(pd.Dataframe): regular season average stats indexed by (Season, Team)
+            seed(np.ndarray): tourney seed of each row of stats
+    """
+    stats = regular_avg.set_index(['Season', 'Team'])[STAT_COLUMNS]
+    seed = seeds.set_index(['Season', 'TeamID'])['Seed']
+    seed.index.names = stats.index.names
+    stats, seed = stats.align(seed, join='inner', axis=0)
+    return stats, seed.values
+
+
+@profiling.timed()
+def get_tourney_delta(regular_avg, tourney_result, seeds, output_path, keep_season=False):
     """Get dataframe of the difference of a tourney match's two teams' regular season average stats
         Args:
             regular_avg(pd.Dataframe): regular season average dataframe
             tourney_result(pd.Dataframe): tourney result dataframe
             seeds(pd.Dataframe): tourney seeds dataframe
             output_path(str): file path for the output csv
+            keep_season(bool): if True, the first column is the Season of the game, for season-grouped validation
         Returns:
             tourney_delta(pd.Dataframe): dataframe of the difference of a tourney match's two teams' regular season average stats
     """
-    warnings.filterwarnings("ignore")
-    tourney_join_win = pd.merge(left=tourney_result, right=regular_avg, left_on=['Season', 'WTeamID'],
-                                right_on=['Season', 'Team'])
-    tourney_join_win = pd.merge(left=tourney_join_win, right=seeds, left_on=['Season', 'WTeamID'],
-                                right_on=['Season', 'TeamID'])
-    tourney_join_win = tourney_join_win.rename(columns={'Seed': 'WSeed'})
-    tourney_join_win = tourney_join_win.drop(['Team', 'GP', 'TeamID'], axis=1)
-    tourney_join_win = pd.merge(left=tourney_join_win, right=seeds, left_on=['Season', 'LTeamID'],
-                                right_on=['Season', 'TeamID'])
-    tourney_join_win = tourney_join_win.drop(['TeamID'], axis=1)
-    tourney_join_win = tourney_join_win.rename(columns={'Seed': 'LSeed'})
-    tourney_join_win.columns = ['Season', 'WTeamID', 'LTeamID', 'WScore', 'WFGM', 'WFGA', 'WFGM3', 'WFGA3', 'WFTM',
-                                'WFTA', 'WOR', 'WDR', 'WAst', 'WTO', 'WStl', 'WBlk', 'WPF', 'WFGP', 'WFG3P', 'WFTP',
-                                'WSeed', 'LSeed']
-    tourney_join_win_loss = pd.merge(left=tourney_join_win, right=regular_avg, left_on=['Season', 'LTeamID'],
-                                     right_on=['Season', 'Team'])
-    tourney_join_win_loss = tourney_join_win_loss.drop(['Team', 'GP'], axis=1)
-    tourney_join_win_loss.columns = ['Season', 'WTeamID', 'LTeamID', 'WScore', 'WFGM', 'WFGA', 'WFGM3', 'WFGA3', 'WFTM',
-                                     'WFTA', 'WOR', 'WDR', 'WAst', 'WTO', 'WStl', 'WBlk', 'WPF', 'WFGP', 'WFG3P',
-                                     'WFTP', 'WSeed', 'LSeed', 'LScore', 'LFGM', 'LFGA', 'LFGM3', 'LFGA3', 'LFTM',
-                                     'LFTA', 'LOR', 'LDR', 'LAst', 'LTO', 'LStl', 'LBlk', 'LPF', 'LFGP', 'LFG3P',
-                                     'LFTP']
-    tourney_delta_wins = tourney_join_win_loss[['Season']]
-    tourney_delta_wins['Score'] = tourney_join_win_loss['WScore'] - tourney_join_win_loss['LScore']
-    tourney_delta_wins['FGM'] = tourney_join_win_loss['WFGM'] - tourney_join_win_loss['LFGM']
-    tourney_delta_wins['FGA'] = tourney_join_win_loss['WFGA'] - tourney_join_win_loss['LFGA']
-    tourney_delta_wins['FGM3'] = tourney_join_win_loss['WFGM3'] - tourney_join_win_loss['LFGM3']
-    tourney_delta_wins['FGA3'] = tourney_join_win_loss['WFGA3'] - tourney_join_win_loss['LFGA3']
-    tourney_delta_wins['FTM'] = tourney_join_win_loss['WFTM'] - tourney_join_win_loss['LFTM']
-    tourney_delta_wins['FTA'] = tourney_join_win_loss['WFTA'] - tourney_join_win_loss['LFTA']
-    tourney_delta_wins['OR'] = tourney_join_win_loss['WOR'] - tourney_join_win_loss['LOR']
-    tourney_delta_wins['DR'] = tourney_join_win_loss['WDR'] - tourney_join_win_loss['LDR']
-    tourney_delta_wins['Ast'] = tourney_join_win_loss['WAst'] - tourney_join_win_loss['LAst']
-    tourney_delta_wins['TO'] = tourney_join_win_loss['WTO'] - tourney_join_win_loss['LTO']
-    tourney_delta_wins['Stl'] = tourney_join_win_loss['WStl'] - tourney_join_win_loss['LStl']
-    tourney_delta_wins['Blk'] = tourney_join_win_loss['WBlk'] - tourney_join_win_loss['LBlk']
-    tourney_delta_wins['PF'] = tourney_join_win_loss['WPF'] - tourney_join_win_loss['LPF']
-    tourney_delta_wins['FGP'] = tourney_join_win_loss['WFGP'] - tourney_join_win_loss['LFGP']
-    tourney_delta_wins['FG3P'] = tourney_join_win_loss['WFG3P'] - tourney_join_win_loss['LFG3P']
-    tourney_delta_wins['FTP'] = tourney_join_win_loss['WFTP'] - tourney_join_win_loss['LFTP']
-    tourney_delta_wins['Seed'] = tourney_join_win_loss['WSeed'] - tourney_join_win_loss['LSeed']
-    tourney_delta_wins['Win'] = 1
-    tourney_delta_losses = tourney_delta_wins.copy()
-    tourney_delta_losses.iloc[:, 1:-1] = tourney_delta_losses.iloc[:, 1:-1] * -1
-    tourney_delta_losses['Win'] = 0
-    tourney_delta = pd.concat([tourney_delta_wins, tourney_delta_losses])
-    tourney_delta = tourney_delta.drop('Season', axis=1)
+    stats, seed = get_team_features(regular_avg, seeds)
+    win_rows = stats.index.get_indexer(pd.MultiIndex.from_arrays([tourney_result['Season'], tourney_result['WTeamID']]))
+    loss_rows = stats.index.get_indexer(pd.MultiIndex.from_arrays([tourney_result['Season'], tourney_result['LTeamID']]))
+    # games whose two teams both have regular season stats and a seed
+    played = (win_rows >= 0) & (loss_rows >= 0)
+    win_rows = win_rows[played]
+    loss_rows = loss_rows[played]
+
+    # winner minus loser for the wins, and the negation of the same rows for the mirrored losses
+    stats_delta = stats.values[win_rows] - stats.values[loss_rows]
+    seed_delta = seed[win_rows] - seed[loss_rows]
+    delta = {}
+    if keep_season:
+        season = tourney_result['Season'].values[played]
+        delta['Season'] = np.concatenate([season, season])
+    delta.update({column: np.concatenate([stats_delta[:, i], -stats_delta[:, i]])
+                  for i, column in enumerate(STAT_COLUMNS)})
+    delta['Seed'] = np.concatenate([seed_delta, -seed_delta])
+    delta['Win'] = np.repeat(np.array([1, 0], dtype=np.int64), len(win_rows))
+    tourney_delta = pd.DataFrame(delta, index=np.tile(np.arange(len(win_rows)), 2))
     tourney_delta.to_csv(output_path)
     logger.info('Got tourney delta dataframe')
-    return tourney_delta
\ No newline at end of file
+    return tourney_delta
@@ -1,11 +1,23 @@
-import logging
+import os
 import re
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 import botocore
+from boto3.s3.transfer import TransferConfig
+
+import src.profiling as profiling
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
 
 def parse_s3(s3path):
     """Parse the S3 path that is passed in
@@ -24,6 +36,331 @@ def parse_s3(s3path):
     return s3bucket, s3path
 
 
+def local_etag(local_path, multipart_chunksize, parts=None):
+    """Compute the ETag S3 gives to a file uploaded in parts of a given size
+       Args:
+           local_path(str): local file path
+           multipart_chunksize(int): part size in bytes
+           parts(int): number of parts of the S3 object, None if it was uploaded in a single part
+       Returns:
+           etag(str): md5 hex digest of the file, or md5 of the parts' digests followed by -<parts> for a multipart
+                      upload, None if the file does not split into the given number of parts
+    """
+    whole = hashlib.md5()
+    digests = []
+    with open(local_path, 'rb') as f:
+        for block in iter(lambda: f.read(multipart_chunksize), b''):
+            whole.update(block)
+            digests.append(hashlib.md5(block).digest())
+    if parts is None:
+        return whole.hexdigest()
+    if len(digests) != parts:
+        return None
+    return '%s-%d' % (hashlib.md5(b''.join(digests)).hexdigest(), parts)
+
+
+def atomic_fetch(fetch, destination):
+    """Write a file through a temporary file in the destination directory and a rename, so that readers of the
+    destination only ever see a complete file
+       Args:
+           fetch(function): function writing the content to the path it is given
+           destination(str): path of the file
+       Returns:
+           None
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(destination), suffix='.tmp')
+    os.close(fd)
+    try:
+        fetch(tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def atomic_copy(source, destination):
+    """Copy a file with atomic_fetch
+       Args:
+           source(str): file to copy
+           destination(str): path of the copy
+       Returns:
+           None
+    """
+    atomic_fetch(lambda path: shutil.copyfile(source, path), destination)
+
+
+class S3Cache:
+    """Local content-addressed cache of S3 objects
+
+    An object is stored under the hash of its bucket, key and ETag, so a new version of an object never serves a
+    stale copy. Entries are written with a temporary file and a rename, so concurrent runs never see a partial entry,
+    and the least recently used entries are evicted when the cache grows over its size cap. The entries returned by
+    get and put are pinned until they are released, so a concurrent download never evicts an entry being copied.
+    The cache directory is created by the first put.
+    """
+
+    def __init__(self, cache_dir='data/.s3_cache', max_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * MB
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # entry path to the number of downloads still copying it
+        self.pinned = {}
+
+    def entry_path(self, s3bucket, key, etag):
+        """Path of the cache entry of an object version"""
+        name = hashlib.sha256(('%s/%s/%s' % (s3bucket, key, etag)).encode()).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    def pin(self, path):
+        """Keep an entry from being evicted until it is released"""
+        with self.lock:
+            self.pinned[path] = self.pinned.get(path, 0) + 1
+
+    def release(self, path):
+        """Allow an entry returned by get or put to be evicted again, once it is copied"""
+        with self.lock:
+            self.pinned[path] -= 1
+            if not self.pinned[path]:
+                del self.pinned[path]
+
+    def get(self, s3bucket, key, etag):
+        """Look up an object version in the cache
+           Returns:
+               path(str): path of the cached copy, pinned until released, None on a miss
+        """
+        path = self.entry_path(s3bucket, key, etag)
+        self.pin(path)
+        try:
+            # the modification time orders the entries for the LRU eviction
+            os.utime(path, None)
+        except FileNotFoundError:
+            self.release(path)
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return path
+
+    def put(self, s3bucket, key, etag, download):
+        """Add an object version to the cache
+           Args:
+               s3bucket(str): bucket of the object
+               key(str): key of the object
+               etag(str): ETag of the object version
+               download(function): function writing the object to the path it is given
+           Returns:
+               path(str): path of the cached copy, pinned until released
+        """
+        path = self.entry_path(s3bucket, key, etag)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.pin(path)
+        try:
+            atomic_fetch(download, path)
+            self.evict(keep=path)
+        except BaseException:
+            self.release(path)
+            raise
+        return path
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits its size cap
+           Args:
+               keep(str): entry that must not be evicted, besides the pinned ones, e.g. the one just added
+           Returns:
+               evicted(list): paths of the removed entries
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = []
+        # the pins are checked and the entries removed under the lock, so an entry is never pinned once removed
+        with self.lock:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep or path in self.pinned:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted.append(path)
+        if evicted:
+            logger.info('%d entries evicted from the S3 cache', len(evicted))
+        return evicted
+
+
+class S3TransferManager:
+    """Move files between the local disk and S3 with one shared client
+
+    Files are transferred concurrently through a thread pool, each with boto3's managed (multipart) transfer, and a
+    file whose ETag, or size when the ETag can not be compared, matches its copy on the other side is skipped.
+    Downloads go through a temporary file and a rename, and through the S3Cache if one is given.
+    """
+
+    def __init__(self, max_workers=4, multipart_chunksize=8 * MB, max_concurrency=4, client=None, cache=None):
+        self.client = client or boto3.client('s3')
+        self.cache = cache
+        self.max_workers = max_workers
+        self.multipart_chunksize = multipart_chunksize
+        self.config = TransferConfig(multipart_threshold=multipart_chunksize, multipart_chunksize=multipart_chunksize,
+                                     max_concurrency=max_concurrency)
+
+    def head(self, s3bucket, key):
+        """Get the metadata of an S3 object
+           Returns:
+               head(dict): response of HeadObject, None if the object does not exist
+        """
+        try:
+            return self.client.head_object(Bucket=s3bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def is_same(self, local_path, head):
+        """Check whether a local file is the same as an S3 object, by ETag or, if that is not comparable, by size"""
+        if head is None or not os.path.exists(local_path) or os.path.getsize(local_path) != head['ContentLength']:
+            return False
+        etag = head['ETag'].strip('"')
+        parts = int(etag.split('-')[1]) if '-' in etag else None
+        computed = local_etag(local_path, self.multipart_chunksize, parts)
+        return computed is None or computed == etag
+
+    def log_throughput(self, action, local_path, s3path, start):
+        """Log the size and speed of a finished transfer"""
+        elapsed = time.time() - start
+        size = os.path.getsize(local_path) / MB
+        logger.info('Data %s from %s to %s: %.1f MB in %.2fs (%.1f MB/s)', action,
+                    local_path if action == 'uploaded' else s3path, s3path if action == 'uploaded' else local_path,
+                    size, elapsed, size / elapsed if elapsed > 0 else float('inf'))
+
+    @profiling.timed()
+    def upload(self, local_path, s3path):
+        """Upload a file unless S3 already has the same content
+           Args:
+               local_path(str): Local path for data file being uploaded
+               s3path(str): S3 path for data file being stored
+           Returns:
+               transferred(bool): False if the file was skipped
+        """
+        s3bucket, key = parse_s3(s3path)
+        if self.is_same(local_path, self.head(s3bucket, key)):
+            logger.info('%s is up to date, skipped', s3path)
+            return False
+        start = time.time()
+        self.client.upload_file(local_path, s3bucket, key, Config=self.config)
+        self.log_throughput('uploaded', local_path, s3path, start)
+        return True
+
+    @profiling.timed()
+    def download(self, local_path, s3path):
+        """Download a file unless the local copy already has the same content
+           Args:
+               local_path(str): Local path for downloaded data to be stored
+               s3path(str): S3 path for data file to be downloaded
+           Returns:
+               transferred(bool): False if the file was skipped
+        """
+        s3bucket, key = parse_s3(s3path)
+        head = self.head(s3bucket, key)
+        if self.is_same(local_path, head):
+            logger.info('%s is up to date, skipped', local_path)
+            return False
+        if head is None:
+            raise FileNotFoundError('%s does not exist' % s3path)
+
+        def fetch(path):
+            self.client.download_file(s3bucket, key, path, Config=self.config)
+
+        start = time.time()
+        if self.cache is None:
+            atomic_fetch(fetch, local_path)
+            self.log_throughput('downloaded', local_path, s3path, start)
+            return True
+        etag = head['ETag'].strip('"')
+        cached = self.cache.get(s3bucket, key, etag)
+        if cached is None:
+            cached = self.cache.put(s3bucket, key, etag, fetch)
+            self.log_throughput('downloaded', cached, s3path, start)
+        else:
+            logger.info('%s served from the cache', s3path)
+        try:
+            atomic_copy(cached, local_path)
+        finally:
+            self.cache.release(cached)
+        return True
+
+    def transfer_all(self, transfer, local_paths, s3paths):
+        """Run one transfer per (local path, S3 path) pair in the thread pool, and raise the first error once every
+        transfer has finished, so that a failed file does not cancel the others
+           Returns:
+               transferred(list): result of each transfer, False if the file was skipped
+        """
+        errors = []
+
+        def run(pair):
+            try:
+                return transfer(*pair)
+            except botocore.exceptions.NoCredentialsError as e:
+                logger.error('Please provide AWS credentials via AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY env variables.')
+                errors.append(e)
+            except (botocore.exceptions.ClientError, OSError) as e:
+                logger.error('Transfer between %s and %s failed: %s', pair[0], pair[1], e)
+                errors.append(e)
+            return None
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            transferred = list(pool.map(run, zip(local_paths, s3paths)))
+        logger.info('%d of %d files transferred, %d skipped, %d failed in %.2fs',
+                    sum(t is True for t in transferred), len(transferred), sum(t is False for t in transferred),
+                    len(errors), time.time() - start)
+        if errors:
+            raise errors[0]
+        return transferred
+
+    def upload_files(self, local_paths, s3paths):
+        """Upload files concurrently, see upload"""
+        return self.transfer_all(self.upload, local_paths, s3paths)
+
+    def download_files(self, local_paths, s3paths):
+        """Download files concurrently, see download"""
+        transferred = self.transfer_all(self.download, local_paths, s3paths)
+        if self.cache is not None:
+            logger.info('S3 cache: %d hits, %d misses', self.cache.hits, self.cache.misses)
+        return transferred
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_transfer_manager():
+    """Get the transfer manager shared by upload_file_to_s3 and download_file_from_s3
+       Returns:
+           manager(S3TransferManager): transfer manager with the default settings and cache
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = S3TransferManager(cache=S3Cache())
+        return _manager
+
+
 def upload_file_to_s3(local_path, s3path):
     """Upload raw data from local to S3 bucket
         Args:
@@ -32,17 +369,7 @@ def upload_file_to_s3(local_path, s3path):
         Returns:
             None
     """
-    s3bucket, s3_just_path = parse_s3(s3path)
-
-    s3 = boto3.resource("s3")
-    bucket = s3.Bucket(s3bucket)
-
-    try:
-        bucket.upload_file(local_path, s3_just_path)
-    except botocore.exceptions.NoCredentialsError:
-        logger.error('Please provide AWS credentials via AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY env variables.')
-    else:
-        logger.info('Data uploaded from %s to %s', local_path, s3path)
+    get_transfer_manager().upload_files([local_path], [s3path])
 
 
 def download_file_from_s3(local_path, s3path):
@@ -53,14 +380,4 @@ def download_file_from_s3(local_path, s3path):
         Returns:
             None
     """
-    s3bucket, s3_just_path = parse_s3(s3path)
-
-    s3 = boto3.resource("s3")
-    bucket = s3.Bucket(s3bucket)
-
-    try:
-        bucket.download_file(s3_just_path, local_path)
-    except botocore.exceptions.NoCredentialsError:
-        logger.error('Please provide AWS credentials via AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY env variables.')
-    else:
-        logger.info('Data downloaded from %s to %s', s3path, local_path)
\ No newline at end of file
+    get_transfer_manager().download_files([local_path], [s3path])
@@ -0,0 +1,201 @@
+import os
+import time
+import bisect
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, from a precomputed lookup to a DB stall
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Quantiles exposed for every histogram
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Phases timed within the requests
+PHASES = ['features', 'inference', 'render']
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time a phase of the current request, e.g. the feature assembly or the model inference, nothing outside a request
+        Args:
+            name(str): one of PHASES
+    """
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of the observations of one labelled series"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Add an observation"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation within its bucket, as Prometheus' histogram_quantile does
+            Returns:
+                value(float): estimated quantile, None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def format_labels(names, values, **extra):
+    """Format the labels of a series in the Prometheus text format, e.g. {endpoint="index",phase="inference"}"""
+    pairs = list(zip(names, values)) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in pairs)
+
+
+class RequestMetrics:
+    """Latency histograms and outcome counters of the app, exposed in the Prometheus text format
+
+    Every request is timed from before_request to after_request, and the time spent in each phase (feature assembly,
+    model inference, template rendering) is collected with ``phase``. The metrics live in the
+    process, so under gunicorn each worker exposes its own series, labelled with its pid.
+    """
+
+    def __init__(self, app=None, prefix='ncaa'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = OrderedDict([
+            ('request_seconds', ('Latency of the requests', ('endpoint', 'status'), {})),
+            ('request_phase_seconds', ('Time spent in each phase of the requests', ('endpoint', 'phase'), {})),
+        ])
+        self.counters = OrderedDict([
+            ('outcomes_total', ('Outcome pages of the form and outcomes of the API predictions',
+                                ('endpoint', 'outcome'), {})),
+        ])
+        self.gauges = []
+        if app is not None:
+            app.before_request(self.start_request)
+            app.after_request(self.finish_request)
+            app.teardown_request(self.clear_request)
+
+    def start_request(self):
+        """Start timing a request"""
+        _local.phases = {}
+        g.metrics_start = time.perf_counter()
+
+    def finish_request(self, response):
+        """Record the latency and the phases of a finished request"""
+        start = g.pop('metrics_start', None)
+        phases = getattr(_local, 'phases', None) or {}
+        if start is not None:
+            endpoint = request.endpoint or 'unknown'
+            self.observe('request_seconds', (endpoint, response.status_code), time.perf_counter() - start)
+            for name, seconds in phases.items():
+                self.observe('request_phase_seconds', (endpoint, name), seconds)
+        return response
+
+    def clear_request(self, exception=None):
+        """Stop collecting the phases of the request, also when it raised"""
+        _local.phases = None
+
+    def observe(self, name, labels, value):
+        """Add an observation to a labelled histogram"""
+        series = self.histograms[name][2]
+        with self.lock:
+            if labels not in series:
+                series[labels] = Histogram()
+            series[labels].observe(value)
+
+    def count(self, outcome, endpoint=None, value=1):
+        """Count an outcome of the current request's endpoint, e.g. the page it rendered"""
+        labels = (endpoint or request.endpoint or 'unknown', outcome)
+        series = self.counters['outcomes_total'][2]
+        with self.lock:
+            series[labels] = series.get(labels, 0) + value
+
+    def add_gauges(self, collect):
+        """Add gauges read at every scrape
+            Args:
+                collect(function): returns a dict of gauge name (without the prefix) to value
+        """
+        self.gauges.append(collect)
+
+    def quantiles(self, name):
+        """Get the p50, p95 and p99 of each series of a histogram
+            Returns:
+                quantiles(dict): labels to a dict of quantile to seconds
+        """
+        with self.lock:
+            return {labels: {q: histogram.quantile(q) for q in QUANTILES}
+                    for labels, histogram in self.histograms[name][2].items()}
+
+    @property
+    def worker(self):
+        """pid of the process, read at every scrape since gunicorn forks the workers after the app is created"""
+        return os.getpid()
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, (description, label_names, series) in self.histograms.items():
+                metric = '%s_%s' % (self.prefix, name)
+                lines += ['# HELP %s %s' % (metric, description), '# TYPE %s histogram' % metric]
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append('%s_bucket%s %d' % (metric, format_labels(label_names, labels, le=bound,
+                                                                               worker=self.worker), cumulative))
+                    lines.append('%s_sum%s %.6f' % (metric, format_labels(label_names, labels, worker=self.worker),
+                                                    histogram.sum))
+                    lines.append('%s_count%s %d' % (metric, format_labels(label_names, labels, worker=self.worker),
+                                                    histogram.count))
+                # the quantiles estimated from the buckets, for the dashboards that do not aggregate the buckets
+                lines += ['# HELP %s_quantile %s, p50/p95/p99 estimated from the buckets' % (metric, description),
+                          '# TYPE %s_quantile gauge' % metric]
+                for labels, histogram in series.items():
+                    for q in QUANTILES:
+                        lines.append('%s_quantile%s %.6f' % (metric, format_labels(label_names, labels, quantile=q,
+                                                                                   worker=self.worker),
+                                                             histogram.quantile(q)))
+            for name, (description, label_names, series) in self.counters.items():
+                metric = '%s_%s' % (self.prefix, name)
+                lines += ['# HELP %s %s' % (metric, description), '# TYPE %s counter' % metric]
+                for labels, value in series.items():
+                    lines.append('%s%s %d' % (metric, format_labels(label_names, labels, worker=self.worker), value))
+        for collect in self.gauges:
+            for name, value in collect().items():
+                metric = '%s_%s' % (self.prefix, name)
+                lines += ['# TYPE %s gauge' % metric, '%s%s %s' % (metric, format_labels((), (), worker=self.worker),
+                                                                    value)]
+        return '\n'.join(lines) + '\n'
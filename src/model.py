@@ -1,47 +1,81 @@
+import time
+import pickle
 import logging
+import warnings
 
+import numpy as np
 import pandas as pd
 from sklearn import metrics
 from sklearn.model_selection import train_test_split
 from sklearn import svm
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+except ImportError:
+    # scikit-learn < 1.0 ships it as experimental
+    from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+    from sklearn.ensemble import HistGradientBoostingClassifier
 
 import src.data_s3 as s3
 import src.data_cleaning as cleaning
+import src.profiling as profiling
 
 logger = logging.getLogger(__name__)
 
+# Estimators train_model can fit, from their keyword arguments. The linear models see standardized features, the
+# stats and the seed are on very different scales
+ESTIMATORS = {
+    'svc': lambda **params: svm.SVC(**params),
+    'logistic': lambda **params: make_pipeline(StandardScaler(), LogisticRegression(**params)),
+    'linear_svm': lambda **params: make_pipeline(StandardScaler(), svm.LinearSVC(**params)),
+    'hist_gb': lambda **params: HistGradientBoostingClassifier(**params),
+}
 
-def acquire_data(s3_paths, local_paths):
+
+@profiling.timed()
+def acquire_data(s3_paths, local_paths, max_workers=4, multipart_chunksize_mb=8, max_concurrency=4,
+                 cache_dir='data/.s3_cache', cache_max_mb=2048):
     """Acquire raw data from S3 bucket
        Args:
            s3_paths(list): list of file names that should be downloaded from S3
            local_paths(list): list of file paths that the acquired data should be stored locally
+           max_workers(int): number of files downloaded concurrently
+           multipart_chunksize_mb(int): part size of multipart downloads in MB
+           max_concurrency(int): number of threads downloading the parts of one file
+           cache_dir(str): directory of the local download cache, None to always download
+           cache_max_mb(int): size cap of the download cache in MB
        Returns:
            None
     """
-    for i in range(len(s3_paths)):
-        s3_path = s3_paths[i]
-        local_path = local_paths[i]
-        s3.download_file_from_s3(local_path, s3_path)
+    cache = s3.S3Cache(cache_dir, cache_max_mb) if cache_dir is not None else None
+    manager = s3.S3TransferManager(max_workers, multipart_chunksize_mb * s3.MB, max_concurrency, cache=cache)
+    manager.download_files(local_paths, s3_paths)
     logger.debug('Acquired raw data')
 
 
-def load_data(input_paths, output_paths):
+@profiling.timed()
+def load_data(input_paths, output_paths, chunksize=None, keep_season=False):
     """Load raw data and make necessary cleaning
        Args:
            input_paths(list): list of file names that should be loaded
            output_paths(list): list of file paths that the loaded and cleaned data should be stored locally
+           chunksize(int): number of regular season games read at a time, None to read the whole file at once
+           keep_season(bool): if True, keep the Season of each game in the model data
        Returns:
            tourney_delta(pd.Dataframe): loaded and cleaned data that is suitable for machine learning model
     """
-    regular_avg = cleaning.get_regular_season_average(input_paths[0], output_paths[0])
+    regular_avg = cleaning.get_regular_season_average(input_paths[0], output_paths[0], chunksize)
     tourney_result = cleaning.get_tourney_result(input_paths[1], output_paths[1])
     tourney_seeds = cleaning.get_tourney_seeds(input_paths[2], output_paths[2])
-    tourney_delta = cleaning.get_tourney_delta(regular_avg, tourney_result, tourney_seeds, output_paths[3])
+    tourney_delta = cleaning.get_tourney_delta(regular_avg, tourney_result, tourney_seeds, output_paths[3],
+                                               keep_season)
     logger.debug('Loaded data')
     return tourney_delta
 
 
+@profiling.timed()
 def featurize(data, columns):
     """Extract features from model data
        Args:
@@ -55,6 +89,7 @@ def featurize(data, columns):
     return features
 
 
+@profiling.timed()
 def get_target(data, column):
     """Extract target from model data
        Args:
@@ -68,6 +103,7 @@ def get_target(data, column):
     return target
 
 
+@profiling.timed(rows='features')
 def split_data(features, target, ratio, random_state):
     """Split train and test data
        Args:
@@ -86,21 +122,97 @@ def split_data(features, target, ratio, random_state):
     return X_train, X_test, y_train, y_test
 
 
-def train_model(X_train, y_train, kernel):
-    """Split train and test data
+@profiling.timed(rows='X_train')
+def train_model(X_train, y_train, estimator='svc', **params):
+    """Train a model
        Args:
            X_train(pd.Dataframe): x variables of train data
            y_train(pd.Series): y variables of test data
-           kernel(str): kernel type of svm
+           estimator(str): one of ESTIMATORS: 'svc', 'logistic', 'linear_svm' or 'hist_gb'
+           params: keyword arguments of the estimator, e.g. kernel='poly' for svc
        Returns:
-           clf(sklearn.svm.SVC): trained svm model
+           clf(sklearn estimator): trained model
     """
-    clf = svm.SVC(kernel=kernel)
+    if estimator not in ESTIMATORS:
+        logger.error('Invalid estimator %s', estimator)
+        raise ValueError('The estimator must be one of %s' % sorted(ESTIMATORS))
+    clf = ESTIMATORS[estimator](**params)
     clf.fit(X_train, y_train)
+    # scikit-learn >= 1.0 records the feature order itself, the model artifact's manifest needs it on older versions
+    if hasattr(X_train, 'columns') and not hasattr(clf, 'feature_names_in_'):
+        clf.feature_names_in_ = np.asarray(X_train.columns, dtype=object)
     logger.debug('Trained model')
     return clf
 
 
+def prediction_latency(clf, X, n_rows=500):
+    """Time single-row predictions the way the app makes them, one decision_function call on a numpy row
+       Args:
+           clf(sklearn estimator): trained model
+           X(pd.Dataframe): rows to predict
+           n_rows(int): number of rows timed
+       Returns:
+           latency(np.ndarray): seconds of each prediction
+    """
+    rows = np.asarray(X, dtype=float)[:n_rows]
+    latency = np.empty(len(rows))
+    with warnings.catch_warnings():
+        # models fitted on a dataframe warn about the missing feature names
+        warnings.simplefilter('ignore', UserWarning)
+        clf.decision_function(rows[:1])
+        for i in range(len(rows)):
+            start = time.perf_counter()
+            clf.decision_function(rows[i:i + 1])
+            latency[i] = time.perf_counter() - start
+    return latency
+
+
+@profiling.timed(rows='X_train')
+def select_model(X_train, y_train, X_test, y_test, candidates, latency_budget_ms=None, n_latency=500):
+    """Train candidate models and pick the most accurate one under a latency budget
+       Args:
+           X_train(pd.Dataframe): x variables of train data
+           y_train(pd.Series): y variables of train data
+           X_test(pd.Dataframe): x variables of test data
+           y_test(pd.Series): y variables of test data
+           candidates(dict): estimator name to its keyword arguments, see train_model
+           latency_budget_ms(float): maximum p99 single-row prediction latency in ms, None for no budget
+           n_latency(int): number of test rows timed for the latency
+       Returns:
+           report(pd.Dataframe): accuracy, train seconds, p50 and p99 latency in ms, pickled size in KB and whether
+                                 it was selected, of each candidate
+           clf(sklearn estimator): selected model, None if no candidate fits the budget
+    """
+    records = []
+    models = {}
+    for estimator, params in candidates.items():
+        start = time.perf_counter()
+        clf = train_model(X_train, y_train, estimator, **(params or {}))
+        train_seconds = time.perf_counter() - start
+        latency = prediction_latency(clf, X_test, n_latency) * 1000
+        models[estimator] = clf
+        records.append({'estimator': estimator,
+                        'accuracy': metrics.accuracy_score(y_test, clf.predict(X_test)),
+                        'train_seconds': train_seconds,
+                        'p50_ms': np.percentile(latency, 50),
+                        'p99_ms': np.percentile(latency, 99),
+                        'size_kb': len(pickle.dumps(clf)) / 1024})
+    report = pd.DataFrame(records).set_index('estimator')
+    eligible = report if latency_budget_ms is None else report[report['p99_ms'] <= latency_budget_ms]
+    report['selected'] = False
+    if eligible.empty:
+        logger.warning('No model has a p99 latency under %s ms', latency_budget_ms)
+        clf = None
+    else:
+        selected = eligible['accuracy'].idxmax()
+        report.loc[selected, 'selected'] = True
+        clf = models[selected]
+        logger.info('Selected %s: accuracy %.3f, p99 latency %.3f ms', selected, report.loc[selected, 'accuracy'],
+                    report.loc[selected, 'p99_ms'])
+    return report.reset_index(), clf
+
+
+@profiling.timed(rows='X_test')
 def make_predict(clf, X_test):
     """Make predictions on test data
        Args:
@@ -114,6 +226,25 @@ def make_predict(clf, X_test):
     return y_pred
 
 
+def predict_win_proba(clf, X):
+    """Predict the probability that the first team of each matchup wins
+       Args:
+           clf(sklearn estimator): trained model, e.g. sklearn.svm.SVC
+           X(np.ndarray): feature deltas, first team minus second team
+       Returns:
+           proba(np.ndarray): probability of class 1 for each row, from predict_proba if the model has it and a
+                              sigmoid of the decision function otherwise (an SVC trained without probability=True)
+    """
+    positive = list(clf.classes_).index(1)
+    try:
+        return clf.predict_proba(X)[:, positive]
+    except AttributeError:
+        score = clf.decision_function(X)
+        # the decision function is positive for classes_[1]
+        return 1 / (1 + np.exp(-score if positive == 1 else score))
+
+
+@profiling.timed(rows='y_test')
 def evaluation(y_test, y_pred):
     """Evaluate model performance
        Args:
@@ -1,13 +1,21 @@
 import os
+import csv
+import time
+import hashlib
 import logging
+import tempfile
+import threading
 
 import sqlalchemy as sql
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, Float, String, MetaData
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, Integer, Float, String, MetaData, Index
 from sqlalchemy.inspection import inspect
 from collections import defaultdict
+import pandas as pd
+
+import src.profiling as profiling
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +45,7 @@ class Regular(Base):
     FGP = Column(Float, unique=False, nullable=False)
     FG3P = Column(Float, unique=False, nullable=False)
     FTP = Column(Float, unique=False, nullable=False)
+    __table_args__ = (Index('ix_regular_season_season_team', 'Season', 'Team', unique=True),)
 
     def __repr__(self):
         return '<Regular %d>' % self.Team
@@ -48,6 +57,7 @@ class Tourney(Base):
     Season = Column(Integer, unique=False, nullable=False)
     Seed = Column(Integer, unique=False, nullable=False)
     TeamID = Column(Integer, unique=False, nullable=False)
+    __table_args__ = (Index('ix_tourney_seeds_season_teamid', 'Season', 'TeamID', unique=True),)
 
     def __repr__(self):
         return '<Tourney %d>' % self.TeamID
@@ -58,11 +68,42 @@ class Teams(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     TeamID = Column(Integer, unique=False, nullable=False)
     TeamName = Column(String(100), unique=False, nullable=False)
+    __table_args__ = (Index('ix_teams_teamid', 'TeamID', unique=True), Index('ix_teams_teamname', 'TeamName'))
 
     def __repr__(self):
         return '<Team_id %d>' % self.TeamID
 
 
+class Matchup(Base):
+    """Precomputed prediction of every ordered pair of seeded teams in a season, for the model whose hash is stored
+    in ingest_state under MATCHUP_MODEL_STATE"""
+    __tablename__ = 'matchups'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    Season = Column(Integer, unique=False, nullable=False)
+    Team1 = Column(Integer, unique=False, nullable=False)
+    Team2 = Column(Integer, unique=False, nullable=False)
+    Team1Wins = Column(Integer, unique=False, nullable=False)
+    Probability = Column(Float, unique=False, nullable=False)
+    __table_args__ = (Index('ix_matchups_season_teams', 'Season', 'Team1', 'Team2', unique=True),)
+
+    def __repr__(self):
+        return '<Matchup %d %d %d>' % (self.Season, self.Team1, self.Team2)
+
+
+class IngestState(Base):
+    """Hash of the rows last ingested into each partition of a table, i.e. each season, or partition 0 for tables
+    that are not split by season. Used by the incremental ingestion to find which seasons changed."""
+    __tablename__ = 'ingest_state'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    TableName = Column(String(100), unique=False, nullable=False)
+    PartitionKey = Column(Integer, unique=False, nullable=False)
+    Hash = Column(String(40), unique=False, nullable=False)
+    __table_args__ = (Index('ix_ingest_state_partition', 'TableName', 'PartitionKey', unique=True),)
+
+    def __repr__(self):
+        return '<IngestState %s %d>' % (self.TableName, self.PartitionKey)
+
+
 def get_engine_string(string):
     """Transform user-typed engine string to actual engine string
         Args:
@@ -90,19 +131,106 @@ def get_engine_string(string):
     return string
 
 
-def create_db(string):
+def create_db(string, local_infile=False):
     """Create the database schema(i.e.tables)
        Args:
            string(str): engine string to specify whether to create database locally or at RDS
+           local_infile(bool): whether to allow LOAD DATA LOCAL INFILE on MySQL, needed by the native ingestion
        Returns:
            engine(sqlalchemy.engine.Engine): engine that is created
     """
     engine_string = get_engine_string(string)
-    engine = sql.create_engine(engine_string)
+    if local_infile and engine_string.startswith('mysql'):
+        engine = sql.create_engine(engine_string, connect_args={'local_infile': True})
+    else:
+        engine = sql.create_engine(engine_string)
     Base.metadata.create_all(engine, checkfirst=True)
+    migrate_indexes(engine)
     return engine
 
 
+def migrate_indexes(engine):
+    """Create the indexes declared in the models that are missing from tables created by an older version
+       Args:
+           engine(sqlalchemy.engine.Engine): engine of the database
+       Returns:
+           created(list): names of the indexes that were created
+    """
+    inspector = sql.inspect(engine)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = [index['column_names'] for index in inspector.get_indexes(table.name)]
+        existing += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table.name)]
+        for index in table.indexes:
+            if [column.name for column in index.columns] in existing:
+                continue
+            try:
+                index.create(bind=engine)
+            except sql.exc.IntegrityError:
+                logger.error('Index %s can not be created, table %s has duplicated %s', index.name, table.name,
+                             [column.name for column in index.columns])
+                raise
+            created.append(index.name)
+            logger.info('Index %s created on table %s', index.name, table.name)
+    return created
+
+
+def app_query_shapes():
+    """The lookups made by the app, with placeholder values
+       Returns:
+           queries(dict): description to SQLAlchemy select statement
+    """
+    return {
+        'team id by name': sql.select([Teams.TeamID]).where(Teams.TeamName == 'Duke'),
+        'regular season by team and season': sql.select([Regular]).where(sql.and_(Regular.Team == 1181,
+                                                                                   Regular.Season == 2019)),
+        'seed by team and season': sql.select([Tourney.Seed]).where(sql.and_(Tourney.TeamID == 1181,
+                                                                             Tourney.Season == 2019)),
+        'matchup by season and teams': sql.select([Matchup.Team1Wins]).where(
+            sql.and_(Matchup.Season == 2019, Matchup.Team1 == 1181, Matchup.Team2 == 1242)),
+    }
+
+
+def explain_query(engine, query):
+    """Get the query plan of a select statement and whether it scans a whole table or index
+       Args:
+           engine(sqlalchemy.engine.Engine): engine of the database, SQLite or MySQL
+           query(sqlalchemy.sql.Select): select statement
+       Returns:
+           plan(list): rows of the EXPLAIN output
+           scans(bool): True if any step of the plan reads a whole table or index
+    """
+    compiled = str(query.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    if engine.dialect.name == 'sqlite':
+        plan = [dict(row) for row in engine.execute(sql.text('EXPLAIN QUERY PLAN ' + compiled))]
+        scans = any(row['detail'].startswith('SCAN') for row in plan)
+    elif engine.dialect.name == 'mysql':
+        plan = [dict(row) for row in engine.execute(sql.text('EXPLAIN ' + compiled))]
+        scans = any(row['type'] in ('ALL', 'index') for row in plan)
+    else:
+        logger.error('Invalid database dialect')
+        raise ValueError('Query plans can only be checked on SQLite and MySQL')
+    return plan, scans
+
+
+def check_query_plans(engine):
+    """Check that none of the app's lookups scans a whole table or index
+       Args:
+           engine(sqlalchemy.engine.Engine): engine of the database, SQLite or MySQL
+       Returns:
+           scanning(list): descriptions of the queries whose plan scans
+    """
+    scanning = []
+    for name, query in app_query_shapes().items():
+        plan, scans = explain_query(engine, query)
+        if scans:
+            scanning.append(name)
+            logger.error('Query "%s" scans: %s', name, plan)
+        else:
+            logger.info('Query "%s" uses an index: %s', name, plan)
+    return scanning
+
+
 def create_session(engine):
     """Create the sql session
        Args:
@@ -115,61 +243,288 @@ def create_session(engine):
     return session
 
 
-def ingest_regular_avg(session, regular_avg):
+# Ways of inserting a dataframe: one ORM object per row, Core executemany in chunks, or the fastest path of the
+# dialect (DBAPI executemany on SQLite, LOAD DATA LOCAL INFILE on MySQL, Core executemany otherwise)
+INGEST_METHODS = ['orm', 'core', 'native']
+
+# ingest_state entry holding the hash of the model file the matchups table was computed with
+MATCHUP_MODEL_STATE = 'matchups_model'
+
+
+def insert_native(session, table, data, chunksize):
+    """Insert a dataframe through the native bulk path of the database dialect
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           table(sqlalchemy.Table): table to insert into
+           data(pd.Dataframe): rows to insert, with the columns named as in the table
+           chunksize(int): number of rows sent per statement
+       Returns:
+           None
+    """
+    dialect = session.get_bind().dialect
+    columns = list(data.columns)
+    if dialect.name == 'mysql':
+        quote = dialect.identifier_preparer.quote
+        for start in range(0, len(data), chunksize):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as f:
+                data.iloc[start:start + chunksize].to_csv(f, index=False, header=False, na_rep='\\N',
+                                                          quoting=csv.QUOTE_MINIMAL)
+            try:
+                session.execute("LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table} FIELDS TERMINATED BY ',' "
+                                "OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({columns})"
+                                .format(path=f.name, table=quote(table.name),
+                                        columns=', '.join(quote(column) for column in columns)))
+            finally:
+                os.remove(f.name)
+    elif dialect.name == 'sqlite':
+        compiled = table.insert().compile(dialect=dialect, column_keys=columns)
+        order = [columns.index(key) for key in compiled.positiontup]
+        cursor = session.connection().connection.cursor()
+        for start in range(0, len(data), chunksize):
+            chunk = data.iloc[start:start + chunksize, order]
+            cursor.executemany(str(compiled), chunk.itertuples(index=False, name=None))
+        cursor.close()
+    else:
+        insert_core(session, table, data, chunksize)
+
+
+def insert_core(session, table, data, chunksize):
+    """Insert a dataframe with Core executemany statements
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           table(sqlalchemy.Table): table to insert into
+           data(pd.Dataframe): rows to insert, with the columns named as in the table
+           chunksize(int): number of rows sent per statement
+       Returns:
+           None
+    """
+    columns = list(data.columns)
+    for start in range(0, len(data), chunksize):
+        chunk = data.iloc[start:start + chunksize]
+        session.execute(table.insert(), [dict(zip(columns, row)) for row in chunk.itertuples(index=False, name=None)])
+
+
+def insert_rows(session, model, data, method, chunksize):
+    """Insert a dataframe into a table with the given ingestion method, without committing
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           model(Base): ORM class of the table
+           data(pd.Dataframe): rows to insert, with the columns named as in the table
+           method(str): one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement for the core and native methods
+       Returns:
+           None
+    """
+    if method not in INGEST_METHODS:
+        logger.error('Invalid ingestion method')
+        raise ValueError('The ingestion method should be one of %s' % INGEST_METHODS)
+    if method == 'orm':
+        session.add_all([model(**line) for line in data.to_dict('records')])
+    elif method == 'core':
+        insert_core(session, model.__table__, data, chunksize)
+    else:
+        insert_native(session, model.__table__, data, chunksize)
+
+
+def partition_hashes(data, partition=None):
+    """Hash the rows of each partition of a dataframe
+       Args:
+           data(pd.Dataframe): rows of a table
+           partition(str): column the table is partitioned by, None to hash the whole dataframe as partition 0
+       Returns:
+           hashes(dict): partition key to hex digest of its rows
+    """
+    groups = [(0, data)] if partition is None else data.groupby(partition)
+    return {int(key): hashlib.sha1(pd.util.hash_pandas_object(group, index=False).values.tobytes()).hexdigest()
+            for key, group in groups}
+
+
+def save_ingest_state(session, table_name, hashes, removed=()):
+    """Record the hashes of the partitions just ingested into a table, without committing
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           table_name(str): name of the ingested table
+           hashes(dict): partition key to hex digest of its rows
+           removed(list): partition keys that no longer exist in the table
+       Returns:
+           None
+    """
+    state = IngestState.__table__
+    keys = list(hashes) + list(removed)
+    if keys:
+        session.execute(state.delete().where(sql.and_(state.c.TableName == table_name, state.c.PartitionKey.in_(keys))))
+    if hashes:
+        session.execute(state.insert(), [{'TableName': table_name, 'PartitionKey': key, 'Hash': value}
+                                         for key, value in hashes.items()])
+
+
+def log_ingested(table_name, rows, start, method):
+    """Log the number of rows ingested into a table and the ingestion speed"""
+    elapsed = time.time() - start
+    logger.info('%d records were added to the table %s in %.2fs (%.0f rows/sec, %s)', rows, table_name, elapsed,
+                rows / elapsed if elapsed > 0 else float('inf'), method)
+
+
+def ingest_dataframe(session, model, data, partition=None, method='core', chunksize=10000, commit=True):
+    """Replace the content of a table with a dataframe
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           model(Base): ORM class of the table
+           data(pd.Dataframe): rows to insert, with the columns named as in the table
+           partition(str): column the table is partitioned by for the incremental ingestion, None if not partitioned
+           method(str): one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement for the core and native methods
+           commit(bool): if False, leave the transaction open for the caller to commit with other tables
+       Returns:
+           None
+    """
+    table = model.__table__
+    start = time.time()
+    session.execute(table.delete())
+    insert_rows(session, model, data, method, chunksize)
+    session.execute(IngestState.__table__.delete().where(IngestState.TableName == table.name))
+    save_ingest_state(session, table.name, partition_hashes(data, partition))
+    if commit:
+        session.commit()
+    log_ingested(table.name, len(data), start, method)
+
+
+def ingest_incremental(session, model, data, partition=None, method='core', chunksize=10000, commit=True):
+    """Update only the partitions of a table whose rows changed since the last ingestion, in a single transaction
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           model(Base): ORM class of the table
+           data(pd.Dataframe): all rows of the table, with the columns named as in the table
+           partition(str): column the table is partitioned by, None to treat the whole table as one partition
+           method(str): one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement for the core and native methods
+           commit(bool): if False, leave the transaction open for the caller to commit with other tables
+       Returns:
+           changed(list): partition keys that were rewritten or removed
+    """
+    table = model.__table__
+    start = time.time()
+    hashes = partition_hashes(data, partition)
+    stored = dict(session.query(IngestState.PartitionKey, IngestState.Hash).filter(IngestState.TableName == table.name))
+    changed = sorted(key for key, value in hashes.items() if stored.get(key) != value)
+    removed = sorted(set(stored) - set(hashes))
+    if not changed and not removed:
+        logger.info('Table %s is up to date', table.name)
+        return []
+
+    # Rewriting a changed partition as delete + insert inside the transaction is the portable upsert: readers keep
+    # seeing the previous rows until the commit, and the unique natural keys make a repeated run a no-op
+    if partition is None:
+        session.execute(table.delete())
+        rows = data
+    else:
+        session.execute(table.delete().where(table.c[partition].in_(changed + removed)))
+        rows = data[data[partition].isin(changed)]
+    insert_rows(session, model, rows, method, chunksize)
+    save_ingest_state(session, table.name, {key: hashes[key] for key in changed}, removed)
+    if commit:
+        session.commit()
+    log_ingested(table.name, len(rows), start, method)
+    logger.info('Partitions %s of the table %s were updated', changed + removed, table.name)
+    return changed + removed
+
+
+@profiling.timed(rows='regular_avg')
+def ingest_regular_avg(session, regular_avg, method='core', chunksize=10000, incremental=False, commit=True):
     """ingest the regular season average dataframe into the sql database
        Args:
            session(sqlalchemy.orm.Session): sql session
            regular_avg(pd.Dataframe): regular season average dataframe
+           method(str): ingestion method, one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement
+           incremental(bool): if True, only update the seasons that changed since the last ingestion
+           commit(bool): if False, leave the transaction open for the caller to commit with other tables
        Returns:
            None
     """
-    session.execute('''DELETE FROM regular_season''')
-    lines = regular_avg.to_dict('records')
-    records = []
-    for line in lines:
-        records.append(Regular(Season=line['Season'], Team=line['Team'], Score=line['Score'], FGM=line['FGM'],
-                               FGA=line['FGA'], FGM3=line['FGM3'], FGA3=line['FGA3'], FTM=line['FTM'],
-                               FTA=line['FTA'], OR=line['OR'], DR=line['DR'], Ast=line['Ast'], TO=line['TO'], Stl=line['Stl'],
-                               Blk=line['Blk'], PF=line['PF'], GP=line['GP'], FGP=line['FGP'], FG3P=line['FG3P'], FTP=line['FTP']))
-    session.add_all(records)
-    session.commit()
-    logger.info(f'{len(records)} records were added to the table')
+    columns = ['Season', 'Team', 'Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl',
+               'Blk', 'PF', 'GP', 'FGP', 'FG3P', 'FTP']
+    ingest = ingest_incremental if incremental else ingest_dataframe
+    ingest(session, Regular, regular_avg[columns], 'Season', method, chunksize, commit)
 
 
-def ingest_tourney_seeds(session, seeds):
+@profiling.timed(rows='seeds')
+def ingest_tourney_seeds(session, seeds, method='core', chunksize=10000, incremental=False, commit=True):
     """ingest the tourney seeds dataframe into the sql database
        Args:
            session(sqlalchemy.orm.Session): sql session
            seeds(pd.Dataframe): tourney seeds dataframe
+           method(str): ingestion method, one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement
+           incremental(bool): if True, only update the seasons that changed since the last ingestion
+           commit(bool): if False, leave the transaction open for the caller to commit with other tables
        Returns:
            None
     """
-    session.execute('''DELETE FROM tourney_seeds''')
-    lines = seeds.to_dict('records')
-    records = []
-    for line in lines:
-        records.append(Tourney(Season=line['Season'], Seed=line['Seed'], TeamID=line['TeamID']))
-    session.add_all(records)
-    session.commit()
-    logger.info(f'{len(records)} records were added to the table')
+    ingest = ingest_incremental if incremental else ingest_dataframe
+    ingest(session, Tourney, seeds[['Season', 'Seed', 'TeamID']], 'Season', method, chunksize, commit)
 
 
-def ingest_teams(session, teams):
+@profiling.timed(rows='teams')
+def ingest_teams(session, teams, method='core', chunksize=10000, incremental=False, commit=True):
     """ingest the teams dataframe into the sql database
        Args:
            session(sqlalchemy.orm.Session): sql session
            teams(pd.Dataframe): teams dataframe
+           method(str): ingestion method, one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement
+           incremental(bool): if True, only rewrite the table if the teams changed since the last ingestion
+           commit(bool): if False, leave the transaction open for the caller to commit with other tables
        Returns:
            None
     """
-    session.execute('''DELETE FROM teams''')
-    lines = teams.to_dict('records')
-    records = []
-    for line in lines:
-        records.append(Teams(TeamID=line['TeamID'], TeamName=line['TeamName']))
-    session.add_all(records)
+    ingest = ingest_incremental if incremental else ingest_dataframe
+    ingest(session, Teams, teams[['TeamID', 'TeamName']], None, method, chunksize, commit)
+
+
+@profiling.timed(rows='matchups')
+def ingest_matchups(session, matchups, model_hash, method='core', chunksize=10000):
+    """Replace the precomputed matchups and the hash of their model in a single transaction
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+           matchups(pd.Dataframe): Season, Team1, Team2, Team1Wins and Probability of each ordered pair of teams
+           model_hash(str): hex digest of the model file the predictions were made with
+           method(str): ingestion method, one of INGEST_METHODS
+           chunksize(int): number of rows sent per statement
+       Returns:
+           None
+    """
+    table = Matchup.__table__
+    start = time.time()
+    session.execute(table.delete())
+    insert_rows(session, Matchup, matchups[['Season', 'Team1', 'Team2', 'Team1Wins', 'Probability']], method,
+                chunksize)
+    save_ingest_state(session, MATCHUP_MODEL_STATE, {0: model_hash})
     session.commit()
-    logger.info(f'{len(records)} records were added to the table')
+    log_ingested(table.name, len(matchups), start, method)
+
+
+def get_matchup_model_hash(session):
+    """Get the hash of the model file the precomputed matchups were computed with
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+       Returns:
+           model_hash(str): hex digest, None if no matchups were precomputed
+    """
+    state = session.query(IngestState.Hash).filter(IngestState.TableName == MATCHUP_MODEL_STATE).first()
+    return state[0] if state is not None else None
+
+
+def load_matchups(session):
+    """Get every precomputed matchup, loaded once by the app so that a prediction is a lookup in memory
+       Args:
+           session(sqlalchemy.orm.Session): sql session
+       Returns:
+           matchups(list): Season, Team1, Team2, Team1Wins and Probability of each precomputed matchup
+    """
+    table = Matchup.__table__
+    return session.execute(sql.select([table.c.Season, table.c.Team1, table.c.Team2, table.c.Team1Wins,
+                                       table.c.Probability])).fetchall()
 
 
 def query_to_dict(rset):
@@ -187,18 +542,135 @@ def query_to_dict(rset):
     return result
 
 
+class PoolMetrics:
+    """Counters of a connection pool, updated by the pool events and by TimedQueuePool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds):
+        """Add the wait of one checkout"""
+        with self.lock:
+            self.wait_count += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self):
+        """Count a checkout that timed out waiting for a connection"""
+        with self.lock:
+            self.timeouts += 1
+
+    def listen(self, engine):
+        """Count the new connections, checkouts and checkins of an engine's pool"""
+        def count(name):
+            def listener(*args):
+                with self.lock:
+                    setattr(self, name, getattr(self, name) + 1)
+            return listener
+        sql.event.listen(engine, 'connect', count('connects'))
+        sql.event.listen(engine, 'checkout', count('checkouts'))
+        sql.event.listen(engine, 'checkin', count('checkins'))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a free connection in its PoolMetrics"""
+
+    def __init__(self, *args, **kwargs):
+        self.metrics = PoolMetrics()
+        super().__init__(*args, **kwargs)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sql.exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - start)
+
+
+# Pool settings of the engines of server databases, in each process (each gunicorn worker): at most DB_POOL_SIZE +
+# DB_MAX_OVERFLOW connections, checked with a ping before use and recycled before RDS drops them as idle. SQLite keeps
+# the pool SQLAlchemy picks for it
+POOL_OPTIONS = {'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+                'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+                'pool_timeout': 10, 'pool_recycle': 1800, 'pool_pre_ping': True}
+
+
 class NCAAManager:
+    """Own the engine of the app or of a script and its sessions
 
-    def __init__(self, app=None, engine_string=None):
+    The session is a scoped_session, one session per thread. With a Flask app it is removed, and its connection
+    returned to the pool, in a teardown hook at the end of every request.
+    """
+
+    def __init__(self, app=None, engine_string=None, engine_options=None):
+        """
+            Args:
+                app(flask.Flask): app configured with SQLALCHEMY_DATABASE_URI, and optionally SQLALCHEMY_ENGINE_OPTIONS
+                                  and SQLALCHEMY_ECHO
+                engine_string(str): SQLAlchemy connection URI, if no app is given
+                engine_options(dict): create_engine keyword arguments, default POOL_OPTIONS for server databases
+        """
         if app:
-            self.db = SQLAlchemy(app)
-            self.session = self.db.session
-        elif engine_string:
-            engine = sql.create_engine(engine_string)
-            Session = sessionmaker(bind=engine)
-            self.session = Session()
-        else:
+            engine_string = app.config['SQLALCHEMY_DATABASE_URI']
+            engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', engine_options)
+        elif not engine_string:
             raise ValueError("Please provide an engine string or a Flask app to initialize")
-
-        def close(self):
-            self.session.close()
\ No newline at end of file
+        if engine_options is None:
+            engine_options = {} if engine_string.startswith('sqlite') else POOL_OPTIONS
+        engine_options = dict(engine_options)
+        if app:
+            engine_options.setdefault('echo', app.config.get('SQLALCHEMY_ECHO', False))
+        if not engine_string.startswith('sqlite'):
+            engine_options.setdefault('poolclass', TimedQueuePool)
+
+        self.engine = sql.create_engine(engine_string, **engine_options)
+        self.metrics = getattr(self.engine.pool, 'metrics', PoolMetrics())
+        self.metrics.listen(self.engine)
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+        if app:
+            app.teardown_appcontext(self.remove_session)
+
+    def remove_session(self, exception=None):
+        """Close the session of the current thread and return its connection to the pool"""
+        self.session.remove()
+
+    def close(self):
+        """Close the sessions and all the pooled connections"""
+        self.session.remove()
+        self.engine.dispose()
+
+    def pool_metrics(self):
+        """Get the state and counters of the connection pool
+            Returns:
+                metrics(dict): pool size, connections checked out and overflow (QueuePool only), number of new
+                               connections, checkouts, checkins and checkout timeouts, mean and max checkout wait in ms
+        """
+        pool = self.engine.pool
+        metrics = self.metrics
+        with metrics.lock:
+            result = {'connects': metrics.connects, 'checkouts': metrics.checkouts, 'checkins': metrics.checkins,
+                      'timeouts': metrics.timeouts,
+                      'mean_wait_ms': 1000 * metrics.wait_seconds / metrics.wait_count if metrics.wait_count else 0.0,
+                      'max_wait_ms': 1000 * metrics.max_wait_seconds}
+        if isinstance(pool, QueuePool):
+            result.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return result
+
+    def log_pool_metrics(self):
+        """Log the pool metrics"""
+        logger.info('Connection pool: %s', ', '.join('%s=%s' % item for item in sorted(self.pool_metrics().items())))
@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import yaml
+
+import src.artifacts as artifacts
+import src.model as model
+from src.registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# A step of the model pipeline:
+#   function(inputs, params) returns one object per output path
+#   inputs: artifact paths loaded and passed to the function
+#   outputs: artifact paths the returned objects are saved to
+#   params: config.yaml section of the step, passed as keyword arguments
+#   files: other files the function reads by itself, hashed with the inputs
+#   produces: other files the function writes by itself
+Step = namedtuple('Step', ['name', 'function', 'inputs', 'outputs', 'params', 'files', 'produces'])
+
+
+def train_and_publish(inputs, params, registry=None):
+    """Train the model and publish it as a new version of the model registry
+        Args:
+            inputs(list): X_train and y_train
+            params(dict): keyword arguments of train_model
+            registry(ModelRegistry): registry the model is published to, None to only train it
+        Returns:
+            clf(sklearn estimator): trained model
+    """
+    clf = model.train_model(inputs[0], inputs[1], **params)
+    if registry is not None:
+        registry.publish(clf)
+    return clf
+
+
+def build_steps(config, publish=True):
+    """Build the steps of the model pipeline from the configuration
+        Args:
+            config(dict): content of config.yaml
+            publish(bool): publish the trained model to the model registry under registry in config.yaml, if its
+                           publish setting is on
+        Returns:
+            steps(list): list of Step
+    """
+    paths = config['pipeline']['artifacts']
+    params = config['model']
+    registry = None
+    if publish and config.get('registry', {}).get('publish'):
+        registry = ModelRegistry(config['registry']['root'])
+    return [
+        Step('acquire', lambda inputs, p: model.acquire_data(**p), [], [], params['acquire_data'], [],
+             params['acquire_data']['local_paths']),
+        Step('load', lambda inputs, p: model.load_data(**p), [], [paths['model_data']], params['load_data'],
+             params['load_data']['input_paths'], params['load_data']['output_paths']),
+        Step('featurize', lambda inputs, p: model.featurize(inputs[0], **p), [paths['model_data']],
+             [paths['features']], params['featurize'], [], []),
+        Step('target', lambda inputs, p: model.get_target(inputs[0], **p), [paths['model_data']],
+             [paths['target']], params['get_target'], [], []),
+        Step('split', lambda inputs, p: model.split_data(inputs[0], inputs[1], **p),
+             [paths['features'], paths['target']],
+             [paths['X_train'], paths['X_test'], paths['y_train'], paths['y_test']], params['split_data'], [], []),
+        Step('train', lambda inputs, p: train_and_publish(inputs, p, registry),
+             [paths['X_train'], paths['y_train']], [paths['clf']], params['train_model'], [], []),
+        Step('predict', lambda inputs, p: model.make_predict(inputs[0], inputs[1]), [paths['clf'], paths['X_test']],
+             [paths['y_pred']], {}, [], []),
+        Step('evaluate', lambda inputs, p: model.evaluation(inputs[0], inputs[1]), [paths['y_test'], paths['y_pred']],
+             [paths['model_result']], {}, [], []),
+        Step('select', lambda inputs, p: model.select_model(*inputs, **p)[0],
+             [paths['X_train'], paths['y_train'], paths['X_test'], paths['y_test']], [paths['model_selection']],
+             params['select_model'], [], []),
+    ]
+
+
+def file_hash(path):
+    """Hash the content of a file, or of the manifest of a model artifact, which holds the hash of its estimator
+        Args:
+            path(str): file path
+        Returns:
+            digest(str): sha256 hex digest of the file
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, artifacts.MANIFEST)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def step_key(step):
+    """Hash everything a step's outputs depend on: its name, its config section and the content of its inputs
+        Args:
+            step(Step): pipeline step
+        Returns:
+            key(str): sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(step.name.encode())
+    digest.update(yaml.safe_dump(step.params, default_flow_style=False).encode())
+    for path in step.inputs + step.files:
+        digest.update(path.encode())
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+class Pipeline:
+    """Run pipeline steps in one process as a dependency graph
+
+    A step depends on the steps that write its inputs. Steps whose dependencies are done run in parallel threads,
+    and a step is skipped when the hash of its inputs and config is the one recorded in the cache for its current
+    outputs. Outputs are kept in memory for the downstream steps, so each artifact is read at most once.
+    """
+
+    def __init__(self, steps, cache_path, max_workers=4, force=False):
+        self.steps = steps
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.force = force
+        self.data = {}
+        self.lock = threading.Lock()
+        writers = {path: step.name for step in steps for path in step.outputs + step.produces}
+        self.dependencies = {step.name: {writers[path] for path in step.inputs + step.files if path in writers}
+                             for step in steps}
+
+    def read_cache(self):
+        """Read the keys and output hashes of the last successful run of each step"""
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, 'r') as f:
+            return json.load(f)
+
+    def write_cache(self, cache):
+        """Atomically write the cache, so an interrupted run never leaves it half written"""
+        with open(self.cache_path + '.tmp', 'w') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(self.cache_path + '.tmp', self.cache_path)
+
+    def is_cached(self, step, key, cache):
+        """Check whether the outputs of a step are still those computed from the same key"""
+        entry = cache.get(step.name)
+        if self.force or entry is None or entry['key'] != key:
+            return False
+        for path, digest in entry['outputs'].items():
+            if not os.path.exists(path) or file_hash(path) != digest:
+                return False
+        return True
+
+    def load(self, path):
+        """Get an artifact from memory, or from disk if it was written by a previous run"""
+        with self.lock:
+            if path not in self.data:
+                self.data[path] = artifacts.load_artifact(path)
+            return self.data[path]
+
+    def run_step(self, step, cache):
+        """Run a step unless its cached outputs are still valid
+            Args:
+                step(Step): pipeline step
+                cache(dict): step name to key and output hashes of its last run
+            Returns:
+                ran(bool): False if the step was skipped
+        """
+        key = step_key(step)
+        if self.is_cached(step, key, cache):
+            logger.info('Step %s is up to date, skipped', step.name)
+            return False
+        logger.info('Running step %s', step.name)
+        result = step.function([self.load(path) for path in step.inputs], step.params)
+        results = [result] if len(step.outputs) == 1 else list(result or [])
+        for path, data in zip(step.outputs, results):
+            artifacts.save_artifact(data, path)
+            with self.lock:
+                self.data[path] = data
+        missing = [path for path in step.outputs + step.produces if not os.path.exists(path)]
+        if missing:
+            logger.error('Step %s did not write %s', step.name, missing)
+            raise RuntimeError('Step %s did not write its outputs' % step.name)
+        with self.lock:
+            cache[step.name] = {'key': key, 'outputs': {path: file_hash(path) for path in step.outputs + step.produces}}
+            self.write_cache(cache)
+        return True
+
+    def run(self):
+        """Run all steps in dependency order, independent steps in parallel
+            Returns:
+                ran(dict): step name to whether it ran (True) or was skipped (False)
+        """
+        cache = self.read_cache()
+        pending = list(self.steps)
+        ran = {}
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or futures:
+                for step in [step for step in pending if self.dependencies[step.name] <= set(ran)]:
+                    pending.remove(step)
+                    futures[pool.submit(self.run_step, step, cache)] = step
+                if not futures:
+                    logger.error('Steps %s depend on each other', [step.name for step in pending])
+                    raise ValueError('The pipeline steps have a circular dependency')
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    ran[futures.pop(future).name] = future.result()
+        logger.info('Pipeline done, %d steps ran and %d were skipped', sum(ran.values()),
+                    len(ran) - sum(ran.values()))
+        return ran
@@ -0,0 +1,415 @@
+import os
+import time
+import hashlib
+import logging
+import pickle
+import warnings
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import src.ncaa_db as db
+import src.model as model
+import src.artifacts as artifacts
+import src.profiling as profiling
+from src.metrics import phase
+from src.ncaa_db import Regular, Tourney, Teams
+from src.data_cleaning import STAT_COLUMNS
+from src.team_names import TeamNameIndex
+from src.registry import ACTIVE, SHADOW
+
+logger = logging.getLogger(__name__)
+
+# Everything a prediction needs, swapped in as one object so a reload never exposes a half-built state
+# model_stamp is the modification time of the model file, or the stamp of the registry's ACTIVE pointer, checked
+# before every prediction, model_version the registry version (None for a model file), precomputed is True when
+# the matchups table was computed with the loaded model, and matchups holds that table in memory, keyed by the feature
+# rows of both teams, which also identify the season
+EngineState = namedtuple('EngineState', ['clf', 'model_stamp', 'model_version', 'model_hash', 'names', 'rows',
+                                         'features', 'precomputed', 'matchups'])
+
+
+def to_season(season):
+    """Transform the user-typed season into an integer season
+        Args:
+            season(str/int): season entered in the form
+        Returns:
+            season(int): integer season, None if the input is not a valid season
+    """
+    try:
+        return int(season)
+    except (TypeError, ValueError):
+        return None
+
+
+class PredictionEngine:
+    """Hold the trained model and the features of every (Season, TeamID) in memory
+
+    The feature matrix has one row per team and season that played in the regular season, with the regular
+    season averages in the order of STAT_COLUMNS followed by the tourney seed (NaN if the team was not seeded),
+    so that a matchup prediction is two row lookups, a subtraction and one ``decision_function`` call. When the
+    matchups table was precomputed with the same model file, it is loaded with the model and a prediction is a
+    single dict lookup in it instead.
+    Team names are resolved with a TeamNameIndex of the team names and their alternate spellings.
+
+    With a ModelRegistry, the engine serves the registry's active version, and falls back to model_path while none
+    is active. When the ACTIVE pointer changes, the request that notices it loads the new version while the other
+    requests keep predicting with the previous state, which is then swapped for the new one in one assignment, so no
+    request waits for the load or sees a half-loaded model. A version that fails to load is logged and the previous
+    one is still served. With a ShadowScorer, the version named by the SHADOW pointer scores the same matchups.
+    """
+
+    def __init__(self, model_path, session, spellings_path=None, registry=None, shadow=None):
+        self.model_path = model_path
+        self.session = session
+        self.spellings_path = spellings_path
+        self.registry = registry
+        self.shadow = shadow
+        self.state = None
+        self.load_seconds = None
+        # one thread loads a model at a time, the others keep serving the current state
+        self.lock = threading.Lock()
+        self.failed_stamp = None
+        self.shadow_stamp = None
+
+    def model_stamp(self):
+        """Get the stamp of the model to serve, one stat call: the stamp of the registry's ACTIVE pointer, or the
+        modification time of the model file, the manifest's for a model artifact since it is written last"""
+        if self.registry is not None:
+            stamp = self.registry.pointer_stamp(ACTIVE)
+            if stamp is not None:
+                return stamp
+        if os.path.isdir(self.model_path):
+            return os.path.getmtime(os.path.join(self.model_path, artifacts.MANIFEST))
+        return os.path.getmtime(self.model_path)
+
+    def model_source(self):
+        """Get the model to serve
+            Returns:
+                version(str): active version of the registry, None if the model file is served
+                path(str): path of the model
+        """
+        version = None if self.registry is None else self.registry.active()
+        if version is None:
+            return None, self.model_path
+        return version, self.registry.path(version)
+
+    def load_model(self, path):
+        """Load a trained model from disk, a .model artifact with its arrays memory-mapped or a pickled model
+            Args:
+                path(str): path of the model
+            Returns:
+                clf(sklearn estimator): trained model
+                model_hash(str): sha256 hex digest of the artifact's estimator file from its manifest, sha1 hex digest
+                                 of a pickled model file
+        """
+        start = time.perf_counter()
+        if os.path.isdir(path):
+            clf, manifest = artifacts.load_model(path)
+            features = STAT_COLUMNS + ['Seed']
+            if manifest['features'] is not None and manifest['features'] != features:
+                logger.error('Model %s was trained on the features %s', path, manifest['features'])
+                raise ValueError('The model features do not match the features of the engine')
+            model_hash = manifest['sha256']
+        else:
+            with open(path, 'rb') as f:
+                content = f.read()
+            clf = pickle.loads(content)
+            model_hash = hashlib.sha1(content).hexdigest()
+        # the engine predicts on numpy rows in the order of STAT_COLUMNS and the seed, and a model fitted on a dataframe
+        # would warn about their missing feature names on every call, so the warning is silenced once for the process
+        warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+        self.load_seconds = time.perf_counter() - start
+        logger.info('Model loaded from %s in %.1fms, process resident memory %.1fMB', path, 1000 * self.load_seconds,
+                    profiling.rss_mb() or 0.0)
+        return clf, model_hash
+
+    def load_features(self):
+        """Load the teams, regular season averages and tourney seeds from the database
+            Returns:
+                names(TeamNameIndex): index of the team names and spellings
+                rows(dict): (season, team id) to row index of the feature matrix
+                features(np.ndarray): feature matrix
+        """
+        teams = self.session.query(Teams.TeamName, Teams.TeamID).all()
+        if self.spellings_path is None:
+            names = TeamNameIndex(teams)
+        else:
+            names = TeamNameIndex.from_csv(teams, self.spellings_path)
+
+        columns = [getattr(Regular, column) for column in STAT_COLUMNS]
+        regular = self.session.query(Regular.Season, Regular.Team, *columns).all()
+        rows = {}
+        features = np.full((len(regular), len(STAT_COLUMNS) + 1), np.nan)
+        for i, record in enumerate(regular):
+            rows[(record[0], record[1])] = i
+            features[i, :-1] = record[2:]
+
+        for season, team_id, seed in self.session.query(Tourney.Season, Tourney.TeamID, Tourney.Seed):
+            row = rows.get((season, team_id))
+            if row is not None:
+                features[row, -1] = seed
+        logger.info('Features of %d teams loaded for %d seasons, %d team spellings indexed', len(names.names),
+                    len({key[0] for key in rows}), len(names))
+        return names, rows, features
+
+    def load_state(self, loaded=None):
+        """Load the model to serve, and the features unless they are given
+            Args:
+                loaded(tuple): names, rows and features of the current state, see load_features
+            Returns:
+                state(EngineState): new engine state
+        """
+        stamp = self.model_stamp()
+        version, path = self.model_source()
+        clf, model_hash = self.load_model(path)
+        names, rows, features = loaded or self.load_features()
+        precomputed = db.get_matchup_model_hash(self.session) == model_hash
+        matchups = None
+        if precomputed:
+            matchups = self.load_matchups(rows)
+        else:
+            logger.warning('The matchups table was not computed with %s, predictions use the model', path)
+        return EngineState(clf, stamp, version, model_hash, names, rows, features, precomputed, matchups)
+
+    def load_matchups(self, rows):
+        """Load the precomputed matchups from the database
+            Args:
+                rows(dict): (season, team id) to row index of the feature matrix, see load_features
+            Returns:
+                matchups(dict): (row of team1, row of team2) to (Team1Wins, Probability)
+        """
+        matchups = {}
+        for season, team1, team2, team1_wins, probability in db.load_matchups(self.session):
+            row1, row2 = rows.get((season, team1)), rows.get((season, team2))
+            if row1 is not None and row2 is not None:
+                matchups[(row1, row2)] = (team1_wins, probability)
+        logger.info('%d precomputed matchups loaded', len(matchups))
+        return matchups
+
+    def reload(self):
+        """Reload the model and the features, to be called when the database changes"""
+        with self.lock:
+            self.state = self.load_state()
+            self.failed_stamp = None
+
+    def swap_model(self, stamp):
+        """Swap in the model to serve, keeping the features, or keep the current one if it fails to load
+            Args:
+                stamp(object): model stamp that triggered the swap, not retried if the load fails
+        """
+        state = self.state
+        try:
+            new_state = self.load_state((state.names, state.rows, state.features))
+        except Exception:
+            logger.exception('Model not swapped, still serving %s', state.model_version or self.model_path)
+            self.failed_stamp = stamp
+            return
+        self.state = new_state
+        self.failed_stamp = None
+        if self.shadow is not None:
+            self.shadow.reset()
+        logger.info('Serving model %s instead of %s', new_state.model_version or self.model_path,
+                    state.model_version or self.model_path)
+
+    def swap_shadow(self, stamp):
+        """Load the model named by the registry's SHADOW pointer into the shadow scorer, or stop it if unset
+            Args:
+                stamp(tuple): stamp of the SHADOW pointer
+        """
+        self.shadow_stamp = stamp
+        version = self.registry.shadow()
+        if version is None:
+            self.shadow.set_model(None)
+            return
+        try:
+            self.shadow.set_model(self.load_model(self.registry.path(version))[0], version)
+        except Exception:
+            logger.exception('Shadow model %s not loaded', version)
+            self.shadow.set_model(None)
+
+    def reload_if_changed(self):
+        """Load the engine if it has not been loaded yet, and swap in the model to serve and the shadow model if
+        they changed since, unless another thread is already loading one
+            Returns:
+                state(EngineState): state to predict with
+        """
+        if self.state is None:
+            with self.lock:
+                if self.state is None:
+                    self.state = self.load_state()
+            return self.state
+        stamp = self.model_stamp()
+        if stamp != self.state.model_stamp and stamp != self.failed_stamp and self.lock.acquire(blocking=False):
+            try:
+                if stamp != self.state.model_stamp:
+                    self.swap_model(stamp)
+            finally:
+                self.lock.release()
+        if self.shadow is not None and self.registry is not None:
+            shadow_stamp = self.registry.pointer_stamp(SHADOW)
+            if shadow_stamp != self.shadow_stamp and self.lock.acquire(blocking=False):
+                try:
+                    self.swap_shadow(shadow_stamp)
+                finally:
+                    self.lock.release()
+        return self.state
+
+    def season_features(self, season, team_ids):
+        """Get the feature rows of teams in a season
+            Args:
+                season(int): season
+                team_ids(list): team ids
+            Returns:
+                features(np.ndarray): one feature row per team, None if a team did not play in the season
+        """
+        state = self.reload_if_changed()
+        rows = [state.rows.get((season, team_id)) for team_id in team_ids]
+        if None in rows:
+            return None
+        return state.features[rows]
+
+    def suggest(self, names, limit=5):
+        """Suggest known teams for unknown team names
+            Args:
+                names(list): typed names, e.g. the result of a 'no_team' prediction
+                limit(int): maximum number of suggestions per name
+            Returns:
+                suggestions(dict): each name to the names of the closest teams
+        """
+        state = self.reload_if_changed()
+        return {name: state.names.suggest(name, limit) for name in names}
+
+    def complete(self, prefix, limit=10):
+        """Get the teams with a spelling starting with a prefix, see TeamNameIndex.complete"""
+        return self.reload_if_changed().names.complete(prefix, limit)
+
+    def precompute_matchups(self):
+        """Predict every ordered pair of seeded teams of every season with one model call
+            Returns:
+                matchups(pd.Dataframe): Season, Team1, Team2, Team1Wins and Probability (that Team1 wins)
+                model_hash(str): hex digest of the model the predictions were made with
+        """
+        state = self.reload_if_changed()
+        keys = sorted(key for key, row in state.rows.items() if not np.isnan(state.features[row, -1]))
+        seeded = pd.DataFrame(keys, columns=['Season', 'Team'])
+        seeded['row'] = [state.rows[key] for key in keys]
+        pairs = seeded.merge(seeded, on='Season', suffixes=('1', '2'))
+        pairs = pairs[pairs['Team1'] != pairs['Team2']].reset_index(drop=True)
+        delta = state.features[pairs['row1'].values] - state.features[pairs['row2'].values]
+        score = state.clf.decision_function(delta)
+        # the same rule as a live prediction
+        pairs['Team1Wins'] = (state.clf.classes_[(score > 0).astype(int)] == 1).astype(int)
+        pairs['Probability'] = model.predict_win_proba(state.clf, delta)
+        logger.info('%d matchups of %d seasons predicted', len(pairs), pairs['Season'].nunique())
+        return pairs[['Season', 'Team1', 'Team2', 'Team1Wins', 'Probability']], state.model_hash
+
+    def check_matchup(self, state, team1, team2, season):
+        """Resolve the teams of a matchup to their ids and feature rows
+            Args:
+                state(EngineState): loaded engine state
+                team1(str): name of the first team
+                team2(str): name of the second team
+                season(str/int): season of the matchup
+            Returns:
+                outcome(str): None if the matchup can be predicted, else 'no_team', 'no_season' or 'no_tourney'
+                result(tuple/list): (season, team ids, feature rows) if outcome is None, else the names of the invalid
+                                    teams
+        """
+        teams = [team1, team2]
+
+        ids = [state.names.resolve(team) for team in teams]
+        if None in ids:
+            return 'no_team', [team for team, team_id in zip(teams, ids) if team_id is None]
+
+        season = to_season(season)
+        rows = [state.rows.get((season, team_id)) for team_id in ids]
+        if None in rows:
+            return 'no_season', [team for team, row in zip(teams, rows) if row is None]
+
+        seeded = [not np.isnan(state.features[row, -1]) for row in rows]
+        if not all(seeded):
+            return 'no_tourney', [team for team, is_seeded in zip(teams, seeded) if not is_seeded]
+        return None, (season, ids, rows)
+
+    def predict_matchup(self, team1, team2, season):
+        """Predict the winner of a matchup
+            Args:
+                team1(str): name of the first team
+                team2(str): name of the second team
+                season(str/int): season of the matchup
+            Returns:
+                outcome(str): 'prediction', 'no_team', 'no_season' or 'no_tourney'
+                result(str/list): predicted winner if outcome is 'prediction', else the names of the invalid teams
+        """
+        state = self.reload_if_changed()
+        with phase('features'):
+            outcome, result = self.check_matchup(state, team1, team2, season)
+        if outcome is not None:
+            return outcome, result
+        season, ids, rows = result
+
+        if state.precomputed:
+            matchup = state.matchups.get((rows[0], rows[1]))
+            if matchup is not None:
+                if self.shadow is not None:
+                    self.shadow.submit(state.features, [rows], [matchup[0] == 1])
+                return 'prediction', team1 if matchup[0] == 1 else team2
+
+        with phase('features'):
+            delta = state.features[rows[0]] - state.features[rows[1]]
+        start = time.perf_counter()
+        with phase('inference'):
+            score = state.clf.decision_function(delta.reshape(1, -1))[0]
+        predicted = state.clf.classes_[int(score > 0)]
+        if self.shadow is not None:
+            self.shadow.submit(state.features, [rows], [predicted == 1], time.perf_counter() - start)
+        return 'prediction', team1 if predicted == 1 else team2
+
+    def predict_matchups(self, matchups):
+        """Predict a batch of matchups, from the precomputed matchups held in memory if there are, and with one model
+        call for the others
+            Args:
+                matchups(list): (team1, team2, season) tuples
+            Returns:
+                predictions(list): (outcome, result, probability) of each matchup, see predict_matchup, with the
+                                   probability that team1 wins, None if outcome is not 'prediction'
+        """
+        state = self.reload_if_changed()
+        predictions = [None] * len(matchups)
+        valid = {}
+        with phase('features'):
+            for i, (team1, team2, season) in enumerate(matchups):
+                outcome, result = self.check_matchup(state, team1, team2, season)
+                if outcome is None:
+                    valid[i] = result
+                else:
+                    predictions[i] = (outcome, result, None)
+
+        if state.precomputed and valid:
+            looked_up = []
+            for i, (season, ids, rows) in list(valid.items()):
+                matchup = state.matchups.get((rows[0], rows[1]))
+                if matchup is not None:
+                    predictions[i] = ('prediction', matchups[i][0] if matchup[0] == 1 else matchups[i][1], matchup[1])
+                    looked_up.append((rows, matchup[0] == 1))
+                    del valid[i]
+            if self.shadow is not None and looked_up:
+                self.shadow.submit(state.features, [rows for rows, _ in looked_up], [wins for _, wins in looked_up])
+
+        if valid:
+            with phase('features'):
+                pairs = np.array([rows for _, _, rows in valid.values()])
+                delta = state.features[pairs[:, 0]] - state.features[pairs[:, 1]]
+            with phase('inference'):
+                start = time.perf_counter()
+                predicted = state.clf.classes_[(state.clf.decision_function(delta) > 0).astype(int)]
+                seconds = time.perf_counter() - start
+                probability = model.predict_win_proba(state.clf, delta)
+            if self.shadow is not None:
+                self.shadow.submit(state.features, pairs, predicted == 1, seconds)
+            for i, winner, p in zip(valid, predicted, probability):
+                predictions[i] = ('prediction', matchups[i][0] if winner == 1 else matchups[i][1], float(p))
+        return predictions
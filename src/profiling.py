@@ -0,0 +1,283 @@
+import io
+import os
+import json
+import numbers
+import time
+import pstats
+import cProfile
+import inspect
+import logging
+import threading
+import functools
+import contextlib
+import tracemalloc
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def max_rss_mb():
+    """Get the peak resident memory of the process so far in MB, None where the resource module is missing"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    """Get the current resident memory of the process in MB, from /proc on Linux and the peak elsewhere
+        Returns:
+            rss(float): resident memory in MB, None where neither is available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+
+def count_rows(data):
+    """Get the number of rows of a dataframe, series or array, or of the first one of a tuple of them, or a number of
+    rows returned as an integer
+        Returns:
+            rows(int): number of rows, None if data has no length
+    """
+    if isinstance(data, numbers.Integral) and not isinstance(data, bool):
+        return int(data)
+    if isinstance(data, (tuple, list)) and data and hasattr(data[0], 'shape'):
+        data = data[0]
+    if hasattr(data, 'shape') and len(data.shape) > 0:
+        return int(data.shape[0])
+    return None
+
+
+class Profiler:
+    """Record the wall time, CPU time, memory and rows of the stages of a run
+
+    A stage is a block of code run under ``stage`` or a function decorated with ``timed``. Stages can be nested and
+    run in several threads. The CPU time is the time of the whole process during the stage. The peak memory is
+    the peak of the Python allocations traced by tracemalloc, if it is on. With cProfile on, the outermost stage of
+    each thread is profiled and its most expensive functions are added to its record.
+    """
+
+    def __init__(self, cprofile=False, trace_memory=False, top=15):
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.top = top
+        self.records = []
+        self.active = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def fold_peak(self):
+        """Add the traced peak since the last call to the running stages, so nested and concurrent stages each keep
+        their own peak"""
+        peak = tracemalloc.get_traced_memory()[1] / MB
+        for record in self.active:
+            record['peak_mb'] = max(record['peak_mb'] or 0.0, peak)
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+, otherwise the peaks are the peaks of the run so far
+            tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """Time a block of code as a stage
+            Args:
+                name(str): stage name
+                rows(int): number of rows the stage handles, can also be set on the yielded record
+            Yields:
+                record(dict): record of the stage, filled when the block exits
+        """
+        stack = self.local.__dict__.setdefault('stack', [])
+        record = OrderedDict([('name', name), ('parent', stack[-1]['name'] if stack else None),
+                              ('thread', threading.current_thread().name),
+                              ('started', time.perf_counter() - self.start_wall), ('wall_seconds', None),
+                              ('cpu_seconds', None), ('peak_mb', None), ('max_rss_mb', None), ('rows', rows),
+                              ('error', None)])
+        profile = cProfile.Profile() if self.cprofile and not stack else None
+        with self.lock:
+            if self.trace_memory:
+                self.fold_peak()
+            self.active.append(record)
+            self.records.append(record)
+        stack.append(record)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+                record['profile'] = self.top_functions(profile)
+            record['wall_seconds'] = time.perf_counter() - start_wall
+            record['cpu_seconds'] = time.process_time() - start_cpu
+            record['max_rss_mb'] = max_rss_mb()
+            stack.pop()
+            with self.lock:
+                if self.trace_memory:
+                    self.fold_peak()
+                self.active.remove(record)
+
+    def top_functions(self, profile):
+        """Get the functions of a cProfile run with the most cumulative time
+            Returns:
+                functions(list): function, calls, own and cumulative seconds of the top functions
+        """
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:self.top]
+        return [{'function': '%s:%d(%s)' % key, 'calls': value[1], 'tottime': value[2], 'cumtime': value[3]}
+                for key, value in rows]
+
+    def summary(self):
+        """Aggregate the records by stage name
+            Returns:
+                summary(dict): stage name to its calls, total wall and CPU seconds, rows and max peak memory
+        """
+        summary = OrderedDict()
+        with self.lock:
+            records = [record for record in self.records if record['wall_seconds'] is not None]
+        for record in records:
+            entry = summary.setdefault(record['name'], {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                        'rows': None, 'peak_mb': None})
+            entry['calls'] += 1
+            entry['wall_seconds'] += record['wall_seconds']
+            entry['cpu_seconds'] += record['cpu_seconds']
+            if record['rows'] is not None:
+                entry['rows'] = (entry['rows'] or 0) + record['rows']
+            if record['peak_mb'] is not None:
+                entry['peak_mb'] = max(entry['peak_mb'] or 0.0, record['peak_mb'])
+        return summary
+
+    def report(self, command=None):
+        """Build the run report
+            Args:
+                command(list): command line of the run
+            Returns:
+                report(dict): totals of the run, stages aggregated by name and every stage record in start order
+        """
+        return OrderedDict([('command', command), ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                            ('wall_seconds', time.perf_counter() - self.start_wall),
+                            ('cpu_seconds', time.process_time() - self.start_cpu), ('max_rss_mb', max_rss_mb()),
+                            ('cprofile', self.cprofile), ('tracemalloc', self.trace_memory),
+                            ('stages', self.summary()), ('records', list(self.records))])
+
+    def write_report(self, path, command=None):
+        """Write the run report as JSON
+            Args:
+                path(str): file path of the report
+                command(list): command line of the run
+            Returns:
+                report(dict): the written report
+        """
+        report = self.report(command)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info('Run report with %d stages saved to %s (%.2fs wall, %.2fs CPU)', len(report['records']), path,
+                    report['wall_seconds'], report['cpu_seconds'])
+        return report
+
+
+# Profiler of the run, None until enable is called, so that the timed functions cost nothing in the app
+_profiler = None
+
+
+def enable(cprofile=False, trace_memory=False, top=15):
+    """Start recording the stages of the run
+        Args:
+            cprofile(bool): profile the outermost stage of each thread with cProfile
+            trace_memory(bool): trace the Python allocations with tracemalloc to get the peak memory of each stage
+            top(int): number of functions kept from each cProfile run
+        Returns:
+            profiler(Profiler): profiler recording the stages
+    """
+    global _profiler
+    _profiler = Profiler(cprofile, trace_memory, top)
+    return _profiler
+
+
+def disable():
+    """Stop recording the stages"""
+    global _profiler
+    _profiler = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def get_profiler():
+    """Get the profiler of the run, None if profiling is not enabled"""
+    return _profiler
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Record a block of code as a stage of the run's profiler, if profiling is enabled, see Profiler.stage"""
+    profiler = _profiler
+    if profiler is None:
+        yield {}
+    else:
+        with profiler.stage(name, rows) as record:
+            yield record
+
+
+def timed(name=None, rows=None):
+    """Decorate a function to record each call as a stage of the run's profiler, if profiling is enabled
+        Args:
+            name(str): stage name, default module.function
+            rows(str): argument whose length is the number of rows, default the length of the returned value
+        Returns:
+            decorator(function): decorator
+    """
+    def decorator(function):
+        stage_name = name or '%s.%s' % (function.__module__.split('.')[-1], function.__qualname__)
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return function(*args, **kwargs)
+            with profiler.stage(stage_name) as record:
+                if rows is not None:
+                    record['rows'] = count_rows(signature.bind(*args, **kwargs).arguments.get(rows))
+                result = function(*args, **kwargs)
+                if rows is None:
+                    record['rows'] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def compare_reports(baseline, current, threshold=0.2, min_seconds=0.05):
+    """Compare the stage times of two run reports
+        Args:
+            baseline(dict): report of the reference run
+            current(dict): report of the run to check
+            threshold(float): relative wall time increase of a stage counted as a regression
+            min_seconds(float): stages faster than this in both runs are never regressions, their noise is too large
+        Returns:
+            comparison(list): one dict per stage of either run, with both wall times, the relative change and whether
+                              it is a regression
+    """
+    old, new = baseline['stages'], current['stages']
+    comparison = []
+    for name in list(old) + [name for name in new if name not in old]:
+        before = old.get(name, {}).get('wall_seconds')
+        after = new.get(name, {}).get('wall_seconds')
+        change = (after - before) / before if before and after is not None else None
+        comparison.append({'stage': name, 'baseline_seconds': before, 'current_seconds': after, 'change': change,
+                           'regression': change is not None and change > threshold and after >= min_seconds})
+    return comparison
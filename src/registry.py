@@ -0,0 +1,135 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+import src.artifacts as artifacts
+
+logger = logging.getLogger(__name__)
+
+# Pointer files of the registry, each holding the name of a version
+ACTIVE = 'ACTIVE'
+SHADOW = 'SHADOW'
+
+
+class ModelRegistry:
+    """Local registry of trained models
+
+    Each version is a .model artifact in its own directory of the registry, named after its creation time and the
+    hash of its estimator, and never modified once published. The ACTIVE pointer file names the version served by
+    the app, and the optional SHADOW pointer names a candidate scored on the same traffic. A pointer is replaced with
+    a rename, so a reader sees either the previous version or the new one, and the app notices the new pointer file
+    from its inode without reading it.
+    """
+
+    def __init__(self, root):
+        """
+            Args:
+                root(str): directory of the registry, e.g. data/models
+        """
+        self.root = root
+
+    def path(self, version):
+        """Get the directory of a version"""
+        return os.path.join(self.root, version)
+
+    def versions(self):
+        """Get the published versions, oldest first
+            Returns:
+                versions(list): version names
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if not name.startswith('.') and os.path.isfile(os.path.join(self.path(name), artifacts.MANIFEST)))
+
+    def publish(self, clf, features=None):
+        """Save a trained model as a new version, without changing the pointers
+            Args:
+                clf(sklearn estimator): trained model
+                features(list): feature column names in the order of the model, default its feature_names_in_
+            Returns:
+                version(str): name of the version, e.g. 20210315-101500-3f2a9c1d0b7e
+        """
+        os.makedirs(self.root, exist_ok=True)
+        # the version is written under a hidden name and renamed once complete, so it is never seen half written
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix='.publish-')
+        try:
+            manifest = artifacts.save_model(clf, tmp_path, features)
+            version = '%s-%s' % (time.strftime('%Y%m%d-%H%M%S'), manifest['sha256'][:12])
+            if os.path.exists(self.path(version)):
+                logger.info('Model version %s is already published', version)
+                shutil.rmtree(tmp_path)
+            else:
+                os.rename(tmp_path, self.path(version))
+                logger.info('Model version %s published to %s', version, self.root)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return version
+
+    def read_pointer(self, pointer):
+        """Get the version a pointer names
+            Args:
+                pointer(str): ACTIVE or SHADOW
+            Returns:
+                version(str): version name, None if the pointer is not set
+        """
+        try:
+            with open(os.path.join(self.root, pointer)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def pointer_stamp(self, pointer):
+        """Get a stamp of a pointer file that changes whenever it is replaced, one stat call
+            Args:
+                pointer(str): ACTIVE or SHADOW
+            Returns:
+                stamp(tuple): inode and modification time of the file, None if the pointer is not set
+        """
+        try:
+            stat = os.stat(os.path.join(self.root, pointer))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def set_pointer(self, pointer, version):
+        """Point a pointer to a version, atomically
+            Args:
+                pointer(str): ACTIVE or SHADOW
+                version(str): published version, None to unset the pointer
+        """
+        path = os.path.join(self.root, pointer)
+        if version is None:
+            if os.path.exists(path):
+                os.remove(path)
+            logger.info('%s model unset', pointer)
+            return
+        if version not in self.versions():
+            logger.error('No model version %s in %s', version, self.root)
+            raise ValueError('Unknown model version')
+
+        def write_pointer(tmp_path):
+            with open(tmp_path, 'w') as f:
+                f.write(version + '\n')
+
+        artifacts.write_atomic(path, write_pointer)
+        logger.info('%s model set to %s', pointer, version)
+
+    def active(self):
+        """Get the version served by the app, None if none is active"""
+        return self.read_pointer(ACTIVE)
+
+    def activate(self, version):
+        """Serve a version, see set_pointer"""
+        self.set_pointer(ACTIVE, version)
+
+    def shadow(self):
+        """Get the version scored in the shadow of the active one, None if there is none"""
+        return self.read_pointer(SHADOW)
+
+    def set_shadow(self, version):
+        """Score a version in the shadow of the active one, or stop with None, see set_pointer"""
+        self.set_pointer(SHADOW, version)
@@ -0,0 +1,158 @@
+import time
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import src.artifacts as artifacts
+import src.model as model
+import src.data_cleaning as cleaning
+import src.profiling as profiling
+
+logger = logging.getLogger(__name__)
+
+# Prediction of a matchup whose teams have no features, the default of the sample submission
+DEFAULT_PRED = 0.5
+
+# Model of a worker process, loaded once by init_worker
+_clf = None
+
+
+def init_worker(model_path):
+    """Load the model once in a worker process"""
+    global _clf
+    _clf = artifacts.load_artifact(model_path)
+
+
+def predict_chunk(features):
+    """Predict a chunk of feature deltas with the model of the worker"""
+    return model.predict_win_proba(_clf, features)
+
+
+class InProcessExecutor:
+    """Run the submitted calls in the calling process, with the model loaded once by init_worker
+
+    Used instead of a ProcessPoolExecutor for a single worker, which would spawn a process and load the model in it
+    without predicting anything in parallel.
+    """
+
+    def __init__(self, model_path):
+        init_worker(model_path)
+
+    def submit(self, function, *args):
+        """Call a function now, and return its result or exception as a done future"""
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        global _clf
+        _clf = None
+
+
+def count_rows(file_path):
+    """Count the data rows of a csv without parsing it"""
+    with open(file_path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+
+
+def parse_ids(ids):
+    """Split Season_TeamA_TeamB matchup IDs
+        Args:
+            ids(pd.Series): matchup IDs
+        Returns:
+            matchups(pd.Dataframe): integer Season, TeamA and TeamB columns
+    """
+    matchups = ids.str.split('_', expand=True)
+    if matchups.shape[1] != 3 or not matchups.apply(lambda column: column.str.isdigit()).all().all():
+        logger.error('Invalid matchup IDs')
+        raise ValueError('Matchup IDs must be Season_TeamA_TeamB')
+    matchups = matchups.astype('int64')
+    matchups.columns = ['Season', 'TeamA', 'TeamB']
+    return matchups
+
+
+def get_matchup_features(stats, seed, matchups):
+    """Build the feature deltas of matchups with one index lookup per side
+        Args:
+            stats(pd.Dataframe): regular season average stats indexed by (Season, Team), see get_team_features
+            seed(np.ndarray): tourney seed of each row of stats
+            matchups(pd.Dataframe): Season, TeamA and TeamB columns
+        Returns:
+            features(pd.Dataframe): TeamA minus TeamB features of the matchups whose teams both have features
+            found(np.ndarray): boolean mask of those matchups
+    """
+    rows_a = stats.index.get_indexer(pd.MultiIndex.from_arrays([matchups['Season'], matchups['TeamA']]))
+    rows_b = stats.index.get_indexer(pd.MultiIndex.from_arrays([matchups['Season'], matchups['TeamB']]))
+    found = (rows_a >= 0) & (rows_b >= 0)
+    rows_a, rows_b = rows_a[found], rows_b[found]
+    features = pd.DataFrame(stats.values[rows_a] - stats.values[rows_b], columns=cleaning.STAT_COLUMNS)
+    features['Seed'] = seed[rows_a] - seed[rows_b]
+    return features, found
+
+
+def write_chunk(f, chunk, found, future, rows, missing):
+    """Append the predictions of a chunk to the output csv
+        Returns:
+            rows(int): number of matchups written so far
+            missing(int): number of matchups written so far with the default prediction
+    """
+    pred = np.full(len(chunk), DEFAULT_PRED)
+    if future is not None:
+        pred[found] = future.result()
+    pd.DataFrame({'ID': chunk['ID'].values, 'Pred': pred}).to_csv(f, header=False, index=False)
+    return rows + len(chunk), missing + int((~found).sum())
+
+
+@profiling.timed()
+def score_matchups(input_path, output_path, model_path, regular_avg_path, seeds_path, chunksize=10000, n_jobs=1):
+    """Predict the probability that TeamA wins each matchup of a MSampleSubmissionStage2.csv-style file
+        Args:
+            input_path(str): csv with an ID column of Season_TeamA_TeamB matchups
+            output_path(str): file path for the ID, Pred csv, written chunk by chunk
+            model_path(str): file path of the trained model
+            regular_avg_path(str): file path of the regular season average csv written by the load step
+            seeds_path(str): file path of MNCAATourneySeeds.csv
+            chunksize(int): number of matchups read and predicted at a time
+            n_jobs(int): number of worker processes predicting the chunks, used if the file has more than one chunk,
+                         the chunks are predicted in this process with one
+        Returns:
+            rows(int): number of scored matchups
+    """
+    start = time.time()
+    seeds = pd.read_csv(seeds_path)
+    seeds['Seed'] = seeds['Seed'].apply(cleaning.get_seed)
+    stats, seed = cleaning.get_team_features(pd.read_csv(regular_avg_path, index_col=0), seeds)
+    workers = n_jobs if count_rows(input_path) > chunksize else 1
+    if workers == 1:
+        executor = InProcessExecutor(model_path)
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(model_path,))
+
+    rows = missing = 0
+    with executor as pool, open(output_path, 'w') as f:
+        f.write('ID,Pred\n')
+        pending = []
+        for chunk in pd.read_csv(input_path, usecols=['ID'], chunksize=chunksize):
+            features, found = get_matchup_features(stats, seed, parse_ids(chunk['ID']))
+            pending.append((chunk, found, pool.submit(predict_chunk, features) if found.any() else None))
+            # keep a few chunks in flight per worker and write the oldest ones as soon as they are done
+            while len(pending) > 2 * workers or (pending and (pending[0][2] is None or pending[0][2].done())):
+                chunk, found, future = pending.pop(0)
+                rows, missing = write_chunk(f, chunk, found, future, rows, missing)
+        for chunk, found, future in pending:
+            rows, missing = write_chunk(f, chunk, found, future, rows, missing)
+    elapsed = time.time() - start
+    if missing:
+        logger.warning('%d matchups have a team without features, predicted %s', missing, DEFAULT_PRED)
+    logger.info('%d matchups scored in %.2fs with %d processes (%.0f rows/sec), saved to %s', rows, elapsed, workers,
+                rows / elapsed if elapsed > 0 else float('inf'), output_path)
+    return rows
+
@@ -0,0 +1,116 @@
+import queue
+import time
+import logging
+import threading
+
+import numpy as np
+
+from src.metrics import Histogram, QUANTILES
+
+logger = logging.getLogger(__name__)
+
+# Batches of matchups waiting for the shadow model, beyond which new batches are dropped rather than slowing requests
+MAX_PENDING = 1000
+
+
+class ShadowScorer:
+    """Score the matchups predicted by the live model with a candidate model, in a background thread
+
+    The requests only put the feature rows of their matchups and the live winners on a bounded queue, so the shadow
+    model adds no latency to them and a slow candidate makes the scorer drop batches instead. The thread compares
+    the candidate's winners with the live ones and times both models on the same rows.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.queue = queue.Queue(max_pending)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.clf = None
+        self.version = None
+        self.reset()
+
+    def reset(self):
+        """Clear the comparison, when the shadow or the live model changes"""
+        with self.lock:
+            self.batches = 0
+            self.rows = 0
+            self.agreements = 0
+            self.dropped = 0
+            self.errors = 0
+            self.live_seconds = Histogram()
+            self.shadow_seconds = Histogram()
+
+    def set_model(self, clf, version=None):
+        """Score the traffic with a model from now on
+            Args:
+                clf(sklearn estimator): shadow model, None to stop scoring
+                version(str): name of the model
+        """
+        self.clf, self.version = clf, version
+        self.reset()
+        if clf is not None:
+            logger.info('Shadow model %s scoring the traffic', version)
+
+    def submit(self, features, pairs, live_wins, live_seconds=None):
+        """Queue the matchups of a request for the shadow model, nothing if there is none
+            Args:
+                features(np.ndarray): feature matrix of the engine state the matchups were predicted with
+                pairs(list): (row of team1, row of team2) of each matchup
+                live_wins(list): whether the live model (or its precomputed table) predicted team1 to win
+                live_seconds(float): time of the live model call, None if the predictions were precomputed
+        """
+        clf = self.clf
+        if clf is None:
+            return
+        # the thread does not survive the fork of the gunicorn workers, each worker starts its own
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='shadow-scorer', daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait((clf, features, pairs, live_wins, live_seconds))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def run(self):
+        """Score the queued matchups until the process exits"""
+        while True:
+            clf, features, pairs, live_wins, live_seconds = self.queue.get()
+            try:
+                pairs = np.asarray(pairs)
+                delta = features[pairs[:, 0]] - features[pairs[:, 1]]
+                start = time.perf_counter()
+                score = clf.decision_function(delta)
+                seconds = time.perf_counter() - start
+                wins = clf.classes_[(score > 0).astype(int)] == 1
+                agreements = int(np.sum(wins == np.asarray(live_wins, dtype=bool)))
+            except Exception:
+                logger.exception('Shadow model %s failed', self.version)
+                with self.lock:
+                    self.errors += 1
+                continue
+            with self.lock:
+                # a batch queued before a model change is not counted against the new model
+                if clf is not self.clf:
+                    continue
+                self.batches += 1
+                self.rows += len(pairs)
+                self.agreements += agreements
+                self.shadow_seconds.observe(seconds)
+                if live_seconds is not None:
+                    self.live_seconds.observe(live_seconds)
+
+    def summary(self):
+        """Compare the shadow model with the live one
+            Returns:
+                summary(dict): shadow version, batches and matchups scored, share of matchups with the same winner,
+                               dropped batches, errors, and p50/p95/p99 seconds of the live and shadow model calls
+        """
+        with self.lock:
+            return {'version': self.version, 'batches': self.batches, 'rows': self.rows,
+                    'agreement': self.agreements / self.rows if self.rows else None, 'dropped': self.dropped,
+                    'errors': self.errors,
+                    'live_seconds': {str(q): self.live_seconds.quantile(q) for q in QUANTILES},
+                    'shadow_seconds': {str(q): self.shadow_seconds.quantile(q) for q in QUANTILES}}
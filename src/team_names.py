@@ -0,0 +1,140 @@
+import re
+import bisect
+import difflib
+import logging
+from collections import defaultdict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Minimum trigram (Dice) similarity of a suggested spelling
+MIN_SIMILARITY = 0.3
+
+
+def normalize(name):
+    """Normalize a team name for the lookups: lower case, no punctuation, single spaces
+        Args:
+            name(str): team name or spelling, e.g. "St. John's"
+        Returns:
+            key(str): normalized name, e.g. 'st johns'
+    """
+    name = str(name).lower().replace('&', ' and ')
+    name = re.sub(r"[.'`()]", '', name)
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name).split())
+
+
+def trigrams(key):
+    """Get the set of character trigrams of a normalized name, padded so that the word starts count"""
+    padded = '  %s ' % key
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TeamNameIndex:
+    """Resolve typed team names to team ids in memory
+
+    Every spelling is normalized into a dict key, so resolving a name is one dict lookup. A name that is not found
+    is matched approximately through an inverted index of the spellings' trigrams, and a sorted list of the
+    spellings serves the prefix searches of the autocomplete with a binary search.
+    """
+
+    def __init__(self, teams, spellings=None):
+        """
+            Args:
+                teams(list): (team name, team id) pairs, the names shown to the user
+                spellings(list): (spelling, team id) pairs of alternate spellings, e.g. from MTeamSpellings.csv
+        """
+        self.names = {}
+        self.ids = {}
+        for name, team_id in teams:
+            self.names.setdefault(team_id, name)
+            self.ids.setdefault(normalize(name), team_id)
+        for spelling, team_id in spellings or []:
+            if team_id in self.names:
+                self.ids.setdefault(normalize(spelling), team_id)
+        self.keys = sorted(self.ids)
+        self.grams = [trigrams(key) for key in self.keys]
+        self.postings = defaultdict(list)
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    @classmethod
+    def from_csv(cls, teams, spellings_path):
+        """Build the index from the teams and the spellings csv, with the team names only if the csv is missing
+            Args:
+                teams(list): (team name, team id) pairs
+                spellings_path(str): file path of MTeamSpellings.csv, with TeamNameSpelling and TeamID columns
+            Returns:
+                index(TeamNameIndex): name index
+        """
+        try:
+            spellings = pd.read_csv(spellings_path, encoding='latin-1')
+        except (FileNotFoundError, ValueError):
+            logger.warning('No team spellings read from %s, only the team names are indexed', spellings_path)
+            return cls(teams)
+        return cls(teams, zip(spellings['TeamNameSpelling'], spellings['TeamID']))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def resolve(self, name):
+        """Get the id of a team from one of its spellings
+            Returns:
+                team_id(int): team id, None if the name is not a known spelling
+        """
+        return self.ids.get(normalize(name))
+
+    def name(self, team_id):
+        """Get the name shown for a team id, None for an unknown team"""
+        return self.names.get(team_id)
+
+    def suggest(self, name, limit=5):
+        """Suggest the teams whose spellings share the most trigrams with a name, or are the closest by edit
+        similarity if none shares enough
+            Args:
+                name(str): typed name
+                limit(int): maximum number of suggestions
+            Returns:
+                suggestions(list): names of the closest teams, best first
+        """
+        grams = trigrams(normalize(name))
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                shared[i] += 1
+        scores = {}
+        for i, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(self.grams[i]))
+            team_id = self.ids[self.keys[i]]
+            if similarity >= MIN_SIMILARITY and similarity > scores.get(team_id, 0):
+                scores[team_id] = similarity
+        best = sorted(scores, key=lambda team_id: (-scores[team_id], self.names[team_id]))[:limit]
+        if not best:
+            # short names share too few trigrams, compare them to every spelling by edit similarity instead
+            for key in difflib.get_close_matches(normalize(name), self.keys, n=4 * limit, cutoff=0.6):
+                if self.ids[key] not in best and len(best) < limit:
+                    best.append(self.ids[key])
+        return [self.names[team_id] for team_id in best]
+
+    def complete(self, prefix, limit=10):
+        """Get the teams with a spelling starting with a prefix, for the autocomplete of the form
+            Args:
+                prefix(str): typed start of a name
+                limit(int): maximum number of teams
+            Returns:
+                names(list): names of the matching teams, in the order of their first matching spelling
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        names = []
+        seen = set()
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix) or len(names) >= limit:
+                break
+            team_id = self.ids[self.keys[i]]
+            if team_id not in seen:
+                seen.add(team_id)
+                names.append(self.names[team_id])
+        return names
@@ -0,0 +1,128 @@
+import json
+import math
+import time
+import logging
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+from sklearn.model_selection import GroupKFold, ParameterGrid
+
+import src.model as model
+import src.profiling as profiling
+
+logger = logging.getLogger(__name__)
+
+SEARCHES = ['grid', 'halving']
+
+
+def expand_candidates(candidates):
+    """Expand the grid of each estimator into candidate settings
+        Args:
+            candidates(dict): estimator name to a dict of parameter name to list of values, see model.ESTIMATORS
+        Returns:
+            settings(list): (estimator, params) tuples
+    """
+    return [(estimator, params) for estimator, grid in candidates.items() for params in ParameterGrid(grid or {})]
+
+
+def fit_fold(X_train, y_train, estimator, params):
+    """Fit a candidate on the training rows of a fold, cached on disk by tune_model
+        Returns:
+            clf(sklearn estimator): trained model
+            fit_seconds(float): training time
+    """
+    start = time.perf_counter()
+    clf = model.train_model(X_train, y_train, estimator, **params)
+    return clf, time.perf_counter() - start
+
+
+def score_fold(fit, X, y, fold, estimator, params):
+    """Fit a candidate on a fold, or get it from the cache, and score it on the held-out seasons
+        Args:
+            fit(function): fit_fold, possibly wrapped by joblib.Memory
+            X(pd.Dataframe): features
+            y(pd.Series): target
+            fold(tuple): train and test row indices
+            estimator(str): estimator name
+            params(dict): estimator keyword arguments
+        Returns:
+            score(dict): accuracy, log loss, fit and score seconds
+    """
+    train, test = fold
+    clf, fit_seconds = fit(X.iloc[train], y.iloc[train], estimator, params)
+    start = time.perf_counter()
+    y_pred = clf.predict(X.iloc[test])
+    proba = model.predict_win_proba(clf, X.iloc[test])
+    score_seconds = time.perf_counter() - start
+    return {'accuracy': metrics.accuracy_score(y.iloc[test], y_pred),
+            'log_loss': metrics.log_loss(y.iloc[test], np.clip(proba, 1e-15, 1 - 1e-15), labels=[0, 1]),
+            'fit_seconds': fit_seconds, 'score_seconds': score_seconds}
+
+
+@profiling.timed(rows='data')
+def tune_model(data, columns, column, candidates, search='halving', n_splits=5, factor=3, n_jobs=-1,
+               cache_dir='data/.tune_cache'):
+    """Search the train_model settings with cross-validation grouped by season
+        Args:
+            data(pd.Dataframe): model data with a Season column, see load_data keep_season
+            columns(list): list of feature column names
+            column(str): target column name
+            candidates(dict): estimator name to a dict of parameter name to list of values
+            search(str): 'grid' scores every setting on every fold, 'halving' scores every setting on a few folds
+                         and keeps the best 1/factor of them for the next round on factor times more folds
+            n_splits(int): number of folds, each fold holds out whole seasons
+            factor(int): reduction factor of the successive halving
+            n_jobs(int): number of worker processes, -1 for all cores
+            cache_dir(str): directory caching the fitted folds, None to refit every time
+        Returns:
+            leaderboard(pd.Dataframe): settings ranked by mean accuracy on the folds they were scored on
+    """
+    if search not in SEARCHES:
+        logger.error('Invalid search %s', search)
+        raise ValueError('The search must be one of %s' % SEARCHES)
+    if 'Season' not in data:
+        logger.error('Model data without a Season column')
+        raise KeyError('Tuning needs the Season column, set keep_season under load_data')
+    start = time.time()
+    X, y = data[columns], data[column]
+    folds = list(GroupKFold(n_splits).split(X, y, data['Season']))
+    fit = joblib.Memory(cache_dir, verbose=0).cache(fit_fold) if cache_dir is not None else fit_fold
+    settings = expand_candidates(candidates)
+
+    # number of folds of each round, 1, factor, factor ** 2... up to all folds for the halving search
+    rounds = []
+    if search == 'halving':
+        n_folds = 1
+        while n_folds < n_splits:
+            rounds.append(n_folds)
+            n_folds *= factor
+    rounds.append(n_splits)
+
+    scores = {}
+    remaining = list(range(len(settings)))
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        for r, n_folds in enumerate(rounds):
+            # folds scored in an earlier round are kept, their fits are also in the cache
+            jobs = [(i, k) for i in remaining for k in range(n_folds) if (i, k) not in scores]
+            results = parallel(joblib.delayed(score_fold)(fit, X, y, folds[k], *settings[i]) for i, k in jobs)
+            scores.update(zip(jobs, results))
+            logger.info('Round %d: %d settings scored on %d folds', r + 1, len(remaining), n_folds)
+            if r < len(rounds) - 1:
+                mean = {i: np.mean([scores[(i, k)]['accuracy'] for k in range(n_folds)]) for i in remaining}
+                remaining = sorted(remaining, key=lambda i: -mean[i])[:max(1, math.ceil(len(remaining) / factor))]
+
+    records = []
+    for i, (estimator, params) in enumerate(settings):
+        fold_scores = pd.DataFrame([score for (j, _), score in scores.items() if j == i])
+        records.append({'estimator': estimator, 'params': json.dumps(params, sort_keys=True),
+                        'n_folds': len(fold_scores),
+                        'mean_accuracy': fold_scores['accuracy'].mean(), 'std_accuracy': fold_scores['accuracy'].std(),
+                        'mean_log_loss': fold_scores['log_loss'].mean(),
+                        'mean_fit_seconds': fold_scores['fit_seconds'].mean(),
+                        'mean_score_seconds': fold_scores['score_seconds'].mean()})
+    leaderboard = pd.DataFrame(records).sort_values(['n_folds', 'mean_accuracy'], ascending=False)
+    leaderboard.insert(0, 'rank', np.arange(1, len(leaderboard) + 1))
+    logger.info('%d settings tuned with %d fold fits in %.2fs', len(settings), len(scores), time.time() - start)
+    return leaderboard.reset_index(drop=True)
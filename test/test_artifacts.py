@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import svm
+
+from src.artifacts import save_artifact, load_artifact, save_model, load_model, MANIFEST
+
+
+def test_artifacts_happy(tmp_path):
+    features = pd.DataFrame({'Score': [1.5, -2.0], 'Seed': np.array([3, -3], dtype='int16')}, index=[4, 0])
+    target = pd.Series([1, 0], name='Win', index=[4, 0])
+    y_pred = np.array([1, 0])
+    for data, name in [(features, 'features.feather'), (target, 'target.feather'), (y_pred, 'y_pred.arrow')]:
+        save_artifact(data, str(tmp_path / name))
+    pd.testing.assert_frame_equal(load_artifact(str(tmp_path / 'features.feather')), features)
+    pd.testing.assert_series_equal(load_artifact(str(tmp_path / 'target.feather')), target)
+    np.testing.assert_array_equal(load_artifact(str(tmp_path / 'y_pred.arrow')), y_pred)
+
+
+def test_artifacts_unhappy(tmp_path):
+    with pytest.raises(TypeError):
+        save_artifact(np.zeros((2, 2)), str(tmp_path / 'matrix.feather'))
+
+
+def test_model_artifact_happy(tmp_path):
+    X = pd.DataFrame({'Score': [5.0, -5.0], 'Seed': [3.0, -3.0]})
+    clf = svm.SVC(kernel='linear').fit(X.values, [1, 0])
+    save_model(clf, str(tmp_path / 'clf.model'), features=list(X.columns))
+    loaded, manifest = load_model(str(tmp_path / 'clf.model'))
+    assert manifest['features'] == ['Score', 'Seed']
+    assert manifest['estimator'].endswith('SVC')
+    np.testing.assert_array_equal(loaded.predict(X.values), [1, 0])
+    np.testing.assert_array_equal(load_artifact(str(tmp_path / 'clf.model')).decision_function(X.values),
+                                  clf.decision_function(X.values))
+
+
+def test_model_artifact_unhappy(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_model(str(tmp_path / 'clf.model'))
+    save_artifact(svm.SVC().fit(np.array([[1.0], [-1.0]]), [1, 0]), str(tmp_path / 'clf.model'))
+    assert load_model(str(tmp_path / 'clf.model'))[1]['features'] is None
+    (tmp_path / 'clf.model' / MANIFEST).write_text('{"format": 0}')
+    with pytest.raises(ValueError):
+        load_model(str(tmp_path / 'clf.model'))
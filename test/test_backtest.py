@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backtest import backtest
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.normal(size=(300, 2)), columns=['Score', 'Seed'])
+    data['Win'] = (data['Score'] - data['Seed'] > 0).astype(int)
+    data['Season'] = np.repeat(np.arange(2003, 2009), 50)
+    return data
+
+
+def test_backtest_happy(data):
+    result = backtest(data, ['Score', 'Seed'], 'Win', {'estimator': 'logistic'}, min_train_seasons=2, n_jobs=2)
+    assert result['Season'].tolist() == [2005, 2006, 2007, 2008]
+    assert result['n_train'].tolist() == [100, 150, 200, 250]
+    assert (result['n_test'] == 50).all()
+    assert (result['accuracy'] > 0.8).all()
+    assert (result['wall_seconds'] >= result['fit_seconds']).all()
+
+
+def test_backtest_unhappy(data):
+    with pytest.raises(KeyError):
+        backtest(data.drop(columns='Season'), ['Score', 'Seed'], 'Win', {'estimator': 'logistic'})
+    with pytest.raises(ValueError):
+        backtest(data, ['Score', 'Seed'], 'Win', {'estimator': 'logistic'}, min_train_seasons=6)
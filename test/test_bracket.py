@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import svm
+
+from src.bracket import BracketSimulator, order_slots, win_probability_matrix
+
+
+@pytest.fixture
+def bracket():
+    # four teams and a play-in game between the two weakest for the 4 seed
+    slots = pd.DataFrame({'Slot': ['R2W1', 'R1W1', 'R1W2', 'W04'],
+                          'StrongSeed': ['R1W1', 'W01', 'W02', 'W04a'],
+                          'WeakSeed': ['R1W2', 'W04', 'W03', 'W04b']})
+    seeds = pd.DataFrame({'Seed': ['W01', 'W02', 'W03', 'W04a', 'W04b'], 'TeamID': [1, 2, 3, 4, 5]})
+    features = np.column_stack([np.array([[80.0], [70.0], [60.0], [50.0], [40.0]]).repeat(17, axis=1),
+                                [1, 2, 3, 4, 4]])
+    X = np.vstack([np.full(18, 5.0), np.full(18, -5.0)])
+    clf = svm.SVC(kernel='linear').fit(X, [1, 0])
+    return clf, slots, seeds, features
+
+
+def test_order_slots_happy(bracket):
+    _, slots, seeds, _ = bracket
+    assert [game[0] for game in order_slots(slots, seeds['Seed'])] == ['R1W2', 'W04', 'R1W1', 'R2W1']
+
+
+def test_order_slots_unhappy(bracket):
+    _, slots, seeds, _ = bracket
+    with pytest.raises(ValueError):
+        order_slots(slots, seeds['Seed'][:-1])
+
+
+def test_win_probability_matrix_happy(bracket):
+    clf, _, _, features = bracket
+    proba = win_probability_matrix(clf, features)
+    assert np.allclose(proba + proba.T, 1)
+    assert (proba[0, 1:] > 0.5).all()
+
+
+def test_simulate_happy(bracket):
+    clf, slots, seeds, features = bracket
+    advancement = BracketSimulator(clf, slots, seeds, features).simulate(10000, random_state=0, batch_size=3000)
+    assert advancement['Seed'].iloc[0] == 'W01'
+    assert np.allclose(advancement[['R0', 'R1', 'R2']].sum().values, [4, 2, 1])
+    assert advancement.set_index('Seed').loc[['W01', 'W02', 'W03'], 'R0'].tolist() == [1, 1, 1]
+
+
+def test_simulate_unhappy(bracket):
+    clf, slots, seeds, features = bracket
+    with pytest.raises(ValueError):
+        BracketSimulator(clf, slots, seeds, features).simulate(0)
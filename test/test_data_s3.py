@@ -0,0 +1,84 @@
+import os
+
+import boto3
+import pytest
+
+import src.data_s3 as ds3
+
+moto = pytest.importorskip('moto')
+mock_s3 = getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3')
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_s3():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='ncaa-test')
+        # parts of 5 MB, the smallest S3 accepts, so the large file is uploaded in two parts
+        yield ds3.S3TransferManager(max_workers=2, multipart_chunksize=5 * ds3.MB, client=client)
+
+
+def test_transfer_manager_happy(manager, tmp_path):
+    local_paths = [str(tmp_path / 'small.csv'), str(tmp_path / 'large.csv')]
+    with open(local_paths[0], 'wb') as f:
+        f.write(b'Season,TeamID\n2003,1102\n')
+    with open(local_paths[1], 'wb') as f:
+        f.write(os.urandom(6 * ds3.MB))
+    s3paths = ['s3://ncaa-test/data/small.csv', 's3://ncaa-test/data/large.csv']
+
+    assert manager.upload_files(local_paths, s3paths) == [True, True]
+    assert manager.upload_files(local_paths, s3paths) == [False, False]
+
+    downloaded = [str(tmp_path / 'small_copy.csv'), str(tmp_path / 'large_copy.csv')]
+    assert manager.download_files(downloaded, s3paths) == [True, True]
+    assert manager.download_files(downloaded, s3paths) == [False, False]
+    with open(local_paths[1], 'rb') as f, open(downloaded[1], 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_transfer_manager_unhappy(manager, tmp_path):
+    manager.client.put_object(Bucket='ncaa-test', Key='data/a.csv', Body=b'Season\n2003\n')
+    # the missing file fails the call once the other file is downloaded
+    with pytest.raises(FileNotFoundError):
+        manager.download_files([str(tmp_path / 'missing.csv'), str(tmp_path / 'a.csv')],
+                               ['s3://ncaa-test/data/missing.csv', 's3://ncaa-test/data/a.csv'])
+    assert os.path.exists(str(tmp_path / 'a.csv'))
+
+
+def test_s3_cache_happy(manager, tmp_path):
+    for name in ['a.csv', 'b.csv']:
+        manager.client.put_object(Bucket='ncaa-test', Key='data/' + name, Body=b'Season\n2003\n')
+    manager.cache = ds3.S3Cache(str(tmp_path / 'cache'), max_mb=0)
+    local_path = str(tmp_path / 'a.csv')
+
+    assert manager.download_files([local_path], ['s3://ncaa-test/data/a.csv']) == [True]
+    os.remove(local_path)
+    assert manager.download_files([local_path], ['s3://ncaa-test/data/a.csv']) == [True]
+    assert (manager.cache.hits, manager.cache.misses) == (1, 1)
+
+    # with a size cap of 0 only the most recent entry is kept
+    manager.download_files([str(tmp_path / 'b.csv')], ['s3://ncaa-test/data/b.csv'])
+    etag = manager.head('ncaa-test', 'data/b.csv')['ETag'].strip('"')
+    assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(manager.cache.entry_path('ncaa-test', 'data/b.csv', etag))]
+    with open(local_path, 'rb') as f:
+        assert f.read() == b'Season\n2003\n'
+
+
+def test_s3_cache_unhappy(tmp_path):
+    cache = ds3.S3Cache(str(tmp_path / 'cache'), max_mb=0)
+    assert not os.path.exists(str(tmp_path / 'cache'))
+
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(b'Season\n2003\n')
+
+    a = cache.put('ncaa-test', 'data/a.csv', '1', write)
+    # a concurrent download does not evict the entry of a download that is still copying it
+    b = cache.put('ncaa-test', 'data/b.csv', '2', write)
+    assert os.path.exists(a)
+    cache.release(a)
+    assert cache.evict() == [a]
+    assert os.path.exists(b)
@@ -29,4 +29,17 @@ def test_get_regular_season_average_happy():
 
 def test_get_regular_season_average_unhappy():
     with pytest.raises(TypeError):
-        df_test = get_regular_season_average(1, 2)
\ No newline at end of file
+        df_test = get_regular_season_average(1, 2)
+
+def test_get_regular_season_average_chunked():
+    df_in = pd.DataFrame([[2003, 22, 1102, 72, 1391, 43, 'H', 0] + [30000] * 12 + [29] + [5] * 12 + [22],
+                          [2003, 25, 1102, 57, 1117, 52, 'A', 0] + [30000] * 12 + [20] + [5] * 12 + [19],
+                          [2004, 25, 1117, 57, 1102, 52, 'A', 0] + [10] * 12 + [20] + [5] * 12 + [19]],
+                         columns=['Season', 'DayNum', 'WTeamID', 'WScore', 'LTeamID', 'LScore', 'WLoc',
+                                  'NumOT', 'WFGM', 'WFGA', 'WFGM3', 'WFGA3', 'WFTM', 'WFTA', 'WOR', 'WDR',
+                                  'WAst', 'WTO', 'WStl', 'WBlk', 'WPF', 'LFGM', 'LFGA', 'LFGM3', 'LFGA3',
+                                  'LFTM', 'LFTA', 'LOR', 'LDR', 'LAst', 'LTO', 'LStl', 'LBlk', 'LPF'])
+    df_in.to_csv('data/test_df_in_chunked.csv')
+    df_true = get_regular_season_average('data/test_df_in_chunked.csv', 'data/test_output_chunked.csv')
+    df_test = get_regular_season_average('data/test_df_in_chunked.csv', 'data/test_output_chunked.csv', chunksize=2)
+    assert df_test.equals(df_true)
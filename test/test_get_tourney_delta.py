@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.data_cleaning import (get_regular_season_average, get_tourney_result, get_tourney_seeds, get_tourney_delta,
+                               STAT_COLUMNS)
+
+
+def test_get_tourney_delta_happy():
+    regular_avg = pd.DataFrame([[2003, 1102] + [10.0] * 14 + [30] + [0.5] * 3,
+                                [2003, 1117] + [4.0] * 14 + [28] + [0.25] * 3,
+                                [2003, 1391] + [7.0] * 14 + [31] + [0.75] * 3,
+                                [2004, 1102] + [9.0] * 14 + [29] + [0.5] * 3],
+                               columns=['Season', 'Team'] + STAT_COLUMNS[:14] + ['GP'] + STAT_COLUMNS[14:])
+    # 1391 is not seeded and 1117 did not play the 2004 regular season, so only the first game is kept
+    seeds = pd.DataFrame({'Season': [2003, 2003, 2004, 2004], 'Seed': [1, 16, 2, 15], 'TeamID': [1102, 1117, 1102, 1117]})
+    tourney_result = pd.DataFrame({'Season': [2003, 2003, 2004], 'WTeamID': [1102, 1391, 1117],
+                                   'LTeamID': [1117, 1102, 1102]})
+    df_true = pd.DataFrame([[6.0] * 14 + [0.25] * 3 + [-15, 1],
+                            [-6.0] * 14 + [-0.25] * 3 + [15, 0]],
+                           index=[0, 0],
+                           columns=STAT_COLUMNS + ['Seed', 'Win'])
+    df_test = get_tourney_delta(regular_avg, tourney_result, seeds, 'data/test_tourney_delta_happy.csv')
+    pd.testing.assert_frame_equal(df_test, df_true)
+
+    df_test = get_tourney_delta(regular_avg, tourney_result, seeds, 'data/test_tourney_delta_happy.csv', keep_season=True)
+    pd.testing.assert_frame_equal(df_test, pd.concat([pd.DataFrame({'Season': [2003, 2003]}, index=[0, 0]), df_true],
+                                                     axis=1))
+
+
+def test_get_tourney_delta_unhappy():
+    regular_avg = pd.DataFrame({'Season': [2003], 'Team': [1102]})
+    seeds = pd.DataFrame({'Season': [2003], 'Seed': [1], 'TeamID': [1102]})
+    tourney_result = pd.DataFrame({'Season': [2003], 'WTeamID': [1102], 'LTeamID': [1117]})
+    with pytest.raises(KeyError):
+        get_tourney_delta(regular_avg, tourney_result, seeds, 'data/test_tourney_delta_unhappy.csv')
+
+
+@pytest.mark.parametrize('chunksize', [None, 50])
+def test_get_tourney_delta_baseline(tmp_path, chunksize):
+    # test/data holds the 2003 and 2019 tourneys with the first 200 regular season games of each season, and the
+    # tourney deltas the implementation before the aligned subtraction computed from them, written to its csv
+    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    regular_avg = get_regular_season_average(os.path.join(data_dir, 'regular_season_games.csv'),
+                                             str(tmp_path / 'regular_avg.csv'), chunksize)
+    tourney_result = get_tourney_result(os.path.join(data_dir, 'tourney_results.csv'), str(tmp_path / 'result.csv'))
+    seeds = get_tourney_seeds(os.path.join(data_dir, 'tourney_seeds.csv'), str(tmp_path / 'seeds.csv'))
+    output_path = str(tmp_path / 'tourney_delta.csv')
+    df_test = get_tourney_delta(regular_avg, tourney_result, seeds, output_path)
+
+    baseline_path = os.path.join(data_dir, 'tourney_delta_baseline.csv')
+    pd.testing.assert_frame_equal(df_test, pd.read_csv(baseline_path, index_col=0, float_precision='round_trip'),
+                                  check_exact=True)
+    with open(output_path) as f, open(baseline_path) as g:
+        assert f.read() == g.read()
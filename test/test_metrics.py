@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+
+from src.metrics import Histogram, RequestMetrics, phase
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    request_metrics = RequestMetrics(app)
+
+    @app.route('/predict')
+    def predict():
+        with phase('db'):
+            pass
+        with phase('inference'):
+            pass
+        request_metrics.count('prediction')
+        return 'ok'
+
+    @app.route('/fail')
+    def fail():
+        with phase('db'):
+            raise RuntimeError('DB stall')
+
+    app.route('/metrics')(request_metrics.render)
+    return app.test_client(), request_metrics
+
+
+def test_request_metrics_happy(client):
+    client, request_metrics = client
+    for _ in range(3):
+        client.get('/predict')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'ncaa_request_seconds_count{endpoint="predict",status="200",worker=' in text
+    assert 'ncaa_request_phase_seconds_count{endpoint="predict",phase="inference",worker=' in text
+    assert 'ncaa_outcomes_total{endpoint="predict",outcome="prediction",worker=' in text
+    quantiles = request_metrics.quantiles('request_phase_seconds')[('predict', 'db')]
+    assert 0 <= quantiles[0.5] <= quantiles[0.95] <= quantiles[0.99]
+
+    histogram = Histogram(buckets=(1.0, 2.0))
+    for value in [0.5, 1.5, 1.5, 3.0]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1]
+    assert histogram.quantile(0.5) == 1.5 and histogram.quantile(0.99) == 2.0
+
+
+def test_request_metrics_unhappy(client):
+    client, request_metrics = client
+    assert Histogram().quantile(0.5) is None
+    # outside a request a phase is not recorded
+    with phase('db'):
+        pass
+    assert client.get('/fail').status_code == 500
+    # the failed request is recorded with its status, and its phases stop being collected when it ends
+    assert list(request_metrics.quantiles('request_seconds')) == [('fail', 500)]
+    with phase('db'):
+        pass
+    assert request_metrics.histograms['request_phase_seconds'][2][('fail', 'db')].count == 1
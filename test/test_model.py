@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.model import ESTIMATORS, train_model, select_model
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=['Score', 'FGP', 'Seed'])
+    y = pd.Series((X['Score'] - X['Seed'] > 0).astype(int), name='Win')
+    return X[:150], y[:150], X[150:], y[150:]
+
+
+def test_train_model_happy(data):
+    X_train, y_train, X_test, y_test = data
+    for estimator in ESTIMATORS:
+        clf = train_model(X_train, y_train, estimator)
+        assert list(clf.classes_) == [0, 1]
+        assert clf.decision_function(X_test).shape == (50,)
+
+
+def test_train_model_unhappy(data):
+    with pytest.raises(ValueError):
+        train_model(data[0], data[1], 'random_forest')
+
+
+def test_select_model_happy(data):
+    candidates = {'logistic': None, 'hist_gb': {'max_iter': 10}}
+    report, clf = select_model(*data, candidates, n_latency=20)
+    assert report['estimator'].tolist() == ['logistic', 'hist_gb']
+    assert report['selected'].sum() == 1
+    assert (report[['accuracy', 'train_seconds', 'p50_ms', 'p99_ms', 'size_kb']] > 0).all().all()
+    assert clf is not None
+
+    report, clf = select_model(*data, candidates, latency_budget_ms=0, n_latency=20)
+    assert not report['selected'].any()
+    assert clf is None
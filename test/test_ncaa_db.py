@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+import sqlalchemy
+
+import src.ncaa_db as db
+
+
+@pytest.fixture
+def session():
+    return db.create_session(db.create_db('sqlite://'))
+
+
+def test_ingest_incremental_happy(session):
+    seeds = pd.DataFrame({'Season': [2003, 2003, 2004], 'Seed': [1, 16, 2], 'TeamID': [1102, 1117, 1102]})
+    db.ingest_tourney_seeds(session, seeds, incremental=True)
+
+    seeds.loc[2, 'Seed'] = 3
+    seeds = pd.concat([seeds, pd.DataFrame({'Season': [2005], 'Seed': [4], 'TeamID': [1391]})], ignore_index=True)
+    assert db.ingest_incremental(session, db.Tourney, seeds, 'Season') == [2004, 2005]
+    assert db.ingest_incremental(session, db.Tourney, seeds, 'Season') == []
+
+    stored = session.query(db.Tourney.Season, db.Tourney.TeamID, db.Tourney.Seed).order_by(db.Tourney.Season).all()
+    assert stored == [(2003, 1102, 1), (2003, 1117, 16), (2004, 1102, 3), (2005, 1391, 4)]
+
+
+def test_ingest_incremental_unhappy(session):
+    seeds = pd.DataFrame({'Season': [2003], 'Seed': [1], 'TeamID': [1102]})
+    db.ingest_tourney_seeds(session, seeds, incremental=True, commit=False)
+    teams = pd.DataFrame({'TeamID': [1102, 1102], 'TeamName': ['Air Force', 'Air Force']})
+    with pytest.raises(Exception):
+        db.ingest_teams(session, teams, incremental=True, commit=False)
+    # the seeds of the same transaction are rolled back with the failed teams
+    session.rollback()
+    assert session.query(db.Tourney).count() == 0
+
+
+def test_check_query_plans_happy():
+    engine = db.create_db('sqlite://')
+    assert db.check_query_plans(engine) == []
+
+
+def test_check_query_plans_unhappy():
+    engine = db.create_db('sqlite://')
+    engine.execute('DROP INDEX ix_teams_teamname')
+    assert db.check_query_plans(engine) == ['team id by name']
+    assert db.migrate_indexes(engine) == ['ix_teams_teamname']
+
+
+def test_ncaa_manager_happy(tmp_path):
+    options = {'poolclass': db.TimedQueuePool, 'pool_size': 2, 'max_overflow': 0}
+    manager = db.NCAAManager(engine_string='sqlite:///%s' % (tmp_path / 'ncaa.db'), engine_options=options)
+    assert manager.session.execute('SELECT 1').scalar() == 1
+    assert manager.pool_metrics()['checked_out'] == 1
+    manager.remove_session()
+    metrics = manager.pool_metrics()
+    assert (metrics['checkouts'], metrics['checkins'], metrics['checked_out'], metrics['timeouts']) == (1, 1, 0, 0)
+    manager.close()
+
+
+def test_ncaa_manager_unhappy(tmp_path):
+    with pytest.raises(ValueError):
+        db.NCAAManager()
+    options = {'poolclass': db.TimedQueuePool, 'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 0.05}
+    manager = db.NCAAManager(engine_string='sqlite:///%s' % (tmp_path / 'ncaa.db'), engine_options=options)
+    connection = manager.engine.connect()
+    with pytest.raises(sqlalchemy.exc.TimeoutError):
+        manager.engine.connect()
+    connection.close()
+    metrics = manager.pool_metrics()
+    assert metrics['timeouts'] == 1 and metrics['max_wait_ms'] >= 50
+    manager.close()
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from src.pipeline import Pipeline, Step
+
+
+def make_steps(tmp_path, calls, offset):
+    def double(inputs, params):
+        calls.append('double')
+        return inputs[0] * 2
+
+    def shift(inputs, params):
+        calls.append('shift')
+        return inputs[0] + params['offset']
+
+    source = str(tmp_path / 'source.feather')
+    pd.DataFrame({'x': [1, 2]}).to_feather(source)
+    return [Step('double', double, [source], [str(tmp_path / 'double.feather')], {}, [], []),
+            Step('shift', shift, [str(tmp_path / 'double.feather')], [str(tmp_path / 'shift.feather')],
+                 {'offset': offset}, [], [])]
+
+
+def test_pipeline_happy(tmp_path):
+    calls = []
+    cache_path = str(tmp_path / 'cache.json')
+    assert Pipeline(make_steps(tmp_path, calls, 1), cache_path).run() == {'double': True, 'shift': True}
+    assert Pipeline(make_steps(tmp_path, calls, 1), cache_path).run() == {'double': False, 'shift': False}
+    assert Pipeline(make_steps(tmp_path, calls, 2), cache_path).run() == {'double': False, 'shift': True}
+    assert calls == ['double', 'shift', 'shift']
+    assert pd.read_feather(str(tmp_path / 'shift.feather'))['x'].tolist() == [4, 6]
+
+
+def test_pipeline_unhappy(tmp_path):
+    steps = make_steps(tmp_path, [], 1)
+    steps[0] = steps[0]._replace(inputs=steps[1].outputs)
+    with pytest.raises(ValueError):
+        Pipeline(steps, str(tmp_path / 'cache.json')).run()
@@ -0,0 +1,156 @@
+import time
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import svm
+
+import src.ncaa_db as db
+from src.artifacts import save_model
+from src.registry import ModelRegistry
+from src.shadow import ShadowScorer
+from src.data_cleaning import STAT_COLUMNS
+from src.predict_engine import PredictionEngine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    session = db.create_session(db.create_db('sqlite://'))
+    regular = pd.DataFrame([[2003, 1102] + [70.0] * 17 + [30],
+                            [2003, 1117] + [60.0] * 17 + [30],
+                            [2003, 1391] + [50.0] * 17 + [30]],
+                           columns=['Season', 'Team'] + STAT_COLUMNS + ['GP'])
+    db.ingest_regular_avg(session, regular)
+    db.ingest_tourney_seeds(session, pd.DataFrame({'Season': [2003, 2003], 'Seed': [1, 16], 'TeamID': [1102, 1117]}))
+    db.ingest_teams(session, pd.DataFrame({'TeamID': [1102, 1117, 1391], 'TeamName': ['Air Force', 'Arkansas', 'Dayton']}))
+
+    X = np.vstack([np.full(18, 5.0), np.full(18, -5.0)])
+    clf = svm.SVC(kernel='linear').fit(X, [1, 0])
+    model_path = str(tmp_path / 'clf.sav')
+    with open(model_path, 'wb') as f:
+        pickle.dump(clf, f)
+    return PredictionEngine(model_path, session)
+
+
+def test_predict_matchup_happy(engine):
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Air Force')
+    assert engine.predict_matchup('Arkansas', 'Air Force', '2003') == ('prediction', 'Air Force')
+
+
+def test_predict_matchup_unhappy(engine):
+    assert engine.predict_matchup('Air Force', 'Duke', '2003') == ('no_team', ['Duke'])
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2004') == ('no_season', ['Air Force', 'Arkansas'])
+    assert engine.predict_matchup('Air Force', 'Dayton', '2003') == ('no_tourney', ['Dayton'])
+
+
+def test_precompute_matchups_happy(engine):
+    matchups, model_hash = engine.precompute_matchups()
+    assert sorted(zip(matchups['Team1'], matchups['Team2'])) == [(1102, 1117), (1117, 1102)]
+    db.ingest_matchups(engine.session, matchups, model_hash)
+    engine.reload()
+    assert engine.state.precomputed and len(engine.state.matchups) == 2
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Air Force')
+    assert engine.predict_matchup('Arkansas', 'Air Force', '2003') == ('prediction', 'Air Force')
+
+
+def test_precompute_matchups_unhappy(engine):
+    db.ingest_matchups(engine.session, *engine.precompute_matchups())
+    # a retrained model invalidates the precomputed matchups
+    X = np.vstack([np.full(18, 5.0), np.full(18, -5.0)])
+    with open(engine.model_path, 'wb') as f:
+        pickle.dump(svm.SVC(kernel='linear').fit(X, [0, 1]), f)
+    engine.reload()
+    assert not engine.state.precomputed
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Arkansas')
+
+
+def test_model_artifact_happy(engine, tmp_path):
+    X = pd.DataFrame(np.vstack([np.full(18, 5.0), np.full(18, -5.0)]), columns=STAT_COLUMNS + ['Seed'])
+    clf = svm.SVC(kernel='linear').fit(X.values, [0, 1])
+    engine.model_path = str(tmp_path / 'clf.model')
+    manifest = save_model(clf, engine.model_path, features=list(X.columns))
+    state = engine.reload_if_changed()
+    assert state.model_hash == manifest['sha256']
+    assert engine.load_seconds > 0
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Arkansas')
+    assert engine.reload_if_changed() is state
+
+
+def test_model_artifact_unhappy(engine, tmp_path):
+    clf = svm.SVC(kernel='linear').fit(np.vstack([np.full(18, 5.0), np.full(18, -5.0)]), [0, 1])
+    engine.model_path = str(tmp_path / 'clf.model')
+    save_model(clf, engine.model_path, features=['Seed'] + STAT_COLUMNS)
+    with pytest.raises(ValueError):
+        engine.reload()
+
+
+def test_model_swap_happy(engine, tmp_path):
+    X = np.vstack([np.full(18, 5.0), np.full(18, -5.0)])
+    engine.registry = ModelRegistry(str(tmp_path / 'models'))
+    engine.shadow = ShadowScorer()
+    state = engine.reload_if_changed()
+    assert state.model_version is None
+    flipped = engine.registry.publish(svm.SVC(kernel='linear').fit(X, [0, 1]), STAT_COLUMNS + ['Seed'])
+    engine.registry.activate(flipped)
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Arkansas')
+    assert engine.state.model_version == flipped and engine.state.features is state.features
+    # the previous model scores the same traffic in the shadow
+    original = engine.registry.publish(svm.SVC(kernel='linear').fit(X, [1, 0]), STAT_COLUMNS + ['Seed'])
+    engine.registry.set_shadow(original)
+    engine.predict_matchups([('Air Force', 'Arkansas', '2003'), ('Arkansas', 'Air Force', 2003)])
+    for _ in range(200):
+        if engine.shadow.summary()['rows'] == 2:
+            break
+        time.sleep(0.01)
+    summary = engine.shadow.summary()
+    assert summary['version'] == original and summary['rows'] == 2 and summary['agreement'] == 0
+
+
+def test_model_swap_unhappy(engine, tmp_path):
+    engine.registry = ModelRegistry(str(tmp_path / 'models'))
+    state = engine.reload_if_changed()
+    X = np.vstack([np.full(18, 5.0), np.full(18, -5.0)])
+    version = engine.registry.publish(svm.SVC(kernel='linear').fit(X, [0, 1]), ['Seed'] + STAT_COLUMNS)
+    engine.registry.activate(version)
+    # a version that fails to load is not retried and the previous model is still served
+    assert engine.reload_if_changed() is state
+    assert engine.failed_stamp == engine.registry.pointer_stamp('ACTIVE')
+    assert engine.predict_matchup('Air Force', 'Arkansas', '2003') == ('prediction', 'Air Force')
+
+
+def test_predict_matchups_happy(engine):
+    matchups = [('Air Force', 'Arkansas', '2003'), ('Arkansas', 'Air Force', 2003)]
+    live = engine.predict_matchups(matchups)
+    assert [prediction[:2] for prediction in live] == [('prediction', 'Air Force'), ('prediction', 'Air Force')]
+    assert live[0][2] > 0.5 > live[1][2]
+    db.ingest_matchups(engine.session, *engine.precompute_matchups())
+    engine.reload()
+    assert engine.predict_matchups(matchups) == live
+
+
+def test_predict_matchups_unhappy(engine):
+    assert engine.predict_matchups([('Air Force', 'Duke', '2003'), ('Air Force', 'Arkansas', '2004'),
+                                    ('Air Force', 'Dayton', '2003')]) == [('no_team', ['Duke'], None),
+                                                                          ('no_season', ['Air Force', 'Arkansas'], None),
+                                                                          ('no_tourney', ['Dayton'], None)]
+
+
+def test_team_names_happy(engine, tmp_path):
+    spellings_path = tmp_path / 'MTeamSpellings.csv'
+    pd.DataFrame({'TeamNameSpelling': ['usafa', 'arkansas razorbacks'], 'TeamID': [1102, 1117]}).to_csv(spellings_path,
+                                                                                                        index=False)
+    engine.spellings_path = str(spellings_path)
+    assert engine.predict_matchup('USAFA', 'arkansas', '2003') == ('prediction', 'USAFA')
+    assert engine.predict_matchup('  Arkansas  Razorbacks.', 'Air Force', '2003') == ('prediction', 'Air Force')
+    assert engine.complete('ar') == ['Arkansas']
+    assert engine.complete('a', limit=1) == ['Air Force']
+
+
+def test_team_names_unhappy(engine):
+    engine.spellings_path = 'missing.csv'
+    assert engine.predict_matchup('Air Frce', 'Arkansas', '2003') == ('no_team', ['Air Frce'])
+    assert engine.suggest(['Air Frce', 'Arkansa', 'zzz']) == {'Air Frce': ['Air Force'], 'Arkansa': ['Arkansas'],
+                                                             'zzz': []}
+    assert engine.complete('') == [] and engine.complete('duke') == []
+    assert engine.complete('a', limit=-1) == []
@@ -0,0 +1,53 @@
+import json
+
+import pandas as pd
+import pytest
+
+import src.profiling as profiling
+
+
+@profiling.timed(rows='data')
+def double(data):
+    return data * 2
+
+
+@profiling.timed()
+def first_rows(data, n):
+    return data.head(n)
+
+
+@pytest.fixture
+def profiler():
+    profiler = profiling.enable(trace_memory=True)
+    yield profiler
+    profiling.disable()
+
+
+def test_profiler_happy(profiler, tmp_path):
+    data = pd.DataFrame({'a': range(10)})
+    with profiling.stage('run') as record:
+        double(data)
+        first_rows(data, 3)
+        record['rows'] = 10
+    report = profiler.write_report(str(tmp_path / 'report.json'), ['model', 'all'])
+    assert json.load(open(str(tmp_path / 'report.json')))['command'] == ['model', 'all']
+    assert [(r['name'], r['parent'], r['rows']) for r in report['records']] == [
+        ('run', None, 10), ('test_profiling.double', 'run', 10), ('test_profiling.first_rows', 'run', 3)]
+    assert all(r['wall_seconds'] >= 0 and r['peak_mb'] is not None for r in report['records'])
+    assert report['stages']['run']['calls'] == 1
+
+    slower = json.loads(json.dumps(report))
+    slower['stages']['run']['wall_seconds'] = 2 * report['stages']['run']['wall_seconds'] + 1
+    comparison = profiling.compare_reports(report, slower)
+    assert [row['stage'] for row in comparison if row['regression']] == ['run']
+
+
+def test_profiler_unhappy(profiler):
+    with pytest.raises(ZeroDivisionError):
+        with profiling.stage('failing'):
+            1 / 0
+    assert profiler.records[0]['error'] == 'ZeroDivisionError'
+    profiling.disable()
+    # without a profiler the timed functions run as they are
+    assert double(3) == 6
+    assert profiling.get_profiler() is None
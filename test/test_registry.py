@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import svm
+
+from src.pipeline import train_and_publish
+from src.registry import ModelRegistry, ACTIVE
+
+
+def fit(sign):
+    return svm.SVC(kernel='linear').fit(np.array([[sign * 1.0], [-sign * 1.0]]), [1, 0])
+
+
+def test_registry_happy(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    assert registry.versions() == [] and registry.active() is None
+    first = registry.publish(fit(1), features=['Score'])
+    second = registry.publish(fit(-1), features=['Score'])
+    assert registry.versions() == sorted([first, second])
+    registry.activate(first)
+    stamp = registry.pointer_stamp(ACTIVE)
+    registry.activate(second)
+    assert registry.active() == second
+    assert registry.pointer_stamp(ACTIVE) != stamp
+    registry.set_shadow(first)
+    assert registry.shadow() == first
+    registry.set_shadow(None)
+    assert registry.shadow() is None
+    # publishing leaves no temporary directory behind
+    assert sorted(os.listdir(registry.root)) == sorted([first, second, ACTIVE])
+
+    # the train step of the pipeline publishes what it trains
+    X = pd.DataFrame({'Score': [1.0, -1.0, 2.0, -2.0]})
+    train_and_publish([X, pd.Series([1, 0, 1, 0])], {'estimator': 'logistic'}, registry)
+    assert len(registry.versions()) == 3
+
+
+def test_registry_unhappy(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    with pytest.raises(ValueError):
+        registry.activate('20210315-101500-3f2a9c1d0b7e')
+    registry.publish(fit(1))
+    with pytest.raises(ValueError):
+        registry.set_shadow('latest')
+    assert registry.active() is None and registry.pointer_stamp(ACTIVE) is None
@@ -0,0 +1,51 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import svm
+
+import src.scoring as scoring
+from src.data_cleaning import STAT_COLUMNS
+from src.scoring import score_matchups
+
+
+@pytest.fixture
+def paths(tmp_path):
+    regular = pd.DataFrame([[2003, 1102] + [70.0] * 17,
+                            [2003, 1117] + [60.0] * 17,
+                            [2003, 1391] + [50.0] * 17],
+                           columns=['Season', 'Team'] + STAT_COLUMNS)
+    regular.to_csv(str(tmp_path / 'regular_avg.csv'))
+    pd.DataFrame({'Season': [2003, 2003, 2003], 'Seed': ['W01', 'W16a', 'X16b'],
+                  'TeamID': [1102, 1117, 1391]}).to_csv(str(tmp_path / 'seeds.csv'), index=False)
+    X = pd.DataFrame(np.vstack([np.full(18, 5.0), np.full(18, -5.0)]), columns=STAT_COLUMNS + ['Seed'])
+    with open(str(tmp_path / 'clf.sav'), 'wb') as f:
+        pickle.dump(svm.SVC(kernel='linear').fit(X, [1, 0]), f)
+    return {'model_path': str(tmp_path / 'clf.sav'), 'regular_avg_path': str(tmp_path / 'regular_avg.csv'),
+            'seeds_path': str(tmp_path / 'seeds.csv')}
+
+
+def test_score_matchups_happy(tmp_path, paths, monkeypatch):
+    ids = ['2003_1102_1117', '2003_1117_1391', '2003_1391_1102', '2004_1102_1117', '2003_1102_1391']
+    pd.DataFrame({'ID': ids, 'Pred': 0.5}).to_csv(str(tmp_path / 'input.csv'), index=False)
+    for n_jobs in [1, 2]:
+        output_path = str(tmp_path / ('output%d.csv' % n_jobs))
+        assert score_matchups(str(tmp_path / 'input.csv'), output_path, chunksize=2, n_jobs=n_jobs, **paths) == 5
+        output = pd.read_csv(output_path)
+        assert output['ID'].tolist() == ids
+        assert (output['Pred'].values[[0, 1, 4]] > 0.5).all()
+        assert output['Pred'].values[2] < 0.5
+        assert output['Pred'].values[3] == 0.5
+
+    # a file of one chunk is predicted in this process, without a process pool
+    monkeypatch.setattr(scoring, 'ProcessPoolExecutor', None)
+    output_path = str(tmp_path / 'output.csv')
+    assert score_matchups(str(tmp_path / 'input.csv'), output_path, chunksize=10, n_jobs=2, **paths) == 5
+    assert pd.read_csv(output_path)['ID'].tolist() == ids
+
+
+def test_score_matchups_unhappy(tmp_path, paths):
+    pd.DataFrame({'ID': ['2003-1102-1117']}).to_csv(str(tmp_path / 'input.csv'), index=False)
+    with pytest.raises(ValueError):
+        score_matchups(str(tmp_path / 'input.csv'), str(tmp_path / 'output.csv'), **paths)
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.tuning import tune_model
+
+CANDIDATES = {'logistic': {'C': [0.01, 0.1, 1, 10]}, 'hist_gb': {'max_iter': [10]}}
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame(rng.normal(size=(300, 2)), columns=['Score', 'Seed'])
+    data['Win'] = (data['Score'] - data['Seed'] > 0).astype(int)
+    data['Season'] = np.repeat(np.arange(2003, 2009), 50)
+    return data
+
+
+def test_tune_model_happy(tmp_path, data):
+    grid = tune_model(data, ['Score', 'Seed'], 'Win', CANDIDATES, 'grid', n_splits=3, n_jobs=1,
+                      cache_dir=str(tmp_path / 'cache'))
+    assert len(grid) == 5
+    assert (grid['n_folds'] == 3).all()
+    assert grid['rank'].tolist() == [1, 2, 3, 4, 5]
+    assert grid['mean_accuracy'].is_monotonic_decreasing
+
+    halving = tune_model(data, ['Score', 'Seed'], 'Win', CANDIDATES, 'halving', n_splits=3, factor=2, n_jobs=2,
+                         cache_dir=str(tmp_path / 'cache'))
+    assert sorted(halving['n_folds'].tolist()) == [1, 1, 2, 3, 3]
+    assert halving['mean_accuracy'].iloc[0] == grid.set_index('params').loc[halving['params'].iloc[0], 'mean_accuracy']
+
+
+def test_tune_model_unhappy(data):
+    with pytest.raises(KeyError):
+        tune_model(data.drop(columns='Season'), ['Score', 'Seed'], 'Win', CANDIDATES, cache_dir=None)
+    with pytest.raises(ValueError):
+        tune_model(data, ['Score', 'Seed'], 'Win', CANDIDATES, 'random', cache_dir=None)